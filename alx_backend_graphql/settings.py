@@ -85,4 +85,70 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ✅ Task 0: GraphQL settings
 GRAPHENE = {
     'SCHEMA': 'alx_backend_graphql_crm.schema.schema',
-}
\ No newline at end of file
+}
+
+# CRM: filtered totalCount is exact up to this many rows and estimated above it
+CRM_COUNT_THRESHOLD = 10000
+
+# CRM: queries over this static cost or depth are rejected before execution
+CRM_QUERY_MAX_COST = 50000
+CRM_QUERY_MAX_DEPTH = 8
+CRM_QUERY_LIST_SIZE = 10
+
+# CRM: parsed/validated GraphQL documents kept in memory, and the cache alias
+# holding automatic persisted queries
+CRM_DOCUMENT_CACHE_SIZE = 256
+CRM_PERSISTED_QUERY_CACHE = 'default'
+
+# CRM: opt-in cache of query responses, invalidated by model signals. Leave
+# the backend as None for a per-process LRU of CRM_RESPONSE_CACHE_SIZE
+# entries, or name a shared Django cache alias when running several workers.
+CRM_RESPONSE_CACHE_ENABLED = False
+CRM_RESPONSE_CACHE_BACKEND = None
+CRM_RESPONSE_CACHE_SIZE = 1024
+CRM_RESPONSE_CACHE_TIMEOUT = 300
+
+# Rows inserted per statement by the bulkCreateCustomers mutation.
+CRM_BULK_CREATE_BATCH_SIZE = 1000
+
+# CRM: country code given to phone numbers written without a leading "+"
+# when they are normalized for the phone filters.
+CRM_PHONE_COUNTRY_CODE = '1'
+
+# archive_orders moves orders older than this many days to the archive tables;
+# allOrders only reads them when its orderDate range reaches that far back.
+CRM_ORDER_ARCHIVE_AGE_DAYS = 365
+
+# updateLowStockProducts restocks products below the threshold by the increment.
+CRM_LOW_STOCK_THRESHOLD = 10
+CRM_RESTOCK_INCREMENT = 10
+
+# Rows fetched per database round trip by the /export streaming endpoint.
+CRM_EXPORT_CHUNK_SIZE = 2000
+# Besides staff users, /export accepts "Authorization: Bearer <CRM_EXPORT_TOKEN>".
+CRM_EXPORT_TOKEN = None
+
+# CRM: per-operation resolver and SQL tracing, logged to crm.instrumentation.
+# With _EXTENSIONS the trace is also returned in the response extensions.
+CRM_INSTRUMENTATION_ENABLED = False
+CRM_INSTRUMENTATION_EXTENSIONS = False
+CRM_INSTRUMENTATION_DUPLICATE_THRESHOLD = 2
+
+# CRM: /metrics counters. Each process flushes its values to a file in
+# CRM_METRICS_DIR (default: <tmp>/crm_metrics) and a scrape adds them up.
+CRM_METRICS_ENABLED = False
+CRM_METRICS_DIR = None
+CRM_METRICS_FLUSH_INTERVAL = 1.0
+# Operation names reported as the ``operation`` label; others count as "other".
+CRM_METRICS_OPERATIONS = ()
+
+# CRM: statements slower than the threshold are logged with their EXPLAIN plan
+# and GraphQL origin to the rotating JSON-lines file CRM_SLOW_QUERY_LOG, which
+# must be set to enable it; see `manage.py summarize_slow_queries`. Statement
+# parameters may hold personal data and are only logged with _CAPTURE_PARAMS.
+CRM_SLOW_QUERY_ENABLED = False
+CRM_SLOW_QUERY_THRESHOLD_MS = 200
+CRM_SLOW_QUERY_LOG = None
+CRM_SLOW_QUERY_MAX_BYTES = 10 * 1024 * 1024
+CRM_SLOW_QUERY_BACKUPS = 3
+CRM_SLOW_QUERY_CAPTURE_PARAMS = False
@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
+from crm.views import CRMExportView, CRMGraphQLView, metrics_view
 from django.views.decorators.csrf import csrf_exempt
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),  # ✅ Task 0 requirement
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),  # ✅ Task 0 requirement
+    path("export/<str:resource>", CRMExportView.as_view()),
+    path("metrics", metrics_view),
 ]
\ No newline at end of file
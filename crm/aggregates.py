@@ -0,0 +1,104 @@
+from decimal import Decimal
+
+from django.db.models import Count, IntegerField, Sum, Value
+from django.db.models.functions import TruncDate
+
+CENTS = Decimal('0.01')
+
+
+def to_money(value):
+    return None if value is None else Decimal(value).quantize(CENTS)
+
+
+class OrderStats:
+    """Database-side statistics over filtered sets of orders.
+
+    ``querysets`` are the matching orders of each order table (see
+    crm.archive). Each group of fields costs one query over both tables:
+    the totals come from one aggregate row per table and the daily
+    breakdown from one grouped query per table, joined with ``UNION ALL``,
+    and neither runs unless it is asked for.
+    """
+
+    def __init__(self, *querysets):
+        # Filters that join through products can repeat an order; collapse
+        # them into a subquery so every order is summed once.
+        self.querysets = [
+            queryset.model._default_manager.filter(pk__in=queryset.values('pk'))
+            if queryset.query.has_filters() else queryset
+            for queryset in querysets
+        ]
+        self._totals = None
+
+    def union(self, grouped):
+        """Rows of ``grouped(queryset)`` for every order table, read with one ``UNION ALL``."""
+        parts = [grouped(queryset) for queryset in self.querysets]
+        return parts[0].union(*parts[1:], all=True)
+
+    @property
+    def totals(self):
+        if self._totals is None:
+            # Grouping on a constant gives one row of totals per table.
+            rows = self.union(lambda queryset: queryset.annotate(
+                everything=Value(1, output_field=IntegerField())
+            ).values('everything').annotate(
+                count=Count('pk'), total_revenue=Sum('total_amount')
+            ).values_list('count', 'total_revenue'))
+            count, revenue = 0, Decimal('0')
+            for table_count, table_revenue in rows:
+                count += table_count
+                revenue += Decimal(str(table_revenue or 0))
+            self._totals = {
+                'count': count,
+                'total_revenue': revenue,
+                'avg_order_value': revenue / count if count else None,
+            }
+        return self._totals
+
+    @property
+    def count(self):
+        return self.totals['count']
+
+    @property
+    def total_revenue(self):
+        return to_money(self.totals['total_revenue'] or 0)
+
+    @property
+    def avg_order_value(self):
+        return to_money(self.totals['avg_order_value'])
+
+    def revenue_by_day(self):
+        rows = self.union(lambda queryset: queryset.annotate(day=TruncDate('order_date')).values('day').annotate(
+            order_count=Count('pk'), revenue=Sum('total_amount')
+        ).values_list('day', 'order_count', 'revenue'))
+        # A day can have orders in both tables.
+        days = {}
+        for day, order_count, revenue in rows:
+            total_count, total_revenue = days.get(day, (0, Decimal('0')))
+            days[day] = (total_count + order_count, total_revenue + Decimal(str(revenue or 0)))
+        return [
+            {'day': day, 'order_count': order_count, 'revenue': to_money(revenue)}
+            for day, (order_count, revenue) in sorted(days.items())
+        ]
+
+
+class RollupOrderStats(OrderStats):
+    """The same statistics read from the daily rollup, one row per day."""
+
+    def __init__(self, rollups):
+        self.queryset = rollups.filter(order_count__gt=0)
+        self._totals = None
+
+    @property
+    def totals(self):
+        if self._totals is None:
+            totals = self.queryset.aggregate(count=Sum('order_count'), total_revenue=Sum('revenue'))
+            count = totals['count'] or 0
+            totals['count'] = count
+            totals['avg_order_value'] = totals['total_revenue'] / count if count else None
+            self._totals = totals
+        return self._totals
+
+    def revenue_by_day(self):
+        rows = self.queryset.order_by('day').values('day', 'order_count', 'revenue')
+        return [dict(row, revenue=to_money(row['revenue'])) for row in rows]
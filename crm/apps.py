@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from . import search, slow_queries
+
+        connection_created.connect(slow_queries.install, dispatch_uid='crm_slow_queries')
+        post_migrate.connect(search.repair_sqlite_triggers, sender=self, dispatch_uid='crm_search_triggers')
+        for connection in connections.all(initialized_only=True):
+            slow_queries.install(connection=connection)
@@ -0,0 +1,156 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Subquery
+from django.utils import timezone
+
+from .counting import adjust_table_count
+from .fields import CRMFilterConnectionField, KeysetFilterConnectionField
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .rollups import day_bounds
+from .search import is_ranked
+from .signals import invalidate_responses
+
+# Orders older than this many days are moved to the archive tables.
+DEFAULT_ARCHIVE_AGE_DAYS = 365
+
+
+def archive_age():
+    return getattr(settings, 'CRM_ORDER_ARCHIVE_AGE_DAYS', DEFAULT_ARCHIVE_AGE_DAYS)
+
+
+def archive_cutoff(days=None):
+    return timezone.now() - datetime.timedelta(days=archive_age() if days is None else days)
+
+
+def archive_orders(cutoff, batch_size):
+    """Move up to ``batch_size`` of the oldest orders placed before ``cutoff`` to the archive.
+
+    Each order and its items are copied and deleted in one transaction.
+    The deletes skip the order signals: the daily rollups and customer
+    activity columns count archived orders too. Returns how many orders
+    were moved.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.filter(order_date__lt=cutoff)
+            .order_by('order_date', 'id')
+            .select_for_update()
+            .values('id', 'customer_id', 'order_date', 'total_amount')[:batch_size]
+        )
+        if not orders:
+            return 0
+        ids = [order['id'] for order in orders]
+        items = OrderItem.objects.filter(order_id__in=ids)
+        ArchivedOrder.objects.bulk_create(ArchivedOrder(**order) for order in orders)
+        ArchivedOrderItem.objects.bulk_create(
+            ArchivedOrderItem(**item) for item in items.values('order_id', 'product_id', 'quantity')
+        )
+        items._raw_delete(items.db)
+        moved = Order.objects.filter(pk__in=ids)
+        moved._raw_delete(moved.db)
+        adjust_table_count(Order, -len(ids))
+        adjust_table_count(ArchivedOrder, len(ids))
+        invalidate_responses(Order)
+    return len(ids)
+
+
+# Annotation carrying the newest archived order date along with hot rows.
+NEWEST = 'archive_newest'
+
+
+def newest_archived():
+    """The latest ``order_date`` in the archive, or None while it is empty."""
+    return ArchivedOrder.objects.aggregate(newest=Max('order_date'))['newest']
+
+
+class OrderHistory:
+    """Hot orders and the archived orders matching the same filters.
+
+    ``KeysetFilterConnectionField`` pages each queryset on its own and
+    merges the pages; archived rows are handed out as ``Order`` instances.
+    """
+
+    def __init__(self, hot, archived, after=None):
+        self.hot = hot
+        self.archived = archived
+        self.after = after
+
+    @property
+    def querysets(self):
+        return (self.hot, self.archived)
+
+    def node(self, row):
+        return row.as_order() if isinstance(row, ArchivedOrder) else row
+
+    def reaches_archive(self, rows):
+        """Whether archived orders fall in the ``orderDateAfter`` range of the query.
+
+        The newest archived date is read off a page of hot ``rows`` when
+        there is one, so recent-order queries make no trip to the archive.
+        """
+        newest = getattr(rows[0], NEWEST) if rows else newest_archived()
+        if newest is None:
+            return False
+        if self.after is None:
+            return True
+        lower, _ = day_bounds(self.after, self.after)
+        return lower <= newest
+
+
+class OrderHistoryConnectionField(KeysetFilterConnectionField):
+    """Order connection reading the archive only when the date range reaches into it.
+
+    A page is read from the hot table first. Only when the archive holds
+    orders in range is the page read again as a merge of both tables.
+    """
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        hot = super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+        if isinstance(iterable, list) or is_ranked(hot):
+            return hot
+        archived = super().resolve_queryset(
+            connection, ArchivedOrder.objects.all(), info, args, filtering_args, filterset_class
+        )
+        newest = ArchivedOrder.objects.order_by('-order_date').values('order_date')[:1]
+        hot = hot.annotate(**{NEWEST: Subquery(newest)})
+        return OrderHistory(hot, archived, args.get('order_date_after'))
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if not isinstance(iterable, OrderHistory):
+            return super().resolve_connection(connection, args, iterable, max_limit)
+        resolved = super().resolve_connection(connection, args, iterable.hot, max_limit)
+        if not iterable.reaches_archive([edge.node for edge in resolved.edges]):
+            return resolved
+        return super().resolve_connection(connection, args, iterable, max_limit)
+
+
+class RelatedOrdersConnectionField(CRMFilterConnectionField):
+    """A customer's or product's orders, archived ones included.
+
+    Unfiltered, resolvers return the loaders' lists, which read both
+    tables at once. Filtered, they return an ``OrderHistory`` of the two
+    related querysets; both are filtered and read into one list.
+    """
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        if not isinstance(iterable, OrderHistory):
+            return super().resolve_queryset(
+                connection, iterable, info, args, filtering_args, filterset_class
+            )
+        resolve = super().resolve_queryset
+        hot, archived = (
+            resolve(connection, queryset, info, args, filtering_args, filterset_class)
+            for queryset in iterable.querysets
+        )
+        return sorted([*hot, *(order.as_order() for order in archived)], key=lambda order: order.pk)
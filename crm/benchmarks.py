@@ -0,0 +1,252 @@
+import datetime
+import json
+import math
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+
+from .metrics import QueryCounter
+from .models import Customer, Product
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+CUSTOMER_FIELDS = 'edges { node { id name email phone createdAt } }'
+PRODUCT_FIELDS = 'edges { node { id name price stock } }'
+ORDER_FIELDS = 'edges { node { id orderDate totalAmount } }'
+
+
+class Operation:
+    """One GraphQL operation in the benchmark catalog.
+
+    ``variables`` may be a callable taking the run number, for mutations
+    that need fresh input each time. Mutations run in a transaction that
+    is rolled back, so every run sees the same dataset.
+    """
+
+    def __init__(self, name, query, variables=None, mutation=False):
+        self.name = name
+        self.query = query
+        self.variables = variables
+        self.mutation = mutation
+
+    def payload(self, run, context):
+        variables = self.variables
+        if callable(variables):
+            variables = variables(run, context)
+        return {'query': self.query, 'variables': variables or {}}
+
+
+def filter_page(connection_name, fields, **arguments):
+    args = ', '.join(f'{name}: {json.dumps(value)}' for name, value in arguments.items())
+    return f'{{ {connection_name}(first: 50, {args}) {{ totalCount {fields} }} }}'
+
+
+def date_range_page(connection_name, fields, filter_name):
+    """A page filtered by the ``<filter_name>After``/``Before`` bounds of a date range filter.
+
+    The bounds are variables, filled from the runner's context by ``date_range``.
+    """
+    return (
+        f'query($after: Date, $before: Date) {{ {connection_name}(first: 50, '
+        f'{filter_name}After: $after, {filter_name}Before: $before) {{ totalCount {fields} }} }}'
+    )
+
+
+def date_range(run, context):
+    return {'after': context['after'], 'before': context['before']}
+
+
+CATALOG = [
+    # List pages
+    Operation('customers_page', f'{{ allCustomers(first: 50) {{ totalCount {CUSTOMER_FIELDS} }} }}'),
+    Operation('products_page', f'{{ allProducts(first: 50) {{ totalCount {PRODUCT_FIELDS} }} }}'),
+    Operation('orders_page', f'{{ allOrders(first: 50) {{ totalCount {ORDER_FIELDS} }} }}'),
+    Operation('orders_page_desc', f'{{ allOrders(first: 50, sort: DESC) {{ {ORDER_FIELDS} }} }}'),
+    Operation(
+        'customers_by_lifetime_value',
+        f'{{ allCustomers(first: 50, sortBy: LIFETIME_VALUE, sort: DESC) {{ {CUSTOMER_FIELDS} }} }}',
+    ),
+    # Nested relations
+    Operation('orders_nested', """{ allOrders(first: 50) { edges { node {
+        totalAmount customer { name email } products { edges { node { name price } } }
+    } } } }"""),
+    Operation('customers_with_orders', """{ allCustomers(first: 20) { edges { node {
+        name orders(first: 10) { totalCount edges { node { orderDate totalAmount } } }
+    } } } }"""),
+    Operation('products_with_orders', """{ allProducts(first: 20) { edges { node {
+        name orders(first: 10) { edges { node { totalAmount customer { name } } } }
+    } } } }"""),
+    # Filters of crm/filters.py reachable through GraphQL
+    Operation('filter_customer_name', filter_page('allCustomers', CUSTOMER_FIELDS, name='ada')),
+    Operation('filter_customer_email', filter_page('allCustomers', CUSTOMER_FIELDS, email='customer1')),
+    Operation(
+        'filter_customer_phone',
+        f'query($phone: String) {{ allCustomers(first: 50, phone: $phone) {{ totalCount {CUSTOMER_FIELDS} }} }}',
+        lambda run, context: {'phone': context['phone']},
+    ),
+    Operation('filter_customer_phone_pattern', filter_page('allCustomers', CUSTOMER_FIELDS, phonePattern='+15')),
+    Operation(
+        'filter_customer_created_at', date_range_page('allCustomers', CUSTOMER_FIELDS, 'createdAt'), date_range
+    ),
+    Operation(
+        'filter_customer_order_count',
+        filter_page('allCustomers', CUSTOMER_FIELDS, orderCountMin='2', orderCountMax='10'),
+    ),
+    Operation(
+        'filter_customer_last_order_at', date_range_page('allCustomers', CUSTOMER_FIELDS, 'lastOrderAt'), date_range
+    ),
+    Operation(
+        'filter_customer_lifetime_value',
+        filter_page('allCustomers', CUSTOMER_FIELDS, lifetimeValueMin='100', lifetimeValueMax='1000'),
+    ),
+    Operation('filter_product_name', filter_page('allProducts', PRODUCT_FIELDS, name='laptop')),
+    Operation('filter_product_price', filter_page('allProducts', PRODUCT_FIELDS, priceMin='20', priceMax='100')),
+    Operation('filter_product_stock', filter_page('allProducts', PRODUCT_FIELDS, stockMin='10', stockMax='50')),
+    Operation('filter_product_low_stock', filter_page('allProducts', PRODUCT_FIELDS, lowStock=True)),
+    Operation(
+        'filter_order_total_amount',
+        filter_page('allOrders', ORDER_FIELDS, totalAmountMin='50', totalAmountMax='200'),
+    ),
+    Operation('filter_order_date', date_range_page('allOrders', ORDER_FIELDS, 'orderDate'), date_range),
+    Operation('filter_order_customer_name', filter_page('allOrders', ORDER_FIELDS, customerName='smith')),
+    Operation('filter_order_product_name', filter_page('allOrders', ORDER_FIELDS, productName='cable')),
+    Operation('filter_order_product_id', filter_page('allOrders', ORDER_FIELDS, productId=1)),
+    Operation('search_customers', filter_page('allCustomers', CUSTOMER_FIELDS, search='smi')),
+    Operation('search_orders', filter_page('allOrders', ORDER_FIELDS, search='cable')),
+    # Aggregates
+    Operation('order_stats', '{ orderStats { count totalRevenue avgOrderValue } }'),
+    Operation('order_stats_filtered', '{ orderStats(customerName: "smith") { count totalRevenue } }'),
+    # Mutations
+    Operation(
+        'create_customer',
+        'mutation($email: String!) { createCustomer(name: "Bench", email: $email) { customer { id } } }',
+        lambda run, context: {'email': f'bench{run}@example.com'},
+        mutation=True,
+    ),
+    Operation(
+        'bulk_create_customers',
+        """mutation($customers: [CustomerInput!]!) {
+            bulkCreateCustomers(customersData: $customers) { errors }
+        }""",
+        lambda run, context: {'customers': [
+            {'name': 'Bench', 'email': f'bench{run}-{i}@example.com'} for i in range(100)
+        ]},
+        mutation=True,
+    ),
+    Operation(
+        'create_order',
+        """mutation($customerId: ID!, $items: [OrderItemInput!]) {
+            createOrder(customerId: $customerId, items: $items) { order { id totalAmount } }
+        }""",
+        lambda run, context: {'customerId': context['customer_id'], 'items': [
+            {'productId': product_id, 'quantity': 1} for product_id in context['product_ids']
+        ]},
+        mutation=True,
+    ),
+    Operation(
+        'update_low_stock_products',
+        'mutation { updateLowStockProducts { updatedProducts { name stock } message } }',
+        mutation=True,
+    ),
+]
+
+
+# Growth below these amounts is treated as noise whatever the tolerance.
+ABSOLUTE_SLACK = {'p95_ms': 2.0, 'peak_kb': 64.0}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Runner:
+    """Run the catalog against whatever data is in the database."""
+
+    def __init__(self, operations=None, repeat=20):
+        self.operations = operations or CATALOG
+        self.repeat = repeat
+        self.client = Client()
+        today = timezone.localdate()
+        self.context = {
+            'customer_id': Customer.objects.order_by('pk').values_list('pk', flat=True).first(),
+            'product_ids': list(Product.objects.order_by('-stock').values_list('pk', flat=True)[:3]),
+            'phone': Customer.objects.exclude(phone=None).values_list('phone', flat=True).first() or '+10000000000',
+            # The half year ending six months ago, inside generated fixture data.
+            'after': (today - datetime.timedelta(days=365)).isoformat(),
+            'before': (today - datetime.timedelta(days=183)).isoformat(),
+        }
+
+    def execute(self, operation, run):
+        response = self.client.post(
+            '/graphql', operation.payload(run, self.context), content_type='application/json'
+        )
+        result = response.json()
+        if result.get('errors'):
+            raise RuntimeError(f"{operation.name} failed: {result['errors'][0]['message']}")
+
+    def run_once(self, operation, run):
+        if not operation.mutation:
+            return self.execute(operation, run)
+        with transaction.atomic():
+            self.execute(operation, run)
+            transaction.set_rollback(True)
+
+    def measure(self, operation):
+        self.run_once(operation, 0)  # warm caches and imports
+        timings = []
+        for run in range(1, self.repeat + 1):
+            started = time.perf_counter()
+            self.run_once(operation, run)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            self.run_once(operation, self.repeat + 1)
+        tracemalloc.start()
+        try:
+            self.run_once(operation, self.repeat + 2)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'queries': queries.count,
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def run(self):
+        return {operation.name: self.measure(operation) for operation in self.operations}
+
+
+def compare(results, baseline, tolerance):
+    """List the measurements in ``results`` that regressed past ``baseline``.
+
+    Query counts must not grow at all; latency and memory may grow by
+    ``tolerance`` (a fraction), and at least by ``ABSOLUTE_SLACK``, before
+    they count as a regression.
+    """
+    regressions = []
+    for size, operations in results.items():
+        for name, measured in operations.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+            if measured['queries'] > expected['queries']:
+                regressions.append(
+                    f"{size}/{name}: {measured['queries']} queries, baseline {expected['queries']}"
+                )
+            for metric in ('p95_ms', 'peak_kb'):
+                limit = max(expected[metric] * (1 + tolerance), expected[metric] + ABSOLUTE_SLACK[metric])
+                if measured[metric] > limit:
+                    regressions.append(
+                        f'{size}/{name}: {metric} {measured[metric]}, baseline {expected[metric]}'
+                    )
+    return regressions
@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+
+from django.utils import timezone
+
+from . import rollups
+from .models import Customer, Order, OrderItem, Product
+from .signals import invalidate_responses, rows_bulk_created
+
+
+@contextmanager
+def keep_auto_now_add(model, field_name):
+    """Let ``bulk_create`` write the given value of an ``auto_now_add`` field.
+
+    Only meant for single-threaded loaders such as management commands:
+    the field definition is shared by the whole process.
+    """
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def bulk_create_orders(orders, batch_size=1000, refresh_customers=True):
+    """Insert ``(order, items)`` pairs, where items are ``(product_id, quantity)``.
+
+    Orders keep the ``order_date`` they were given (defaulting to now) and
+    their items go in with one more bulk insert. Signals are not sent:
+    customer activity is recomputed here, but stock is left alone and the
+    daily rollups must be rebuilt by the caller (``crm.rollups.rebuild``).
+    Loaders inserting many batches can pass ``refresh_customers=False`` and
+    call ``crm.rollups.refresh_customers`` once at the end instead.
+    """
+    now = timezone.now()
+    for order, _ in orders:
+        if order.order_date is None:
+            order.order_date = now
+    with keep_auto_now_add(Order, 'order_date'):
+        created = Order.objects.bulk_create([order for order, _ in orders], batch_size=batch_size)
+
+    OrderItem.objects.bulk_create(
+        (
+            OrderItem(order=order, product_id=product_id, quantity=quantity)
+            for order, (_, items) in zip(created, orders)
+            for product_id, quantity in items
+        ),
+        batch_size=batch_size,
+    )
+    if created:
+        if refresh_customers:
+            rollups.refresh_customers(order.customer_id for order in created)
+        rows_bulk_created(Order, len(created))
+        invalidate_responses(Customer, Product)
+    return created
@@ -1,6 +1,10 @@
 from __future__ import absolute_import, unicode_literals
 import os
+import time
 from celery import Celery
+from celery.signals import task_failure, task_postrun, task_prerun
+
+from crm import metrics
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
@@ -20,3 +24,28 @@ app.autodiscover_tasks()
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
+
+
+# Task metrics for the /metrics endpoint (see crm.metrics).
+_task_started = {}
+
+
+@task_prerun.connect(dispatch_uid='crm.metrics.task_prerun')
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect(dispatch_uid='crm.metrics.task_postrun')
+def record_task_run(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    metrics.inc('crm_celery_tasks_total', task=task.name, state=state or 'UNKNOWN')
+    if started is not None:
+        metrics.observe('crm_celery_task_duration_seconds', time.perf_counter() - started, task=task.name)
+    # Prefork children leave through os._exit, skipping atexit; this also
+    # writes the failure counted by record_task_failure, which runs first.
+    metrics.flush()
+
+
+@task_failure.connect(dispatch_uid='crm.metrics.task_failure')
+def record_task_failure(sender=None, **kwargs):
+    metrics.inc('crm_celery_task_failures_total', task=sender.name)
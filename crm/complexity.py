@@ -0,0 +1,137 @@
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    GraphQLError,
+    GraphQLInt,
+    GraphQLList,
+    ValidationRule,
+    get_named_type,
+    get_nullable_type,
+    value_from_ast,
+)
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+DEFAULT_MAX_COST = 50000
+DEFAULT_MAX_DEPTH = 8
+DEFAULT_LIST_SIZE = 10
+
+# Fields that only shape a connection; the connection field itself is charged
+# and they do not add to the depth.
+CONNECTION_FIELDS = {'edges', 'node', 'pageInfo'}
+
+
+def max_cost():
+    return getattr(settings, 'CRM_QUERY_MAX_COST', DEFAULT_MAX_COST)
+
+
+def max_depth():
+    return getattr(settings, 'CRM_QUERY_MAX_DEPTH', DEFAULT_MAX_DEPTH)
+
+
+def list_size():
+    return getattr(settings, 'CRM_QUERY_LIST_SIZE', DEFAULT_LIST_SIZE)
+
+
+class QueryCost:
+    """Static cost of an operation, computed from its document alone.
+
+    Every object-returning field costs the number of times it can be
+    resolved: the product of the page sizes (``first``/``last``, or the
+    connection limit when neither is given) of the connections above it,
+    with plain lists counted as ``CRM_QUERY_LIST_SIZE`` items. Scalars and
+    introspection fields are free.
+    """
+
+    def __init__(self, context, variables):
+        self.context = context
+        self.variables = variables or {}
+        self.cost = 0
+        self.depth = 0
+
+    def page_size(self, node):
+        arguments = {argument.name.value: argument.value for argument in node.arguments}
+        for name in ('first', 'last'):
+            if name in arguments:
+                value = value_from_ast(arguments[name], GraphQLInt, self.variables)
+                if isinstance(value, int):
+                    return value
+        return graphene_settings.RELAY_CONNECTION_MAX_LIMIT or list_size()
+
+    def visit(self, parent_type, selection_set, multiplier, depth, seen_fragments=()):
+        for selection in selection_set.selections:
+            if isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.context.schema.get_type(selection.type_condition.name.value)
+                self.visit(fragment_type, selection.selection_set, multiplier, depth, seen_fragments)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.context.get_fragment(name)
+                if fragment is None or name in seen_fragments:
+                    continue
+                fragment_type = self.context.schema.get_type(fragment.type_condition.name.value)
+                self.visit(fragment_type, fragment.selection_set, multiplier, depth,
+                           (*seen_fragments, name))
+            elif isinstance(selection, FieldNode):
+                self.visit_field(parent_type, selection, multiplier, depth)
+
+    def visit_field(self, parent_type, node, multiplier, depth):
+        name = node.name.value
+        fields = getattr(parent_type, 'fields', None)
+        if name.startswith('__') or not fields or name not in fields:
+            return
+        field_def = fields[name]
+        if name not in CONNECTION_FIELDS:
+            depth += 1
+        self.depth = max(self.depth, depth)
+        if node.selection_set is None:
+            return
+
+        if name in CONNECTION_FIELDS:
+            child_multiplier = multiplier
+        elif 'first' in field_def.args or 'last' in field_def.args:
+            child_multiplier = multiplier * self.page_size(node)
+            self.cost += child_multiplier
+        elif isinstance(get_nullable_type(field_def.type), GraphQLList):
+            child_multiplier = multiplier * list_size()
+            self.cost += child_multiplier
+        else:
+            child_multiplier = multiplier
+            self.cost += multiplier
+
+        self.visit(get_named_type(field_def.type), node.selection_set, child_multiplier, depth)
+
+
+def query_cost_rule(variables, report, operation):
+    """Build a validation rule that rejects ``operation`` when over the cost budget.
+
+    Only the operation being executed is charged; other operations in the
+    document are skipped. Its cost is written into ``report`` so the view
+    can return it in the response ``extensions``.
+    """
+
+    class QueryCostRule(ValidationRule):
+        def enter_operation_definition(self, node, *args):
+            if node is not operation:
+                return
+            root_type = self.context.schema.get_root_type(node.operation)
+            query_cost = QueryCost(self.context, variables)
+            if root_type is not None:
+                query_cost.visit(root_type, node.selection_set, 1, 0)
+
+            report['cost'] = {
+                'requestedQueryCost': query_cost.cost,
+                'maximumAvailable': max_cost(),
+                'depth': query_cost.depth,
+                'maximumDepth': max_depth(),
+            }
+            if query_cost.cost > max_cost():
+                self.report_error(GraphQLError(
+                    f"Query cost {query_cost.cost} exceeds the maximum of {max_cost()}.", node
+                ))
+            if query_cost.depth > max_depth():
+                self.report_error(GraphQLError(
+                    f"Query depth {query_cost.depth} exceeds the maximum of {max_depth()}.", node
+                ))
+
+    return QueryCostRule
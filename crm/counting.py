@@ -0,0 +1,94 @@
+import json
+from collections import namedtuple
+
+import graphene
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, QuerySet
+
+from .models import TableCount
+
+# Filtered counts stop at this many rows; anything above is estimated.
+DEFAULT_COUNT_THRESHOLD = 10000
+
+Count = namedtuple('Count', ['value', 'exact'])
+
+
+def count_threshold():
+    return getattr(settings, 'CRM_COUNT_THRESHOLD', DEFAULT_COUNT_THRESHOLD)
+
+
+def table_count(model):
+    """Return the maintained row count of ``model``, seeding it on first use."""
+    counter = TableCount.objects.filter(table=model._meta.label).first()
+    if counter is None:
+        counter, _ = TableCount.objects.get_or_create(
+            table=model._meta.label,
+            defaults={'rows': model._default_manager.count()},
+        )
+    return counter.rows
+
+
+def adjust_table_count(model, delta):
+    """Add ``delta`` to the counter of ``model``; bulk writers call this directly."""
+    TableCount.objects.filter(table=model._meta.label).update(rows=F('rows') + delta)
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for ``queryset``, where one exists."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_queryset(queryset):
+    """Count ``queryset`` as cheaply as its shape allows.
+
+    Unions (see ``crm.archive``) add up the counts of their parts, lists
+    are measured, unfiltered querysets read the maintained counter,
+    and filtered querysets are counted exactly up to the threshold. Past
+    it the planner's estimate (or the threshold itself) is returned and
+    flagged as inexact.
+    """
+    parts = getattr(queryset, 'querysets', None)
+    if parts is not None:
+        counts = [count_queryset(part) for part in parts]
+        return Count(sum(count.value for count in counts), all(count.exact for count in counts))
+    if not isinstance(queryset, QuerySet):
+        return Count(len(queryset), True)
+    if not queryset.query.has_filters() and not queryset.query.distinct:
+        return Count(table_count(queryset.model), True)
+
+    threshold = count_threshold()
+    capped = queryset[:threshold + 1].count()
+    if capped <= threshold:
+        return Count(capped, True)
+    estimate = estimate_count(queryset)
+    return Count(max(estimate or 0, threshold), False)
+
+
+class CountedConnection(graphene.relay.Connection):
+    """Connection exposing ``totalCount`` with a flag for estimated totals."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+    total_count_is_exact = graphene.Boolean()
+
+    def get_count(self):
+        if not hasattr(self, '_count'):
+            # Offset-paginated connections have already counted their rows.
+            length = getattr(self, 'length', None)
+            if length is not None:
+                self._count = Count(length, True)
+            else:
+                self._count = count_queryset(self.iterable)
+        return self._count
+
+    def resolve_total_count(self, info):
+        return self.get_count().value
+
+    def resolve_total_count_is_exact(self, info):
+        return self.get_count().exact
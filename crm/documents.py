@@ -0,0 +1,113 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError, parse, validate
+
+from . import metrics
+
+DEFAULT_DOCUMENT_CACHE_SIZE = 256
+PERSISTED_QUERY_TIMEOUT = None  # keep persisted queries until evicted
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """A small thread-safe least-recently-used mapping."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+document_cache = LRUCache(
+    getattr(settings, 'CRM_DOCUMENT_CACHE_SIZE', DEFAULT_DOCUMENT_CACHE_SIZE)
+)
+
+
+def parse_and_validate(schema, query, rules=None, max_errors=None):
+    """Return ``(document, validation_errors)`` for ``query``, cached by its hash.
+
+    Syntax errors are raised as ``GraphQLError`` and not cached.
+    """
+    key = (id(schema), tuple(rules or ()), query_hash(query))
+    cached = document_cache.get(key)
+    metrics.record_cache('document', cached is not None)
+    if cached is None:
+        document = parse(query)
+        cached = (document, validate(schema, document, rules, max_errors))
+        document_cache.set(key, cached)
+    return cached
+
+
+def persisted_query_error(message, code):
+    return GraphQLError(message, extensions={'code': code})
+
+
+def persisted_query_store():
+    return caches[getattr(settings, 'CRM_PERSISTED_QUERY_CACHE', 'default')]
+
+
+def get_persisted_query_extension(request, data):
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            return None
+    if not isinstance(extensions, dict):
+        return None
+    return extensions.get('persistedQuery')
+
+
+def resolve_persisted_query(request, data, query):
+    """Apply the automatic persisted query protocol to a request.
+
+    Clients send ``extensions.persistedQuery.sha256Hash``. With the hash
+    alone the stored query text is returned; with hash and text the text
+    is checked and stored for next time.
+    """
+    persisted = get_persisted_query_extension(request, data)
+    if not persisted:
+        return query
+    if persisted.get('version') != 1:
+        raise persisted_query_error('Unsupported persisted query version.', 'PERSISTED_QUERY_NOT_SUPPORTED')
+    sha256 = persisted.get('sha256Hash')
+    store = persisted_query_store()
+    key = f'crm:apq:{sha256}'
+
+    if not query:
+        query = store.get(key)
+        metrics.record_cache('persisted_query', query is not None)
+        if query is None:
+            raise persisted_query_error('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+        return query
+
+    if query_hash(query) != sha256:
+        raise persisted_query_error('Provided sha256Hash does not match the query.', 'BAD_PERSISTED_QUERY')
+    store.set(key, query, PERSISTED_QUERY_TIMEOUT)
+    return query
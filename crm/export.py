@@ -0,0 +1,108 @@
+import csv
+import heapq
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .filters import CustomerFilter, OrderFilter, ProductFilter
+from .models import ArchivedOrder, Customer, Order, Product
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# resource name -> (model, filterset, exported columns)
+RESOURCES = {
+    'customers': (Customer, CustomerFilter, ('id', 'name', 'email', 'phone', 'created_at')),
+    'products': (Product, ProductFilter, ('id', 'name', 'price', 'stock')),
+    'orders': (Order, OrderFilter, ('id', 'customer_id', 'order_date', 'total_amount')),
+}
+# resource name -> archive table whose rows are exported along with it (see crm.archive)
+ARCHIVES = {
+    'orders': ArchivedOrder,
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def chunk_size():
+    return getattr(settings, 'CRM_EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def export_rows(queryset, columns, size):
+    """Yield one dict per row, reading ``size`` rows from the database at a time."""
+    rows = queryset.order_by('pk').values_list(*columns).iterator(chunk_size=size)
+    for chunk in chunked(rows, size):
+        yield from (dict(zip(columns, row)) for row in chunk)
+
+
+def export_order_rows(queryset, columns, size):
+    """Like ``export_rows``, adding each order's items with one query per chunk.
+
+    Works for ``Order`` and ``ArchivedOrder``, which share their columns.
+    """
+    rows = queryset.order_by('pk').values_list(*columns).iterator(chunk_size=size)
+    for chunk in chunked(rows, size):
+        items = {}
+        links = queryset.model.products.through.objects.filter(order_id__in=[row[0] for row in chunk]).order_by('pk')
+        for order_id, product_id, quantity in links.values_list('order_id', 'product_id', 'quantity'):
+            items.setdefault(order_id, []).append({'product_id': product_id, 'quantity': quantity})
+        for row in chunk:
+            yield {**dict(zip(columns, row)), 'items': items.get(row[0], [])}
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+class Echo:
+    """File-like object whose ``write`` hands the written line back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, header):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        if 'items' in row:
+            row = {**row, 'items': ';'.join(
+                f"{item['product_id']}:{item['quantity']}" for item in row['items']
+            )}
+        yield writer.writerow([row[name] for name in header])
+
+
+def distinct(queryset):
+    if queryset.query.has_filters():
+        # Filters across a many-to-many join can repeat a row.
+        return queryset.model._default_manager.filter(pk__in=queryset.values('pk'))
+    return queryset
+
+
+def export(resource, queryset, export_format, size=None, archived=None):
+    """Return an iterator over the encoded lines of an export.
+
+    ``archived`` is the matching queryset of the resource's archive table;
+    its rows are merged in by primary key.
+    """
+    model, _, columns = RESOURCES[resource]
+    size = size or chunk_size()
+    querysets = [distinct(queryset)] + ([distinct(archived)] if archived is not None else [])
+    if model is Order:
+        parts, header = [export_order_rows(q, columns, size) for q in querysets], (*columns, 'items')
+    else:
+        parts, header = [export_rows(q, columns, size) for q in querysets], columns
+    rows = heapq.merge(*parts, key=lambda row: row['id'])
+    if export_format == 'csv':
+        return csv_lines(rows, header)
+    return ndjson_lines(rows)
@@ -0,0 +1,205 @@
+import heapq
+
+import graphene
+from django import forms
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.filter.utils import get_filtering_args_from_filterset
+
+from .loaders import get_loaders
+from .optimizer import optimize_queryset
+from .pagination import Keyset, SortDirection
+from .search import is_ranked
+
+
+def range_bounds(name, filter_):
+    """Argument names and types of the bounds of a range filter, or None.
+
+    A ``RangeFilter`` or ``DateFromToRangeFilter`` widget reads one value
+    per bound (``price_min``/``price_max``, ``order_date_after``/
+    ``order_date_before``), not a value under the filter's own name.
+    """
+    suffixes = getattr(filter_.field.widget, 'suffixes', None)
+    if not suffixes:
+        return None
+    bound = filter_.field.fields[0]
+    bound_type = graphene.Date if isinstance(bound, forms.DateField) else graphene.Decimal
+    return [(f'{name}_{suffix}', bound_type) for suffix in suffixes]
+
+
+def get_filtering_args(filterset_class, node_type):
+    """``get_filtering_args_from_filterset`` with range filters split into their bounds.
+
+    graphene-django exposes a range filter as a single String argument
+    that its widget never reads, so each bound gets an argument instead.
+    """
+    args = get_filtering_args_from_filterset(filterset_class, node_type)
+    for name, filter_ in filterset_class.base_filters.items():
+        bounds = range_bounds(name, filter_)
+        if bounds:
+            del args[name]
+            args.update((bound, graphene.Argument(bound_type)) for bound, bound_type in bounds)
+    return args
+
+
+def filter_arg_names(filterset_class):
+    names = []
+    for name, filter_ in filterset_class.base_filters.items():
+        bounds = range_bounds(name, filter_)
+        if bounds:
+            names.extend(bound for bound, _ in bounds)
+        else:
+            names.append(name)
+    return names
+
+
+class CRMFilterConnectionField(DjangoFilterConnectionField):
+    """Filter connection field that batches the relations of each page.
+
+    Resolvers may return a plain list (usually from a loader) instead of a
+    queryset; it is paginated as-is. Querysets are trimmed to the columns
+    and relations the selection set asks for. Every node on the resolved page is
+    primed into the request's loaders so nested relations load in bulk.
+    """
+
+    @property
+    def filtering_args(self):
+        if not self._filtering_args:
+            self._filtering_args = get_filtering_args(self.filterset_class, self.node_type)
+        return self._filtering_args
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        if isinstance(iterable, list):
+            return iterable
+        queryset = super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+        return cls.optimize_queryset(connection, queryset, info, args)
+
+    @classmethod
+    def optimize_queryset(cls, connection, queryset, info, args):
+        return optimize_queryset(queryset, info)
+
+    @classmethod
+    def connection_resolver(
+        cls,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        enforce_first_or_last,
+        root,
+        info,
+        **args,
+    ):
+        resolved = super().connection_resolver(
+            resolver,
+            connection,
+            default_manager,
+            queryset_resolver,
+            max_limit,
+            enforce_first_or_last,
+            root,
+            info,
+            **args,
+        )
+        get_loaders(info).prime(edge.node for edge in resolved.edges)
+        return resolved
+
+
+class KeysetFilterConnectionField(CRMFilterConnectionField):
+    """Filter connection field paginated by keyset instead of by offset.
+
+    Pages are ordered on the model's keyset (see ``crm.pagination``), or
+    the one picked by a ``sort_by`` argument, in the direction given by
+    the ``sort`` argument, and ``after``/``before``
+    cursors turn into range predicates, so the cost of a page does not
+    depend on how deep into the result set it is. A union of querysets
+    (an iterable with a ``querysets`` attribute, see ``crm.archive``) is
+    paged by merging a page from each. Lists handed back by
+    resolvers and search results, which are ordered by rank, are still
+    paginated by offset.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("sort", SortDirection())
+        super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def get_keyset(connection, args, model=None):
+        sort = args.get("sort") or SortDirection.ASC
+        sort_by = args.get("sort_by")
+        return Keyset(
+            model or connection._meta.node._meta.model,
+            getattr(sort, "value", sort),
+            getattr(sort_by, "value", sort_by),
+        )
+
+    @classmethod
+    def optimize_queryset(cls, connection, queryset, info, args):
+        keyset = cls.get_keyset(connection, args, queryset.model)
+        return optimize_queryset(queryset, info, extra=keyset.fields)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        # An iterable with ``querysets`` is a union of tables sharing the keyset.
+        querysets = getattr(iterable, "querysets", None)
+        if querysets is None:
+            if isinstance(iterable, list) or is_ranked(iterable):
+                return super().resolve_connection(connection, args, iterable, max_limit)
+            querysets = [iterable]
+        node = getattr(iterable, "node", None)
+
+        keyset = cls.get_keyset(connection, args)
+        first, last = args.get("first"), args.get("last")
+        after, before = args.get("after"), args.get("before")
+        backward = last is not None and first is None
+        limit = last if backward else first
+        if limit is None:
+            limit = max_limit
+
+        ordered = []
+        for queryset in querysets:
+            part = cls.get_keyset(connection, args, queryset.model)
+            if after:
+                queryset = queryset.filter(part.seek(after, forward=True))
+            if before:
+                queryset = queryset.filter(part.seek(before, forward=False))
+            ordered.append(queryset.order_by(*part.ordering(reverse=backward)))
+
+        offset = args.get("offset") or 0
+        window = slice(offset, None if limit is None else offset + limit + 1)
+        if len(ordered) == 1:
+            rows = list(ordered[0][window])
+        else:
+            # Every part is in keyset order: merge the first rows of each.
+            pages = [list(queryset[:window.stop]) for queryset in ordered]
+            merged = heapq.merge(*pages, key=keyset.key, reverse=keyset.descending != backward)
+            rows = list(merged)[window]
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+
+        edges = [
+            connection.Edge(node=node(row) if node else row, cursor=keyset.cursor(row))
+            for row in rows
+        ]
+        page_info = PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_more if backward else bool(after or offset),
+            has_next_page=bool(before) if backward else has_more,
+        )
+        resolved = connection(edges=edges, page_info=page_info)
+        resolved.iterable = iterable
+        return resolved
+
+
+def has_filter_args(filterset_class, kwargs):
+    """Return True if any filter of ``filterset_class`` was given a value."""
+    return any(kwargs.get(name) is not None for name in filter_arg_names(filterset_class))
@@ -1,24 +1,60 @@
 import django_filters
+from . import search
 from .models import Customer, Product, Order
+from .validators import normalize_phone
+
+
+def digits_prefix_range(prefix):
+    """Bounds ``[lower, upper)`` of the digit strings starting with ``prefix``.
+
+    A range, unlike ``LIKE 'prefix%'``, can use the index on any database
+    and collation. ``upper`` is None when every digit of ``prefix`` is 9.
+    """
+    stripped = prefix.rstrip('9')
+    if not stripped:
+        return prefix, None
+    return prefix, stripped[:-1] + str(int(stripped[-1]) + 1)
+
 
 class CustomerFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
     email = django_filters.CharFilter(lookup_expr='icontains')
     created_at = django_filters.DateFromToRangeFilter()
+    order_count = django_filters.RangeFilter()
+    last_order_at = django_filters.DateFromToRangeFilter()
+    lifetime_value = django_filters.RangeFilter()
+    phone = django_filters.CharFilter(method='filter_by_phone')
     phone_pattern = django_filters.CharFilter(method='filter_by_phone_pattern')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at']
+        fields = ['name', 'email', 'created_at', 'order_count', 'last_order_at', 'lifetime_value']
+
+    def filter_by_phone(self, queryset, name, value):
+        digits = normalize_phone(value)
+        if digits is None:
+            return queryset.none()
+        return queryset.filter(phone_digits=digits)
 
     def filter_by_phone_pattern(self, queryset, name, value):
-        return queryset.filter(phone__startswith=value)
+        # Patterns normalize like stored numbers: "+1555" and "555" both mean 1555...
+        digits = normalize_phone(value)
+        if digits is None:
+            return queryset.none()
+        lower, upper = digits_prefix_range(digits)
+        queryset = queryset.filter(phone_digits__gte=lower)
+        return queryset if upper is None else queryset.filter(phone_digits__lt=upper)
+
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
 
 class ProductFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
     price = django_filters.RangeFilter()
     stock = django_filters.RangeFilter()
     low_stock = django_filters.BooleanFilter(method='filter_low_stock')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Product
@@ -29,13 +65,20 @@ class ProductFilter(django_filters.FilterSet):
             return queryset.filter(stock__lt=10)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
+
 class OrderFilter(django_filters.FilterSet):
     total_amount = django_filters.RangeFilter()
     order_date = django_filters.DateFromToRangeFilter()
     customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
     product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
     product_id = django_filters.NumberFilter(field_name='products__id')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Order
-        fields = ['total_amount', 'order_date', 'customer_name', 'product_name', 'product_id']
\ No newline at end of file
+        fields = ['total_amount', 'order_date', 'customer_name', 'product_name', 'product_id']
+
+    def filter_search(self, queryset, name, value):
+        return search.search_orders(queryset, value)
@@ -0,0 +1,135 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('crm.instrumentation')
+
+DEFAULT_DUPLICATE_THRESHOLD = 2
+
+# Placeholder lists of any length fingerprint the same: IN (%s, %s) == IN (%s).
+PLACEHOLDER_LIST = re.compile(r'\((?:%s|\?)(?:,\s*(?:%s|\?))*\)')
+
+
+def is_enabled():
+    return getattr(settings, 'CRM_INSTRUMENTATION_ENABLED', False)
+
+
+def in_extensions():
+    return getattr(settings, 'CRM_INSTRUMENTATION_EXTENSIONS', False)
+
+
+def duplicate_threshold():
+    return getattr(settings, 'CRM_INSTRUMENTATION_DUPLICATE_THRESHOLD', DEFAULT_DUPLICATE_THRESHOLD)
+
+
+def fingerprint(sql):
+    return PLACEHOLDER_LIST.sub('(...)', ' '.join(sql.split()))
+
+
+class OperationTrace:
+    """Resolver and SQL timings collected while one operation executes.
+
+    Installed as a DB ``execute_wrapper`` for the duration of the
+    operation; ``ResolverTimingMiddleware`` adds the per-field timings.
+    """
+
+    def __init__(self, operation_type, operation_name):
+        self.operation_type = operation_type
+        self.operation_name = operation_name
+        self.fields = {}
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_time += time.perf_counter() - started
+            self.statements[fingerprint(sql)] += 1
+
+    def add_field(self, coordinate, elapsed):
+        timing = self.fields.get(coordinate)
+        if timing is None:
+            timing = self.fields[coordinate] = {'calls': 0, 'time_ms': 0.0, 'max_ms': 0.0}
+        elapsed *= 1000
+        timing['calls'] += 1
+        timing['time_ms'] += elapsed
+        timing['max_ms'] = max(timing['max_ms'], elapsed)
+
+    def duplicates(self):
+        threshold = duplicate_threshold()
+        return [
+            {'fingerprint': sql, 'count': count}
+            for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def as_dict(self):
+        return {
+            'operation': self.operation_name,
+            'type': self.operation_type,
+            'duration_ms': round(self.duration * 1000, 3),
+            'sql': {
+                'count': self.sql_count,
+                'time_ms': round(self.sql_time * 1000, 3),
+                'duplicates': self.duplicates(),
+            },
+            'fields': {
+                coordinate: {name: round(value, 3) for name, value in timing.items()}
+                for coordinate, timing in sorted(
+                    self.fields.items(), key=lambda item: item[1]['time_ms'], reverse=True
+                )
+            },
+        }
+
+
+class ResolverTimingMiddleware:
+    """Graphene middleware timing every resolver of a traced operation."""
+
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, 'crm_trace', None)
+        if trace is None:
+            return next(root, info, **args)
+        coordinate = f'{info.parent_type.name}.{info.field_name}'
+        started = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            trace.add_field(coordinate, time.perf_counter() - started)
+
+
+@contextmanager
+def trace_operation(request, operation_ast, operation_name):
+    """Trace the operation executed inside the block, if instrumentation is on.
+
+    On exit the trace is logged to ``crm.instrumentation`` and, with
+    ``CRM_INSTRUMENTATION_EXTENSIONS``, added to the response extensions.
+    """
+    if not is_enabled():
+        yield None
+        return
+    operation_type = operation_ast.operation.value if operation_ast is not None else None
+    name = operation_name or (operation_ast.name.value if operation_ast and operation_ast.name else None)
+    trace = OperationTrace(operation_type, name or 'anonymous')
+    request.crm_trace = trace
+    try:
+        with connection.execute_wrapper(trace):
+            yield trace
+    finally:
+        request.crm_trace = None
+        trace.duration = time.perf_counter() - trace.started
+        record = trace.as_dict()
+        logger.info(json.dumps(record), extra={'graphql_operation': record})
+        if in_extensions():
+            request.graphql_extensions['instrumentation'] = record
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.sql import UpdateQuery
+
+from .models import Product
+
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+DEFAULT_RESTOCK_INCREMENT = 10
+
+
+def low_stock_threshold():
+    return getattr(settings, 'CRM_LOW_STOCK_THRESHOLD', DEFAULT_LOW_STOCK_THRESHOLD)
+
+
+def restock_increment():
+    return getattr(settings, 'CRM_RESTOCK_INCREMENT', DEFAULT_RESTOCK_INCREMENT)
+
+
+def supports_update_returning(connection):
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def restock(threshold, increment, targets=None):
+    """Restock every product below ``threshold`` with one ``UPDATE``.
+
+    Products get ``increment`` more units, or are raised to their level in
+    ``targets`` (a ``{product_id: level}`` mapping) when they have one.
+    Returns the updated products; on databases with ``UPDATE ... RETURNING``
+    they come back from the update itself.
+    """
+    stock = F('stock') + increment
+    if targets:
+        stock = Case(
+            *(When(pk=pk, then=Greatest(F('stock'), Value(level))) for pk, level in targets.items()),
+            default=stock,
+            output_field=PositiveIntegerField(),
+        )
+    low_stock = Product.objects.filter(stock__lt=threshold)
+    using = router.db_for_write(Product)
+    connection = connections[using]
+
+    with transaction.atomic(using=using):
+        if supports_update_returning(connection):
+            query = low_stock.query.chain(UpdateQuery)
+            query.add_update_values({'stock': stock})
+            sql, params = query.get_compiler(using).as_sql()
+            columns = ', '.join(
+                connection.ops.quote_name(field.column) for field in Product._meta.concrete_fields
+            )
+            return list(Product.objects.db_manager(using).raw(f'{sql} RETURNING {columns}', params))
+
+        ids = list(low_stock.select_for_update().values_list('pk', flat=True))
+        Product.objects.filter(pk__in=ids).update(stock=stock)
+        return list(Product.objects.filter(pk__in=ids))
@@ -0,0 +1,235 @@
+from collections import defaultdict
+from functools import partial
+
+from django.db.models import Count, F, Value, Window
+from django.db.models.functions import RowNumber
+from graphene_django.settings import graphene_settings
+from graphql_relay import cursor_to_offset
+
+from .models import ArchivedOrder, Customer, Order, Product
+
+# Orders are read from both tables (see crm.archive) with these columns.
+ORDER_MODELS = (Order, ArchivedOrder)
+ORDER_COLUMNS = ('id', 'customer_id', 'order_date', 'total_amount')
+
+
+class DataLoader:
+    """Per-request batching cache for one relation.
+
+    Keys are queued as pages of parent objects are resolved and fetched
+    together, in a single ``IN (...)`` query, the first time any of them
+    is loaded.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._cache = {}
+        self._queue = set()
+
+    def queue(self, keys):
+        self._queue.update(key for key in keys if key not in self._cache)
+
+    def prime(self, key, value):
+        self._cache.setdefault(key, value)
+
+    def load(self, key):
+        if key not in self._cache:
+            self._queue.add(key)
+            self._dispatch()
+        return self._cache.get(key, self.default() if self.default else None)
+
+    def load_many(self, keys):
+        return [self.load(key) for key in keys]
+
+    def _dispatch(self):
+        keys = list(self._queue)
+        self._queue.clear()
+        results = self.batch_load_fn(keys)
+        for key in keys:
+            self._cache[key] = results.get(key, self.default() if self.default else None)
+
+
+class Page(list):
+    """The leading rows of a relation, standing in for all ``total`` of them.
+
+    ``len()`` is the full length, so offset pagination and ``totalCount``
+    treat it as the whole relation while only the rows a page needs are
+    loaded.
+    """
+
+    def __init__(self, rows, total):
+        super().__init__(rows)
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+
+def rows_needed(args):
+    """How many leading rows answer the connection page ``args`` asks for.
+
+    None when the page is counted from the end (``last``/``before``) and
+    every row is needed.
+    """
+    if args.get('last') is not None or args.get('before'):
+        return None
+    first = args.get('first')
+    if first is None:
+        first = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    start = args.get('offset') or 0
+    after = args.get('after')
+    if after:
+        offset = cursor_to_offset(after)
+        if offset is None:
+            return None
+        start += offset + 1
+    return None if first is None else start + first
+
+
+class PagedLoader:
+    """The loaders of a to-many relation, one for each number of rows read per key.
+
+    Keys queued while priming go to every loader, including ones created
+    later, so each page size is still fetched in one batch.
+    """
+
+    def __init__(self, batch_load_fn):
+        self.batch_load_fn = batch_load_fn
+        self._queued = set()
+        self._loaders = {}
+
+    def queue(self, keys):
+        keys = list(keys)
+        self._queued.update(keys)
+        for loader in self._loaders.values():
+            loader.queue(keys)
+
+    def rows(self, limit):
+        """The loader reading up to ``limit`` rows per key (all of them for None)."""
+        loader = self._loaders.get(limit)
+        if loader is None:
+            loader = self._loaders[limit] = DataLoader(partial(self.batch_load_fn, limit=limit), default=list)
+            loader.queue(self._queued)
+        return loader
+
+
+class Loaders:
+    """The set of loaders shared by every resolver of one GraphQL request."""
+
+    def __init__(self):
+        self.customer = DataLoader(self._load_customers)
+        self.order_products = DataLoader(self._load_order_products, default=list)
+        self.archived_order_products = DataLoader(self._load_archived_order_products, default=list)
+        self.customer_orders = PagedLoader(self._load_customer_orders)
+        self.product_orders = PagedLoader(self._load_product_orders)
+
+    def prime(self, objects):
+        """Queue the relations of a freshly resolved page of objects."""
+        for obj in objects:
+            if isinstance(obj, Order):
+                # Don't pull in a column the optimizer chose to defer.
+                if 'customer_id' not in obj.get_deferred_fields():
+                    self.customer.queue([obj.customer_id])
+                if getattr(obj, 'archived', False):
+                    self.archived_order_products.queue([obj.pk])
+                else:
+                    self.order_products.queue([obj.pk])
+            elif isinstance(obj, Customer):
+                # A customer trimmed by the optimizer would load each deferred
+                # column on its own when read through ``order.customer``.
+                if not obj.get_deferred_fields():
+                    self.customer.prime(obj.pk, obj)
+                self.customer_orders.queue([obj.pk])
+            elif isinstance(obj, Product):
+                self.product_orders.queue([obj.pk])
+
+    def _load_customers(self, keys):
+        customers = Customer.objects.in_bulk(keys)
+        self.prime(customers.values())
+        return customers
+
+    def _load_order_products(self, keys, model=Order):
+        through = model.products.through
+        results = defaultdict(list)
+        for link in through.objects.filter(order_id__in=keys).select_related('product'):
+            results[link.order_id].append(link.product)
+        for products in results.values():
+            self.prime(products)
+        return results
+
+    def _load_archived_order_products(self, keys):
+        return self._load_order_products(keys, model=ArchivedOrder)
+
+    def _load_customer_orders(self, keys, limit=None):
+        return self._load_orders(
+            lambda model: model.objects.filter(customer_id__in=keys), 'customer_id', ORDER_COLUMNS, limit
+        )
+
+    def _load_product_orders(self, keys, limit=None):
+        return self._load_orders(
+            lambda model: model.products.through.objects.filter(product_id__in=keys),
+            'product_id',
+            [f'order__{column}' for column in ORDER_COLUMNS],
+            limit,
+        )
+
+    def _load_orders(self, rows_of, key, columns, limit=None):
+        """Group by ``key`` the orders of the ``rows_of(model)`` querysets.
+
+        Both order tables are read with one ``UNION ALL``; archived orders
+        come back as ``Order`` instances flagged ``archived``. With a
+        ``limit``, each table returns only its first ``limit`` orders per
+        key (by ``ROW_NUMBER()``) along with its count, and groups longer
+        than that come back as a ``Page``.
+        """
+        # Selecting ``key`` twice when it is also one of ``columns`` trips up
+        # the column list Django builds around a union of windowed queries.
+        fields = list(columns) if key in columns else [key, *columns]
+        querysets = []
+        for model in ORDER_MODELS:
+            rows = rows_of(model).annotate(archived=Value(model is ArchivedOrder), table_total=Value(0))
+            if limit is not None:
+                rows = rows.annotate(
+                    rank=Window(RowNumber(), partition_by=[F(key)], order_by=F(columns[0]).asc()),
+                    table_total=Window(Count('*'), partition_by=[F(key)]),
+                ).filter(rank__lte=limit)
+            querysets.append(rows.values_list(*fields, 'archived', 'table_total'))
+        rows = querysets[0].union(*querysets[1:], all=True)
+        results = defaultdict(list)
+        totals = defaultdict(dict)
+        for *values, archived, table_total in rows:
+            row = dict(zip(fields, values))
+            group = row[key]
+            order = Order.from_db(rows.db, ORDER_COLUMNS, [row[column] for column in columns])
+            if archived:
+                order.archived = True
+            results[group].append(order)
+            totals[group][archived] = table_total
+        for group, orders in results.items():
+            orders.sort(key=lambda order: order.pk)
+            total = sum(totals[group].values())
+            if limit is not None and total > limit:
+                orders = results[group] = Page(orders[:limit], total)
+            self.prime(orders)
+        return results
+
+
+def load_related(instance, name, loader, key):
+    """Return ``instance.<name>`` if it was prefetched, else load it in a batch."""
+    prefetched = getattr(instance, '_prefetched_objects_cache', {})
+    if name in prefetched:
+        return list(prefetched[name])
+    return loader.load(key)
+
+
+def get_loaders(info):
+    """Return the loaders attached to the request, creating them if needed."""
+    context = info.context
+    if context is None:
+        return Loaders()
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        setattr(context, 'loaders', loaders)
+    return loaders
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import archive
+from crm.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Move orders older than CRM_ORDER_ARCHIVE_AGE_DAYS, and their items, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Archive orders older than this many days (default: CRM_ORDER_ARCHIVE_AGE_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders moved per transaction')
+        parser.add_argument('--max-runtime', type=float,
+                            help='Stop after this many seconds; the next run carries on with the oldest orders left')
+        parser.add_argument('--dry-run', action='store_true', help='Count the orders to archive without moving them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        days = options['days']
+        if days is not None and days < 0:
+            raise CommandError('--days must not be negative.')
+        max_runtime = options['max_runtime']
+        if max_runtime is not None and max_runtime <= 0:
+            raise CommandError('--max-runtime must be positive.')
+
+        cutoff = archive.archive_cutoff(days)
+        if options['dry_run']:
+            count = Order.objects.filter(order_date__lt=cutoff).count()
+            self.stdout.write(self.style.SUCCESS(f'{count} order(s) placed before {cutoff:%Y-%m-%d} would be archived.'))
+            return
+
+        started = time.monotonic()
+        archived = 0
+        while True:
+            moved = archive.archive_orders(cutoff, batch_size)
+            if not moved:
+                break
+            archived += moved
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  ...{archived} archived ({archived / max(elapsed, 1e-6):.0f} orders/s)')
+            if max_runtime is not None and elapsed >= max_runtime:
+                self.stdout.write(f'Stopped after {max_runtime:g}s; run again to archive the rest.')
+                break
+
+        self.stdout.write(
+            self.style.SUCCESS(f'{archived} order(s) placed before {cutoff:%Y-%m-%d} archived.')
+        )
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from crm.models import Customer
+from crm.signals import invalidate_responses
+from crm.validators import normalize_phone
+
+
+class Command(BaseCommand):
+    help = 'Fill in the normalized phone_digits of customers, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Customers per transaction')
+        parser.add_argument('--all', action='store_true',
+                            help='Renormalize every customer, e.g. after changing CRM_PHONE_COUNTRY_CODE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        customers = Customer.objects.filter(phone__isnull=False).only('pk', 'phone', 'phone_digits')
+        if not options['all']:
+            customers = customers.filter(phone_digits__isnull=True)
+
+        # Walk the primary key, so an interrupted run simply continues.
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(customers.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            changed = []
+            for customer in batch:
+                digits = normalize_phone(customer.phone)
+                if digits != customer.phone_digits:
+                    customer.phone_digits = digits
+                    changed.append(customer)
+            with transaction.atomic():
+                Customer.objects.bulk_update(changed, ['phone_digits'])
+            updated += len(changed)
+            self.stdout.write(f'  ...{updated} updated, up to customer {last_pk}')
+
+        if updated:
+            invalidate_responses(Customer)
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} customer phone number(s).'))
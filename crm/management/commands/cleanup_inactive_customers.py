@@ -1,31 +1,131 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+import time
 from datetime import timedelta
-from crm.models import Customer
-from django.db.models import Q
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from crm import rollups
+from crm.counting import adjust_table_count
+from crm.models import (
+    ArchivedOrder, ArchivedOrderItem, CleanupCheckpoint, Customer, DailyCustomerSalesRollup, Order, OrderItem,
+)
+from crm.signals import invalidate_responses
+
+
+def inactive_customers(cutoff):
+    """Customers with no order since ``cutoff`` who ordered before it or signed up before it.
+
+    Candidates come from the indexed activity columns and are confirmed
+    with anti-joins on the (customer_id, order_date) indexes, so a stale
+    activity column can never get an active customer deleted.
+    """
+    customers = Customer.objects.filter(
+        Q(last_order_at__lt=cutoff) | Q(last_order_at__isnull=True, created_at__lt=cutoff)
+    )
+    # The archive may hold orders newer than the cutoff when its age is shorter.
+    for model in (Order, ArchivedOrder):
+        customers = customers.filter(
+            ~Exists(model.objects.filter(customer_id=OuterRef('pk'), order_date__gte=cutoff))
+        )
+    return customers
+
+
+def delete_customers(ids):
+    """Delete the customers ``ids`` with their orders, a few queries for the whole batch.
+
+    The deletes skip the per-row signals, which would cost several
+    queries for every order; the rollups and row counters are adjusted
+    once for the batch instead. Returns how many customers were deleted.
+    """
+    if not ids:
+        return 0
+    rollups.remove_customer_orders(ids)
+    for model in (OrderItem, ArchivedOrderItem):
+        items = model.objects.filter(order__customer_id__in=ids)
+        items._raw_delete(items.db)
+    for model in (Order, ArchivedOrder):
+        orders = model.objects.filter(customer_id__in=ids)
+        adjust_table_count(model, -orders._raw_delete(orders.db))
+    activity = DailyCustomerSalesRollup.objects.filter(customer_id__in=ids)
+    activity._raw_delete(activity.db)
+    customers = Customer.objects.filter(pk__in=ids)
+    deleted = customers._raw_delete(customers.db)
+    adjust_table_count(Customer, -deleted)
+    invalidate_responses(Customer, Order)
+    return deleted
 
 
 class Command(BaseCommand):
     help = 'Delete customers with no orders in the past year or who never placed an order and were created over a year ago'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Customers deleted per transaction')
+        parser.add_argument('--max-runtime', type=float,
+                            help='Stop after this many seconds; the next run resumes where this one stopped')
+        parser.add_argument('--dry-run', action='store_true', help='Count inactive customers without deleting them')
+        parser.add_argument('--restart', action='store_true', help='Ignore a saved position and start a new sweep')
+
     def handle(self, *args, **options):
-        one_year_ago = timezone.now() - timedelta(days=365)
-        
-        # Find customers who:
-        # 1. Have no orders at all and were created over a year ago, OR
-        # 2. Have orders but all orders are older than a year
-        inactive_customers = Customer.objects.filter(
-            Q(orders__isnull=True, created_at__lt=one_year_ago) |
-            Q(orders__order_date__lt=one_year_ago)
-        ).exclude(
-            orders__order_date__gte=one_year_ago
-        ).distinct()
-        
-        deleted_count = inactive_customers.count()
-        inactive_customers.delete()
-        
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        max_runtime = options['max_runtime']
+        if max_runtime is not None and max_runtime <= 0:
+            raise CommandError('--max-runtime must be positive.')
+        dry_run = options['dry_run']
+
+        checkpoint = None
+        if not dry_run:
+            if options['restart']:
+                CleanupCheckpoint.objects.all().delete()
+            checkpoint = CleanupCheckpoint.objects.order_by('pk').first()
+            if checkpoint is None:
+                checkpoint = CleanupCheckpoint.objects.create(cutoff=timezone.now() - timedelta(days=365))
+            elif checkpoint.last_customer_id:
+                self.stdout.write(f'Resuming after customer {checkpoint.last_customer_id}.')
+            cutoff, last_pk = checkpoint.cutoff, checkpoint.last_customer_id
+        else:
+            cutoff, last_pk = timezone.now() - timedelta(days=365), 0
+
+        inactive = inactive_customers(cutoff).order_by('pk').values_list('pk', flat=True)
+        started = time.monotonic()
+        deleted_count = 0
+        finished = False
+        while True:
+            ids = list(inactive.filter(pk__gt=last_pk)[:batch_size])
+            if not ids:
+                finished = True
+                break
+            last_pk = ids[-1]
+            if dry_run:
+                deleted_count += len(ids)
+            else:
+                with transaction.atomic():
+                    # Checked again in the transaction: an order may have come in since.
+                    deleted = delete_customers(list(
+                        inactive_customers(cutoff).filter(pk__in=ids).select_for_update().values_list('pk', flat=True)
+                    ))
+                    checkpoint.last_customer_id = last_pk
+                    checkpoint.deleted += deleted
+                    checkpoint.save()
+                deleted_count += deleted
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'  ...{deleted_count} {"found" if dry_run else "deleted"}, up to customer {last_pk} '
+                f'({deleted_count / max(elapsed, 1e-6):.0f} customers/s)'
+            )
+            if max_runtime is not None and elapsed >= max_runtime:
+                break
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f'{deleted_count} inactive customer(s) would be deleted.'))
+            return
+        if finished:
+            checkpoint.delete()
+        else:
+            self.stdout.write(f'Stopped after {max_runtime:g}s; run again to resume after customer {last_pk}.')
         self.stdout.write(
             self.style.SUCCESS(f'{deleted_count} inactive customer(s) deleted.')
         )
-        
-        return deleted_count
@@ -0,0 +1,172 @@
+import datetime
+import itertools
+import random
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from crm import rollups
+from crm.bulk import bulk_create_orders, keep_auto_now_add
+from crm.models import (
+    Customer,
+    DailyCustomerSalesRollup,
+    DailyProductSalesRollup,
+    DailySalesRollup,
+    Order,
+    OrderItem,
+    Product,
+    TableCount,
+)
+from crm.signals import invalidate_responses, rows_bulk_created
+
+FIRST_NAMES = ('Ada', 'Ben', 'Chloe', 'David', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jonas',
+               'Kemi', 'Liam', 'Maya', 'Nadia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq')
+LAST_NAMES = ('Smith', 'Okafor', 'Garcia', 'Chen', 'Novak', 'Haddad', 'Kowalski', 'Silva',
+              'Tanaka', 'Mensah', 'Dubois', 'Ivanova', 'Khan', 'Murphy', 'Rossi', 'Larsen')
+PRODUCT_WORDS = ('Laptop', 'Mouse', 'Keyboard', 'Monitor', 'Cable', 'Headset', 'Webcam', 'Dock',
+                 'Charger', 'Stand', 'Speaker', 'Tablet', 'Router', 'Drive', 'Lamp', 'Chair')
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Generate customers, products and orders with realistic distributions for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000, help='Number of customers (N)')
+        parser.add_argument('--products', type=int, default=100, help='Number of products (M)')
+        parser.add_argument('--orders', type=int, default=10000, help='Number of orders (K)')
+        parser.add_argument('--years', type=float, default=3, help='Spread signups and orders over this many years')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; equal seeds give equal data')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Zipf exponent of product popularity (0 = uniform)')
+        parser.add_argument('--mean-basket', type=float, default=2.5, help='Mean number of items per order')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction and bulk insert')
+        parser.add_argument('--clear', action='store_true', help='Delete all customers, products and orders first')
+
+    def handle(self, *args, **options):
+        for name in ('customers', 'products', 'orders', 'batch_size'):
+            if options[name] < (1 if name == 'batch_size' else 0):
+                raise CommandError(f"--{name.replace('_', '-')} is out of range.")
+        if options['orders'] and not (options['customers'] and options['products']):
+            raise CommandError('Orders need at least one customer and one product.')
+        if options['years'] <= 0 or options['mean_basket'] < 1:
+            raise CommandError('--years must be positive and --mean-basket at least 1.')
+
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Anchor dates to today so a seed reproduces the same data all day.
+        self.end = datetime.datetime.combine(
+            timezone.localdate(), datetime.time.min, tzinfo=timezone.get_current_timezone()
+        )
+        self.span = options['years'] * 365 * SECONDS_PER_DAY
+
+        if options['clear']:
+            self.clear()
+        customers = self.generate_customers(options['customers'])
+        products = self.generate_products(options['products'])
+        self.generate_orders(options['orders'], customers, products, options['zipf'], options['mean_basket'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(customers)} customers, {len(products)} products and {options['orders']} orders."
+        ))
+
+    def clear(self):
+        # Row-by-row deletes would fire the delete signals for every row;
+        # everything is going, so delete straight from the tables.
+        with transaction.atomic():
+            for model in (OrderItem, DailyProductSalesRollup, DailyCustomerSalesRollup,
+                          DailySalesRollup, Order, Customer, Product):
+                model.objects.all()._raw_delete(model.objects.db)
+            TableCount.objects.filter(
+                table__in=[model._meta.label for model in (Customer, Product, Order)]
+            ).delete()
+            invalidate_responses(Customer, Product, Order)
+        self.stdout.write('Deleted all customers, products and orders.')
+
+    def insert(self, label, model, rows):
+        """Bulk insert ``rows`` (an iterable) in batches, reporting progress."""
+        started = time.monotonic()
+        created = 0
+        iterator = iter(rows)
+        while batch := list(itertools.islice(iterator, self.batch_size)):
+            with transaction.atomic():
+                if model is Order:
+                    # Customer activity is recomputed once, in generate_orders.
+                    bulk_create_orders(batch, batch_size=self.batch_size, refresh_customers=False)
+                else:
+                    model.objects.bulk_create(batch)
+                    rows_bulk_created(model, len(batch))
+            created += len(batch)
+            rate = created / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'{label}: {created} rows ({rate:.0f} rows/s)')
+
+    def generate_customers(self, count):
+        """Create ``count`` customers; returns ``(id, signup timestamp)`` pairs."""
+        # Generated emails are numbered below their customer's id, so
+        # numbering from the highest id cannot collide, even after deletes.
+        start = Customer.objects.aggregate(Max('id'))['id__max'] or 0
+        rows = []
+        for i in range(start, start + count):
+            # A tenth sign up before the order history begins.
+            created_at = self.end.timestamp() - self.random.uniform(0, self.span * 1.1)
+            rows.append(Customer(
+                name=f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}',
+                email=f'customer{i}@example.com',
+                phone=f'+1{self.random.randrange(2000000000, 9999999999)}' if self.random.random() < 0.7 else None,
+                created_at=datetime.datetime.fromtimestamp(created_at, tz=datetime.timezone.utc),
+            ))
+        with keep_auto_now_add(Customer, 'created_at'):
+            self.insert('customers', Customer, rows)
+        return [(customer.pk, customer.created_at.timestamp()) for customer in rows]
+
+    def generate_products(self, count):
+        """Create ``count`` products; returns ``(id, price)`` pairs, most popular first."""
+        rows = []
+        for i in range(count):
+            price = Decimal(str(round(self.random.lognormvariate(3.5, 1.0), 2))).max(Decimal('0.50'))
+            rows.append(Product(
+                name=f'{self.random.choice(PRODUCT_WORDS)} {i + 1}',
+                price=price,
+                stock=self.random.choice((0, 3, 8)) if self.random.random() < 0.1 else self.random.randint(10, 500),
+            ))
+        self.insert('products', Product, rows)
+        return [(product.pk, product.price) for product in rows]
+
+    def generate_orders(self, count, customers, products, zipf, mean_basket):
+        if not count:
+            return
+        # Cumulative Zipf weights: the product at rank r is ordered in
+        # proportion to 1 / r**s.
+        weights = list(itertools.accumulate(1 / rank ** zipf for rank in range(1, len(products) + 1)))
+        end = self.end.timestamp()
+        first_day = last_day = None
+
+        def orders():
+            nonlocal first_day, last_day
+            for _ in range(count):
+                customer_id, signup = self.random.choice(customers)
+                ordered_at = self.random.uniform(max(signup, end - self.span), end)
+                order_date = datetime.datetime.fromtimestamp(ordered_at, tz=datetime.timezone.utc)
+                # Geometric basket size with the requested mean.
+                size = 1
+                while self.random.random() > 1 / mean_basket:
+                    size += 1
+                basket = Counter(self.random.choices(products, cum_weights=weights, k=size))
+                total = sum(price * quantity for (_, price), quantity in basket.items())
+                day = rollups.order_day(order_date)
+                first_day = min(first_day or day, day)
+                last_day = max(last_day or day, day)
+                yield (
+                    Order(customer_id=customer_id, order_date=order_date, total_amount=total),
+                    [(product_id, quantity) for (product_id, _), quantity in basket.items()],
+                )
+
+        self.insert('orders', Order, orders())
+        self.stdout.write('Rebuilding daily rollups and customer activity...')
+        rollups.rebuild(first_day, last_day, batch_size=self.batch_size)
+        rollups.refresh_customers(customer_id for customer_id, _ in customers)
@@ -0,0 +1,275 @@
+import csv
+import datetime
+import json
+import os
+import time
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from crm import rollups
+from crm.bulk import bulk_create_orders
+from crm.models import Customer, ImportCheckpoint, Order, Product
+from crm.signals import rows_bulk_created
+from crm.validators import is_valid_phone
+
+KINDS = ('customers', 'products', 'orders')
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(path):
+    """Yield ``(line_number, row)`` for each record of a CSV or NDJSON file.
+
+    Rows are read one at a time; a line that cannot be decoded is yielded
+    as a ``RowError`` so it is reported like any other invalid row.
+    """
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+    elif path.endswith(('.ndjson', '.jsonl')):
+        with open(path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = RowError('Invalid JSON.')
+                yield number, row if isinstance(row, (dict, RowError)) else RowError('Expected an object.')
+    else:
+        raise CommandError(f'Cannot tell the format of "{path}"; use a .csv or .ndjson file.')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def text(row, name, required=True):
+    value = row.get(name)
+    value = str(value).strip() if value not in (None, '') else ''
+    if required and not value:
+        raise RowError(f'Missing {name}.')
+    return value or None
+
+
+def clean_customer(row):
+    customer = Customer(name=text(row, 'name'), email=text(row, 'email'), phone=text(row, 'phone', False))
+    if customer.phone and not is_valid_phone(customer.phone):
+        raise RowError(f'Invalid phone number format for {customer.email}.')
+    return customer
+
+
+def clean_product(row):
+    try:
+        price = Decimal(text(row, 'price'))
+        stock = int(text(row, 'stock', False) or 0)
+    except (InvalidOperation, ValueError):
+        raise RowError('Invalid price or stock.')
+    if price <= 0:
+        raise RowError('Price must be positive.')
+    if stock < 0:
+        raise RowError('Stock cannot be negative.')
+    return Product(name=text(row, 'name'), price=price, stock=stock)
+
+
+def parse_order_date(value):
+    if value is None:
+        return None
+    date = parse_datetime(value)
+    if date is None and parse_date(value) is not None:
+        date = datetime.datetime.combine(parse_date(value), datetime.time.min)
+    if date is None:
+        raise RowError(f'Invalid order_date "{value}".')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def parse_items(value):
+    """Items are ``name:quantity`` pairs joined by ``;`` in CSV, or a list in NDJSON."""
+    if isinstance(value, list):
+        pairs = [
+            (item, 1) if isinstance(item, str) else (item.get('product'), item.get('quantity', 1))
+            for item in value
+        ]
+    else:
+        pairs = []
+        for part in filter(None, (value or '').split(';')):
+            name, sep, quantity = part.rpartition(':')
+            pairs.append((name, quantity) if sep else (part, 1))
+    items = []
+    for name, quantity in pairs:
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise RowError(f'Invalid quantity for {name}.')
+        if not name or quantity < 1:
+            raise RowError('Every item needs a product and a positive quantity.')
+        items.append((str(name).strip(), quantity))
+    if not items:
+        raise RowError('At least one product must be given.')
+    return items
+
+
+class Command(BaseCommand):
+    help = 'Import customers, products and orders from CSV or NDJSON files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', help='File of customers: name, email, phone')
+        parser.add_argument('--products', help='File of products: name, price, stock')
+        parser.add_argument(
+            '--orders',
+            help='File of orders: customer_email, order_date, total_amount (optional), '
+                 'items ("name:quantity;..." in CSV, a list in NDJSON)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transaction and bulk insert')
+        parser.add_argument('--restart', action='store_true', help='Ignore saved checkpoints and start over')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        sources = [(kind, options[kind]) for kind in KINDS if options[kind]]
+        if not sources:
+            raise CommandError('Give at least one of --customers, --products or --orders.')
+        for _, path in sources:
+            if not os.path.exists(path):
+                raise CommandError(f'File "{path}" does not exist.')
+
+        self.batch_size = options['batch_size']
+        self.skipped = 0
+        imported = {kind: 0 for kind in KINDS}
+        for kind, path in sources:
+            imported[kind] = self.import_file(kind, path, options['restart'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported['customers']} customers, {imported['products']} products "
+            f"and {imported['orders']} orders; {self.skipped} invalid row(s) skipped."
+        ))
+
+    def import_file(self, kind, path, restart):
+        """Import one file in chunks, saving the position after each chunk.
+
+        A rerun picks up after the last committed chunk unless ``--restart``
+        is given.
+        """
+        source = f'{kind}:{os.path.abspath(path)}'
+        if restart:
+            ImportCheckpoint.objects.filter(source=source).delete()
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=source)
+        if checkpoint.rows:
+            self.stdout.write(f'{kind}: resuming after row {checkpoint.rows}.')
+        insert = getattr(self, f'insert_{kind}')
+        if kind == 'orders':
+            self.build_indexes()
+
+        started = time.monotonic()
+        read = imported = 0
+        for chunk in chunked(islice(read_rows(path), checkpoint.rows, None), self.batch_size):
+            with transaction.atomic():
+                imported += insert(self.clean(path, chunk, getattr(self, f'clean_{kind}')), checkpoint)
+                checkpoint.rows += len(chunk)
+                checkpoint.save()
+            read += len(chunk)
+            rate = read / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'{kind}: {read} rows read, {imported} imported ({rate:.0f} rows/s)')
+
+        if kind == 'orders' and checkpoint.first_day:
+            rollups.rebuild(checkpoint.first_day, checkpoint.last_day, batch_size=self.batch_size)
+        return imported
+
+    def clean(self, path, chunk, clean_row):
+        """Return the valid rows of ``chunk`` as objects, reporting the others."""
+        cleaned = []
+        for number, row in chunk:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                cleaned.append(clean_row(row))
+            except RowError as e:
+                self.skipped += 1
+                self.stderr.write(f'{path}:{number}: {e}')
+        return cleaned
+
+    clean_customers = staticmethod(clean_customer)
+    clean_products = staticmethod(clean_product)
+
+    def clean_orders(self, row):
+        email = text(row, 'customer_email')
+        customer_id = self.customer_ids.get(email)
+        if customer_id is None:
+            raise RowError(f'Unknown customer {email}.')
+        # A product listed twice is one item with the quantities added up.
+        quantities = Counter()
+        total = Decimal('0')
+        for name, quantity in parse_items(row.get('items')):
+            if name not in self.products:
+                raise RowError(f'Unknown product {name}.')
+            if self.products[name] is None:
+                raise RowError(f'Product name {name} is ambiguous.')
+            product_id, price = self.products[name]
+            quantities[product_id] += quantity
+            total += price * quantity
+        items = list(quantities.items())
+        try:
+            total_amount = Decimal(text(row, 'total_amount', False) or total)
+        except InvalidOperation:
+            raise RowError('Invalid total_amount.')
+        order = Order(customer_id=customer_id, total_amount=total_amount,
+                      order_date=parse_order_date(text(row, 'order_date', False)))
+        return order, items
+
+    def build_indexes(self):
+        """Load the email -> id and product name -> (id, price) lookups orders resolve against."""
+        self.customer_ids = dict(
+            Customer.objects.values_list('email', 'id').iterator(chunk_size=self.batch_size)
+        )
+        self.products = {}
+        for product_id, name, price in Product.objects.values_list('id', 'name', 'price').iterator(
+            chunk_size=self.batch_size
+        ):
+            # Names are not unique; orders cannot refer to a repeated one.
+            self.products[name] = None if name in self.products else (product_id, price)
+
+    def insert_customers(self, customers, checkpoint):
+        seen = set()
+        rows = []
+        existing = set(
+            Customer.objects.filter(email__in=[c.email for c in customers]).values_list('email', flat=True)
+        )
+        for customer in customers:
+            if customer.email in existing or customer.email in seen:
+                self.skipped += 1
+                self.stderr.write(f'Email {customer.email} already exists.')
+                continue
+            seen.add(customer.email)
+            rows.append(customer)
+        Customer.objects.bulk_create(rows)
+        if rows:
+            rows_bulk_created(Customer, len(rows))
+        return len(rows)
+
+    def insert_products(self, products, checkpoint):
+        Product.objects.bulk_create(products)
+        if products:
+            rows_bulk_created(Product, len(products))
+        return len(products)
+
+    def insert_orders(self, orders, checkpoint):
+        bulk_create_orders(orders, batch_size=self.batch_size)
+        if orders:
+            days = [rollups.order_day(order.order_date) for order, _ in orders]
+            checkpoint.first_day = min(filter(None, (checkpoint.first_day, min(days))))
+            checkpoint.last_day = max(filter(None, (checkpoint.last_day, max(days))))
+        return len(orders)
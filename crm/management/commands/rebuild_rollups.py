@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm import rollups
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups for a range of days from the order and archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='First day to rebuild (default: first order day)')
+        parser.add_argument('--end', type=parse_date, help='Last day to rebuild (default: last order day)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        first, last = rollups.order_date_bounds()
+        start = options['start'] or (first and rollups.order_day(first))
+        end = options['end'] or (last and rollups.order_day(last))
+        if start is None or end is None:
+            start = end = timezone.localdate()
+        if start > end:
+            raise CommandError('--start must not be after --end.')
+
+        rollups.rebuild(start, end, batch_size=options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rollups rebuilt for {start} to {end}.')
+        )
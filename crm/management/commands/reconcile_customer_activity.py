@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import rollups
+from crm.models import Customer
+from crm.signals import invalidate_responses
+
+COLUMNS = ('order_count', 'last_order_at', 'lifetime_value')
+
+
+class Command(BaseCommand):
+    help = "Check every customer's order count, last order date and lifetime value against the order table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=rollups.REFRESH_CHUNK,
+                            help='Customers compared per query')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        activity = rollups.customer_activity()
+        expected = {f'expected_{name}': activity[name] for name in COLUMNS}
+        customers = Customer.objects.annotate(**expected).order_by('pk')
+        fields = ['pk', *COLUMNS, *expected]
+        width = len(COLUMNS)
+
+        checked = 0
+        drifted = []
+        last_pk = 0
+        while True:
+            rows = list(customers.filter(pk__gt=last_pk).values_list(*fields)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            checked += len(rows)
+            stale = [row[0] for row in rows if row[1:width + 1] != row[width + 1:]]
+            if stale and not options['dry_run']:
+                rollups.refresh_customers(stale)
+            drifted.extend(stale)
+
+        if drifted and not options['dry_run']:
+            invalidate_responses(Customer)
+        verb = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} customer(s); {len(drifted)} out of date {verb}.'
+        ))
+        if drifted and options['verbosity'] > 1:
+            self.stdout.write('Out of date: ' + ', '.join(map(str, drifted)))
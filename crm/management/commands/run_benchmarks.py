@@ -0,0 +1,92 @@
+import json
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from crm.benchmarks import CATALOG, DEFAULT_BASELINE, Runner, compare
+
+
+def parse_sizes(value):
+    try:
+        sizes = [int(size) for size in value.split(',')]
+    except ValueError:
+        raise CommandError(f'Invalid sizes "{value}", expected comma-separated order counts.')
+    if any(size < 1 for size in sizes):
+        raise CommandError('Sizes must be positive.')
+    return sizes
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the GraphQL catalog against generated datasets and compare with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=parse_sizes, default=[1000, 10000],
+                            help='Comma-separated dataset sizes, in orders (default: 1000,10000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per operation')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for generate_fixture_data')
+        parser.add_argument('--operations', help='Comma-separated operation names (default: all)')
+        parser.add_argument('--output', default='benchmark_results.json', help='Where to write the results')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline results to compare with; required unless --update-baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed latency and memory growth over the baseline, as a fraction')
+        parser.add_argument('--update-baseline', action='store_true', help='Save this run as the new baseline')
+
+    def handle(self, *args, **options):
+        operations = CATALOG
+        if options['operations']:
+            names = set(options['operations'].split(','))
+            operations = [operation for operation in CATALOG if operation.name in names]
+            unknown = names - {operation.name for operation in operations}
+            if unknown:
+                raise CommandError(f"Unknown operation(s): {', '.join(sorted(unknown))}.")
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive.')
+        baseline_path = Path(options['baseline'])
+        if not options['update_baseline'] and not baseline_path.exists():
+            # Comparing with nothing would pass whatever the results.
+            raise CommandError(
+                f'No baseline at {baseline_path}; run with --update-baseline to create one.'
+            )
+
+        # Generated data goes into a throwaway test database, never the real
+        # one, and DEBUG is off so query logging does not skew the timings.
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = {}
+            for size in options['sizes']:
+                self.stdout.write(f'Generating {size} orders...')
+                call_command(
+                    'generate_fixture_data', customers=max(size // 10, 1), products=max(size // 100, 20),
+                    orders=size, seed=options['seed'], clear=True, stdout=StringIO(),
+                )
+                results[str(size)] = Runner(operations, options['repeat']).run()
+                self.report(size, results[str(size)])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        Path(options['output']).write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+        self.stdout.write(f"Results written to {options['output']}.")
+
+        if options['update_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline_path}.'))
+            return
+        regressions = compare(results, json.loads(baseline_path.read_text()), options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def report(self, size, results):
+        self.stdout.write(f'{"operation":<28} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8} {"peak KB":>9}')
+        for name, measured in results.items():
+            self.stdout.write(
+                f"{name:<28} {measured['p50_ms']:>9.2f} {measured['p95_ms']:>9.2f} "
+                f"{measured['queries']:>8} {measured['peak_kb']:>9.1f}"
+            )
@@ -0,0 +1,66 @@
+from collections import Counter
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import slow_queries
+from crm.benchmarks import percentile
+from crm.instrumentation import fingerprint
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow-query log, worst statements first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Statements to show (default: 10)')
+        parser.add_argument('--sort', choices=('total', 'max', 'count'), default='total',
+                            help='Rank statements by total time, slowest run or number of runs')
+        parser.add_argument('--no-plans', action='store_true', help='Leave out the EXPLAIN plans')
+
+    def handle(self, *args, **options):
+        if options['top'] < 1:
+            raise CommandError('--top must be positive.')
+        try:
+            slow_queries.log_path()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        groups = {}
+        for entry in slow_queries.read_entries():
+            group = groups.setdefault(fingerprint(entry['sql']), {
+                'durations': [], 'origins': Counter(), 'slowest': entry,
+            })
+            group['durations'].append(entry['duration_ms'])
+            group['origins'][(entry.get('operation'), entry.get('field'))] += 1
+            if entry['duration_ms'] >= group['slowest']['duration_ms']:
+                group['slowest'] = entry
+        if not groups:
+            self.stdout.write(f'No slow queries recorded in {slow_queries.log_path()}.')
+            return
+
+        key = {
+            'total': lambda group: sum(group['durations']),
+            'max': lambda group: max(group['durations']),
+            'count': lambda group: len(group['durations']),
+        }[options['sort']]
+        ranked = sorted(groups.items(), key=lambda item: key(item[1]), reverse=True)
+
+        total = sum(len(group['durations']) for group in groups.values())
+        self.stdout.write(f'{total} slow statement(s) in {len(groups)} distinct shape(s).')
+        for rank, (sql, group) in enumerate(ranked[:options['top']], 1):
+            durations = group['durations']
+            (operation, field), _ = group['origins'].most_common(1)[0]
+            self.stdout.write('')
+            self.stdout.write(self.style.WARNING(
+                f'#{rank} count={len(durations)} total={sum(durations):.1f}ms '
+                f'max={max(durations):.1f}ms p95={percentile(durations, 0.95):.1f}ms'
+            ))
+            self.stdout.write(f'  origin: {operation or "-"} / {field or "-"}')
+            self.stdout.write(f'  sql: {sql}')
+            slowest = group['slowest']
+            if slowest.get('params') is not None:
+                self.stdout.write(f"  slowest params: {slowest['params']}")
+            if slowest.get('plan') and not options['no_plans']:
+                self.stdout.write('  plan:')
+                for line in slowest['plan'].splitlines():
+                    self.stdout.write(f'    {line}')
@@ -0,0 +1,399 @@
+import atexit
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import connection
+
+try:
+    import fcntl
+except ImportError:  # Windows: files of exited processes are kept
+    fcntl = None
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Holds the values of processes that have exited (see ``fold_exited``).
+EXITED_FILE = 'metrics-exited.json'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'crm_graphql_requests_total': ('counter', 'GraphQL operations executed.', None),
+    'crm_graphql_errors_total': ('counter', 'GraphQL operations that returned errors.', None),
+    'crm_graphql_request_duration_seconds': (
+        'histogram', 'Time to answer a GraphQL operation.', LATENCY_BUCKETS,
+    ),
+    'crm_db_queries_total': ('counter', 'SQL statements run while answering GraphQL operations.', None),
+    'crm_cache_requests_total': ('counter', 'Cache lookups by cache and result.', None),
+    'crm_cache_hit_ratio': ('gauge', 'Share of cache lookups that were hits.', None),
+    'crm_celery_tasks_total': ('counter', 'Celery tasks run, by final state.', None),
+    'crm_celery_task_failures_total': ('counter', 'Celery tasks that failed.', None),
+    'crm_celery_task_duration_seconds': ('histogram', 'Celery task run time.', TASK_BUCKETS),
+}
+
+
+def is_enabled():
+    return getattr(settings, 'CRM_METRICS_ENABLED', False)
+
+
+def metrics_dir():
+    return getattr(settings, 'CRM_METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'crm_metrics')
+
+
+def flush_interval():
+    return getattr(settings, 'CRM_METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+
+def known_operations():
+    return getattr(settings, 'CRM_METRICS_OPERATIONS', ())
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    """Counters and histograms of this process, shared through files.
+
+    Every process writes its values to its own file in ``CRM_METRICS_DIR``
+    at most once per ``CRM_METRICS_FLUSH_INTERVAL`` seconds, and a scrape
+    adds up the files of all processes, so web workers and Celery workers
+    report together without an external service. Values recorded since the
+    last write are written by a timer once the interval is over.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        if getattr(self, '_timer', None) is not None:
+            self._timer.cancel()
+        self.pid = os.getpid()
+        self.token = f'{socket.gethostname()}-{self.pid}-{uuid.uuid4().hex[:8]}'
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+        self.dirty = False
+        # Threads are not copied by fork, so a forked worker starts without one.
+        self._timer = None
+
+    def _check_fork(self):
+        # A forked worker starts from a copy of its parent's values.
+        if os.getpid() != self.pid:
+            self.reset()
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._check_fork()
+            key = (name, label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.dirty = True
+        self.maybe_flush()
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self._lock:
+            self._check_fork()
+            key = (name, label_key(labels))
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+            self.dirty = True
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, labels, dict(histogram, buckets=list(histogram['buckets']))]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    def path(self):
+        return os.path.join(metrics_dir(), f'metrics-{self.token}.json')
+
+    def maybe_flush(self):
+        wait = self.last_flush + flush_interval() - time.monotonic()
+        if wait <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(wait, self._flush_on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def flush(self):
+        """Write the values recorded since the last write, if any."""
+        self.last_flush = time.monotonic()
+        with self._lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+        directory = metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        write_snapshot(directory, os.path.basename(self.path()), self.snapshot())
+
+
+registry = Registry()
+
+
+@atexit.register
+def flush_at_exit():
+    if is_enabled():
+        registry.flush()
+
+
+def flush():
+    """Write this process's pending values now.
+
+    For processes that may end without running ``atexit`` handlers, such
+    as Celery's prefork children.
+    """
+    if is_enabled():
+        registry.flush()
+
+
+def inc(name, value=1, **labels):
+    if is_enabled():
+        registry.inc(name, labels, value)
+
+
+def observe(name, value, **labels):
+    if is_enabled():
+        registry.observe(name, labels, value)
+
+
+def record_cache(cache, hit):
+    inc('crm_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+class QueryCounter:
+    """``execute_wrapper`` that counts the statements sent to the database."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def name_operation(request, operation_ast, operation_name):
+    """Remember which operation ``request`` runs, for ``track_graphql``."""
+    if operation_ast is not None:
+        name = operation_name or (operation_ast.name.value if operation_ast.name else None)
+        request.graphql_operation = (operation_ast.operation.value, operation_label(name))
+
+
+def operation_label(name):
+    """The ``operation`` label for an operation name sent by a client.
+
+    Names outside ``CRM_METRICS_OPERATIONS`` share the ``other`` label, so
+    clients cannot add series without bound.
+    """
+    if name is None:
+        return 'anonymous'
+    return name if name in known_operations() else 'other'
+
+
+@contextmanager
+def track_graphql(request):
+    """Count and time the GraphQL operation answered inside the block.
+
+    The block sets ``outcome['error']`` when the operation returned errors.
+    """
+    outcome = {'error': False}
+    if not is_enabled():
+        yield outcome
+        return
+    request.graphql_operation = ('unknown', 'anonymous')
+    queries = QueryCounter()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(queries):
+            yield outcome
+    finally:
+        operation_type, operation = request.graphql_operation
+        labels = {'operation': operation, 'type': operation_type}
+        inc('crm_graphql_requests_total', **labels)
+        if outcome['error']:
+            inc('crm_graphql_errors_total', **labels)
+        inc('crm_db_queries_total', queries.count, **labels)
+        observe('crm_graphql_request_duration_seconds', time.perf_counter() - started, **labels)
+
+
+def read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # being replaced or removed
+
+
+def merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, histogram in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(
+                key, {'buckets': [0] * len(histogram['buckets']), 'sum': 0.0, 'count': 0}
+            )
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+    return counters, histograms
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # running as another user
+    return True
+
+
+def exited_files(directory, filenames):
+    """Files written by processes of this host that are no longer running."""
+    host = socket.gethostname()
+    for filename in filenames:
+        if not filename.startswith('metrics-') or not filename.endswith('.json'):
+            continue
+        parts = filename[len('metrics-'):-len('.json')].rsplit('-', 2)
+        if len(parts) == 3 and parts[0] == host and parts[1].isdigit() and not is_running(int(parts[1])):
+            yield filename
+
+
+@contextmanager
+def locked(directory, exclusive):
+    """Keep scrapes from reading the directory while ``fold_exited`` changes it."""
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def fold_exited(directory):
+    """Move the values of exited processes into one ``EXITED_FILE``.
+
+    Their files would otherwise pile up, one per worker ever started;
+    adding their values to ``EXITED_FILE`` instead of dropping them keeps
+    the counters from going backwards.
+    """
+    if fcntl is None or not any(exited_files(directory, os.listdir(directory))):
+        return
+    with locked(directory, exclusive=True):
+        paths = [os.path.join(directory, name) for name in exited_files(directory, os.listdir(directory))]
+        snapshots = [snapshot for snapshot in map(read_snapshot, paths) if snapshot is not None]
+        exited = read_snapshot(os.path.join(directory, EXITED_FILE))
+        counters, histograms = merge([*snapshots, *([exited] if exited else [])])
+        write_snapshot(directory, EXITED_FILE, {
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, histogram] for (name, labels), histogram in histograms.items()],
+        })
+        for path in paths:
+            os.remove(path)
+
+
+def write_snapshot(directory, filename, snapshot):
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(temporary, os.path.join(directory, filename))
+
+
+def collect():
+    """Add up the values of every process, with this one's taken live."""
+    snapshots = [registry.snapshot()]
+    own = os.path.basename(registry.path())
+    directory = metrics_dir()
+    if os.path.isdir(directory):
+        fold_exited(directory)
+        with locked(directory, exclusive=False) if fcntl else nullcontext():
+            for filename in os.listdir(directory):
+                if filename.startswith('metrics-') and filename != own:
+                    snapshot = read_snapshot(os.path.join(directory, filename))
+                    if snapshot is not None:
+                        snapshots.append(snapshot)
+    return merge(snapshots)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    counters, histograms = collect()
+
+    hits = {}
+    for (name, labels), value in counters.items():
+        if name == 'crm_cache_requests_total':
+            labels = dict(labels)
+            lookups = hits.setdefault(labels['cache'], [0, 0])
+            lookups[0] += value if labels['result'] == 'hit' else 0
+            lookups[1] += value
+    gauges = {
+        ('crm_cache_hit_ratio', (('cache', cache),)): hit / total
+        for cache, (hit, total) in hits.items() if total
+    }
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, histogram['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+                lines.append(f"{name}_bucket{format_labels(labels, le='+Inf')} {histogram['count']}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        else:
+            values = gauges if kind == 'gauge' else counters
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,125 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def fill_rollups(apps, schema_editor):
+    """Roll up the existing orders, as ``crm.rollups.rebuild`` does."""
+    Order = apps.get_model('crm', 'Order')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    orders = Order.objects.annotate(day=TruncDate('order_date')).order_by()
+    items = OrderItem.objects.annotate(day=TruncDate('order__order_date')).order_by()
+    totals = {'order_count': Count('pk'), 'revenue': Sum('total_amount')}
+
+    DailySalesRollup = apps.get_model('crm', 'DailySalesRollup')
+    DailySalesRollup.objects.bulk_create(
+        (DailySalesRollup(**row) for row in orders.values('day').annotate(**totals)), batch_size=1000
+    )
+    DailyCustomerSalesRollup = apps.get_model('crm', 'DailyCustomerSalesRollup')
+    DailyCustomerSalesRollup.objects.bulk_create(
+        (DailyCustomerSalesRollup(**row) for row in orders.values('day', 'customer_id').annotate(**totals)),
+        batch_size=1000,
+    )
+    DailyProductSalesRollup = apps.get_model('crm', 'DailyProductSalesRollup')
+    DailyProductSalesRollup.objects.bulk_create(
+        (DailyProductSalesRollup(**row)
+         for row in items.values('day', 'product_id').annotate(order_count=Count('pk'))),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    """Tables added since the original schema, and quantities on order items.
+
+    The order/product link table keeps its name: the implicit many-to-many
+    becomes the ``OrderItem`` model without touching the database, then
+    gains its ``quantity`` column.
+    """
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=100, unique=True)),
+                ('rows', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyProductSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='crm.product')),
+            ],
+            options={
+                'unique_together': {('day', 'product')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCustomerSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='crm.customer')),
+            ],
+            options={
+                'unique_together': {('day', 'customer')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500, unique=True)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('first_day', models.DateField(blank=True, null=True)),
+                ('last_day', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderItem',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.order')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.product')),
+                    ],
+                    options={
+                        'db_table': 'crm_order_products',
+                        'unique_together': {('order', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='products',
+                    field=models.ManyToManyField(related_name='orders', through='crm.OrderItem', to='crm.product'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+from django.db import OperationalError, migrations
+
+# table -> (search table, indexed columns); mirrors crm.search.INDEXES.
+SEARCH_INDEXES = {
+    'crm_customer': ('crm_customer_search', ('name', 'email')),
+    'crm_product': ('crm_product_search', ('name',)),
+}
+
+
+def sqlite_statements(table, search_table, columns):
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = (
+        f"INSERT INTO {search_table}({search_table}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    )
+    insert = f'INSERT INTO {search_table}(rowid, {names}) VALUES (new.id, {new});'
+    return [
+        # External content: the FTS table indexes the rows without a copy of them.
+        f"CREATE VIRTUAL TABLE {search_table} USING fts5({names}, content='{table}', "
+        f"content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER {search_table}_insert AFTER INSERT ON {table} BEGIN {insert} END',
+        f'CREATE TRIGGER {search_table}_delete AFTER DELETE ON {table} BEGIN {delete} END',
+        f'CREATE TRIGGER {search_table}_update AFTER UPDATE OF {names} ON {table} '
+        f'BEGIN {delete} {insert} END',
+        f"INSERT INTO {search_table}({search_table}) VALUES ('rebuild')",
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, (search_table, columns) in SEARCH_INDEXES.items():
+            for column in columns:
+                # Matches the UPPER(...) LIKE UPPER(...) that icontains compiles to.
+                schema_editor.execute(
+                    f'CREATE INDEX {table}_{column}_trgm ON {table} '
+                    f'USING gin (UPPER({column}) gin_trgm_ops)'
+                )
+    elif vendor == 'sqlite':
+        for table, (search_table, columns) in SEARCH_INDEXES.items():
+            try:
+                statements = sqlite_statements(table, search_table, columns)
+                schema_editor.execute(statements[0])
+            except OperationalError:
+                return  # SQLite built without FTS5: search falls back to LIKE.
+            for statement in statements[1:]:
+                schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, (search_table, columns) in SEARCH_INDEXES.items():
+        if vendor == 'postgresql':
+            for column in columns:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+        elif vendor == 'sqlite':
+            for suffix in ('insert', 'delete', 'update'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {search_table}_{suffix}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {search_table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
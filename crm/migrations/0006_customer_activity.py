@@ -0,0 +1,64 @@
+# Generated by Django 4.2.24 on 2026-10-18 04:29
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_customer_activity(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+    orders = Order.objects.filter(customer_id=OuterRef('pk')).order_by().values('customer_id')
+    Customer.objects.update(
+        order_count=Coalesce(
+            Subquery(orders.annotate(n=Count('pk')).values('n'), output_field=models.IntegerField()), 0
+        ),
+        lifetime_value=Coalesce(
+            Subquery(orders.annotate(total=Sum('total_amount')).values('total')),
+            Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        ),
+        last_order_at=Subquery(
+            Order.objects.filter(customer_id=OuterRef('pk')).order_by('-order_date').values('order_date')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_phone_digits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_value',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['last_order_at', 'id'], name='crm_customer_last_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['lifetime_value', 'id'], name='crm_customer_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['order_count', 'id'], name='crm_customer_order_count_idx'),
+        ),
+        migrations.RunPython(fill_customer_activity, migrations.RunPython.noop),
+    ]
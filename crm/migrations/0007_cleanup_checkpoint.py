@@ -0,0 +1,23 @@
+# Generated by Django 4.2.24 on 2026-10-18 04:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_customer_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleanupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cutoff', models.DateTimeField()),
+                ('last_customer_id', models.BigIntegerField(default=0)),
+                ('deleted', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,27 +1,242 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+
+from .validators import normalize_phone
+
+
+class CustomerQuerySet(models.QuerySet):
+    # bulk_create, bulk_update and update skip save(), which keeps
+    # phone_digits up to date, so they fill it in themselves.
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for customer in objs:
+            customer.phone_digits = normalize_phone(customer.phone)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if 'phone' in fields:
+            for customer in objs:
+                customer.phone_digits = normalize_phone(customer.phone)
+            fields = [*fields, 'phone_digits']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        # Unless phone_digits is given too, it is derived from a literal phone;
+        # an expression cannot be normalized in Python.
+        if 'phone' in kwargs and 'phone_digits' not in kwargs:
+            phone = kwargs['phone']
+            if phone is not None and not isinstance(phone, str):
+                raise TypeError("Customer phone can only be updated to a string or None.")
+            kwargs['phone_digits'] = normalize_phone(phone)
+        return super().update(**kwargs)
+
 
 class Customer(models.Model):
     name = models.CharField(max_length=100)  # ✅ Changed to 100
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # ``phone`` normalized by ``normalize_phone``, for indexed phone lookups.
+    phone_digits = models.CharField(max_length=20, blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Activity, maintained with every order write (see crm.rollups).
+    order_count = models.IntegerField(default=0, editable=False)
+    last_order_at = models.DateTimeField(null=True, blank=True, editable=False)
+    lifetime_value = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+
+    objects = CustomerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # created_at ranges and the keyset sort (see crm.pagination).
+            models.Index(fields=['created_at', 'id'], name='crm_customer_created_idx'),
+            models.Index(fields=['phone_digits'], name='crm_customer_phone_idx'),
+            # Activity filters and sortBy sorts.
+            models.Index(fields=['last_order_at', 'id'], name='crm_customer_last_order_idx'),
+            models.Index(fields=['lifetime_value', 'id'], name='crm_customer_value_idx'),
+            models.Index(fields=['order_count', 'id'], name='crm_customer_order_count_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.phone_digits = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits'}
+        super().save(*args, **kwargs)
+
 class Product(models.Model):
     name = models.CharField(max_length=100)  # ✅ Changed to 100
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+            # Small enough to stay cached for the lowStock filter and restocking.
+            models.Index(fields=['id'], condition=Q(stock__lt=10), name='crm_product_low_stock_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-    products = models.ManyToManyField(Product, related_name='orders')
+    products = models.ManyToManyField(Product, related_name='orders', through='OrderItem')
     order_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    class Meta:
+        indexes = [
+            # order_date ranges and the keyset sort (see crm.pagination).
+            models.Index(fields=['order_date', 'id'], name='crm_order_date_idx'),
+            # A customer's orders by date: the orders loader and inactive-customer cleanup.
+            models.Index(fields=['customer', 'order_date'], name='crm_order_customer_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.id} by {self.customer.name}"
+
+    def save(self, *args, **kwargs):
+        # Keep the rollups updated by post_save in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+class OrderItem(models.Model):
+    """A product on an order and how many units of it were ordered."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # Same table as the implicit many-to-many it replaces.
+        db_table = 'crm_order_products'
+        unique_together = ('order', 'product')
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} on order {self.order_id}"
+
+class ArchivedOrder(models.Model):
+    """An order moved out of ``Order`` by ``archive_orders`` (see crm.archive).
+
+    It keeps its id, so global IDs and cursors issued for it stay valid.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='archived_orders')
+    products = models.ManyToManyField(Product, related_name='archived_orders', through='ArchivedOrderItem')
+    order_date = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date', 'id'], name='crm_archived_order_date_idx'),
+            models.Index(fields=['customer', 'order_date'], name='crm_archived_customer_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.id}"
+
+    def as_order(self):
+        """This row as an ``Order`` instance flagged ``archived``, for the order resolvers."""
+        # Columns deferred here stay deferred on the order.
+        deferred = self.get_deferred_fields()
+        names = [f.attname for f in Order._meta.concrete_fields if f.attname not in deferred]
+        order = Order.from_db(self._state.db, names, [getattr(self, name) for name in names])
+        order.archived = True
+        if ArchivedOrder.customer.is_cached(self):
+            order.customer = self.customer
+        if hasattr(self, '_prefetched_objects_cache'):
+            order._prefetched_objects_cache = self._prefetched_objects_cache
+        return order
+
+class ArchivedOrderItem(models.Model):
+    """A product on an archived order, moved along with it."""
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('order', 'product')
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} on archived order {self.order_id}"
+
+class TableCount(models.Model):
+    """Maintained row count of a model, used for unfiltered totalCount."""
+    table = models.CharField(max_length=100, unique=True)
+    rows = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.table}: {self.rows}"
+
+
+class ImportCheckpoint(models.Model):
+    """How far a bulk import has got through one source file.
+
+    Saved in the same transaction as each imported chunk, so a resumed
+    import neither skips nor repeats rows.
+    """
+    source = models.CharField(max_length=500, unique=True)
+    rows = models.BigIntegerField(default=0)
+    first_day = models.DateField(null=True, blank=True)
+    last_day = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.rows} rows"
+
+
+class CleanupCheckpoint(models.Model):
+    """Where an interrupted inactive-customer cleanup stopped.
+
+    A rerun continues the same sweep, with the same cutoff, after the last
+    customer of the last committed batch.
+    """
+    cutoff = models.DateTimeField()
+    last_customer_id = models.BigIntegerField(default=0)
+    deleted = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cleanup before {self.cutoff}: up to customer {self.last_customer_id}"
+
+
+class DailySalesRollup(models.Model):
+    """Orders and revenue per day, maintained as orders are written."""
+    day = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.order_count} orders"
+
+
+class DailyProductSalesRollup(models.Model):
+    """Orders containing a product, per product and day."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'product')
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.order_count} orders"
+
+
+class DailyCustomerSalesRollup(models.Model):
+    """Orders and spend per customer and day."""
+    day = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='daily_sales')
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('day', 'customer')
+
     def __str__(self):
-        return f"Order {self.id} by {self.customer.name}"
\ No newline at end of file
+        return f"{self.day} {self.customer_id}: {self.order_count} orders"
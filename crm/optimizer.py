@@ -0,0 +1,115 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+PAGINATION_ARGS = {'first', 'last', 'before', 'after', 'offset'}
+
+# Relations left to the request loaders: a prefetch would only read the
+# hot order table, not the archive (see crm.archive).
+LOADED_RELATIONS = {('crm.Customer', 'orders'), ('crm.Product', 'orders')}
+
+
+def collect_fields(info, selection_sets):
+    """Group the fields of ``selection_sets`` by name, flattening fragments.
+
+    Aliases are ignored: two aliases of the same field need the same data.
+    """
+    fields = {}
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+                continue
+            if isinstance(selection, InlineFragmentNode):
+                nested = collect_fields(info, [selection.selection_set])
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = info.fragments[selection.name.value]
+                nested = collect_fields(info, [fragment.selection_set])
+            else:
+                continue
+            for name, nodes in nested.items():
+                fields.setdefault(name, []).extend(nodes)
+    return fields
+
+
+def node_fields(info, connection_nodes):
+    """Return the fields selected under ``edges { node { ... } }``."""
+    edges = collect_fields(info, [n.selection_set for n in connection_nodes]).get('edges', [])
+    nodes = collect_fields(info, [n.selection_set for n in edges]).get('node', [])
+    return collect_fields(info, [n.selection_set for n in nodes])
+
+
+def is_filtered(field_nodes):
+    return any(
+        argument.name.value not in PAGINATION_ARGS
+        for node in field_nodes
+        for argument in node.arguments
+    )
+
+
+def plan(info, model, fields, prefix=''):
+    """Work out which columns and relations a selection needs.
+
+    Returns ``(only, select_related, prefetch_related)``; ``only`` is None
+    when the selection contains fields that are not plain model columns,
+    since their resolvers may read any attribute.
+    """
+    only = [prefix + model._meta.pk.name]
+    select_related = []
+    prefetch_related = []
+
+    for name, nodes in fields.items():
+        if name.startswith('__'):
+            continue
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            only = None
+            continue
+
+        path = prefix + field.name
+        if field.many_to_many or field.one_to_many:
+            if is_filtered(nodes) or (model._meta.label, field.name) in LOADED_RELATIONS:
+                continue
+            # Reverse foreign keys are matched up on the child's FK column.
+            extra = (field.field.attname,) if field.one_to_many else ()
+            queryset = optimize(info, field.related_model._default_manager.all(),
+                                node_fields(info, nodes), extra)
+            prefetch_related.append(Prefetch(path, queryset=queryset))
+        elif field.is_relation:
+            nested = collect_fields(info, [n.selection_set for n in nodes])
+            nested_only, nested_select, nested_prefetch = plan(
+                info, field.related_model, nested, path + '__'
+            )
+            select_related.append(path)
+            select_related.extend(nested_select)
+            prefetch_related.extend(nested_prefetch)
+            if only is not None:
+                only.append(path)
+                only = only + nested_only if nested_only is not None else None
+        elif only is not None:
+            only.append(path)
+
+    return only, select_related, prefetch_related
+
+
+def optimize(info, queryset, fields, extra=()):
+    only, select_related, prefetch_related = plan(info, queryset.model, fields)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    if only is not None:
+        queryset = queryset.only(*only, *extra)
+    return queryset
+
+
+def optimize_queryset(queryset, info, extra=()):
+    """Trim ``queryset`` to what the connection's ``edges.node`` selection needs.
+
+    ``extra`` names columns the caller reads itself, such as sort keys.
+    """
+    return optimize(info, queryset, node_fields(info, info.field_nodes), extra)
@@ -0,0 +1,125 @@
+import base64
+import binascii
+import json
+from decimal import Decimal
+
+import graphene
+from django.db.models import F, Q
+
+from .models import ArchivedOrder, Customer, Order, Product
+
+# Columns each model is paginated on; the primary key always comes last
+# so the key is unique and pages never overlap or skip rows.
+KEYSET_FIELDS = {
+    Order: ('order_date', 'id'),
+    ArchivedOrder: ('order_date', 'id'),
+    Customer: ('created_at', 'id'),
+    Product: ('id',),
+}
+
+# Further sorts offered through a connection's ``sortBy`` argument.
+SORT_KEYS = {
+    Customer: {
+        'created_at': ('created_at', 'id'),
+        'last_order_at': ('last_order_at', 'id'),
+        'lifetime_value': ('lifetime_value', 'id'),
+        'order_count': ('order_count', 'id'),
+    },
+}
+
+
+class SortDirection(graphene.Enum):
+    ASC = 'asc'
+    DESC = 'desc'
+
+
+class CustomerSortField(graphene.Enum):
+    CREATED_AT = 'created_at'
+    LAST_ORDER_AT = 'last_order_at'
+    LIFETIME_VALUE = 'lifetime_value'
+    ORDER_COUNT = 'order_count'
+
+
+class Keyset:
+    """The active sort of a keyset-paginated connection.
+
+    Cursors carry the sort they were issued for together with the key of
+    their row, so ``after``/``before`` become range predicates on the
+    (indexed) sort columns instead of an ``OFFSET`` scan. NULLs sort
+    before every other value, on every database.
+    """
+
+    def __init__(self, model, direction=SortDirection.ASC.value, sort_by=None):
+        self.model = model
+        self.fields = SORT_KEYS[model][sort_by] if sort_by else KEYSET_FIELDS[model]
+        self.descending = direction == SortDirection.DESC.value
+
+    def nullable(self, name):
+        return self.model._meta.get_field(name).null
+
+    @property
+    def spec(self):
+        prefix = '-' if self.descending else ''
+        return ','.join(prefix + name for name in self.fields)
+
+    def ordering(self, reverse=False):
+        descending = self.descending != reverse
+        ordering = []
+        for name in self.fields:
+            if self.nullable(name):
+                ordering.append(F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_first=True))
+            else:
+                ordering.append(('-' if descending else '') + name)
+        return ordering
+
+    def key(self, obj):
+        return [getattr(obj, name) for name in self.fields]
+
+    def cursor(self, obj):
+        key = [
+            value.isoformat() if hasattr(value, 'isoformat')
+            else str(value) if isinstance(value, Decimal) else value
+            for value in self.key(obj)
+        ]
+        payload = json.dumps({'sort': self.spec, 'key': key}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            sort, key = payload['sort'], payload['key']
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise Exception("Invalid cursor.")
+        if sort != self.spec or len(key) != len(self.fields):
+            raise Exception("Cursor does not match the requested sort.")
+        return [
+            self.model._meta.get_field(name).to_python(value)
+            for name, value in zip(self.fields, key)
+        ]
+
+    def seek(self, cursor, forward=True):
+        """Return the predicate for rows strictly after (or before) ``cursor``.
+
+        ``(a, b) > (x, y)`` is expanded to ``a > x OR (a = x AND b > y)``.
+        """
+        values = self.decode(cursor)
+        after = forward != self.descending
+        predicate = Q()
+        for i, name in enumerate(self.fields):
+            equal = Q()
+            for field, value in zip(self.fields[:i], values):
+                equal &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+            predicate |= equal & self.beyond(name, values[i], after)
+        return predicate
+
+    def beyond(self, name, value, after):
+        """Rows whose ``name`` sorts strictly after (or before) ``value``."""
+        if value is None:
+            # Nothing sorts before NULL.
+            return Q(**{f'{name}__isnull': False}) if after else Q(pk__in=[])
+        if after:
+            return Q(**{f'{name}__gt': value})
+        predicate = Q(**{f'{name}__lt': value})
+        if self.nullable(name):
+            predicate |= Q(**{f'{name}__isnull': True})
+        return predicate
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import get_named_type, print_ast
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode, OperationDefinitionNode
+
+from .documents import LRUCache
+
+DEFAULT_SIZE = 1024
+DEFAULT_TIMEOUT = 300
+
+# Object types that are not backed by a model but are computed from one.
+TYPE_DEPENDENCIES = {
+    'OrderStatsType': ('crm.Order',),
+    'DailyRevenueType': ('crm.Order',),
+}
+
+
+def is_enabled():
+    return getattr(settings, 'CRM_RESPONSE_CACHE_ENABLED', False)
+
+
+class LocalBackend:
+    """Bounded in-process LRU; invalidations only reach this process.
+
+    Entries expire after ``timeout`` seconds (never when it is None).
+    """
+
+    def __init__(self, maxsize, timeout=DEFAULT_TIMEOUT):
+        self.entries = LRUCache(maxsize)
+        self.timeout = timeout
+        self.versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and time.monotonic() >= expires:
+            return None
+        return value
+
+    def set(self, key, value):
+        expires = None if self.timeout is None else time.monotonic() + self.timeout
+        self.entries.set(key, (expires, value))
+
+    def get_versions(self, tags):
+        return {tag: self.versions.get(tag, 0) for tag in tags}
+
+    def bump(self, tag):
+        with self._lock:
+            self.versions[tag] = self.versions.get(tag, 0) + 1
+
+    def clear(self):
+        self.entries.clear()
+        self.versions.clear()
+
+
+class DjangoCacheBackend:
+    """Shared backend on top of a Django cache alias (e.g. Redis or Memcached)."""
+
+    def __init__(self, alias, timeout):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(f'crm:response:{key}')
+
+    def set(self, key, value):
+        self.cache.set(f'crm:response:{key}', value, self.timeout)
+
+    def get_versions(self, tags):
+        keys = {f'crm:version:{tag}': tag for tag in tags}
+        found = self.cache.get_many(list(keys))
+        return {tag: found.get(key, 0) for key, tag in keys.items()}
+
+    def bump(self, tag):
+        key = f'crm:version:{tag}'
+        if not self.cache.add(key, 1, None):
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, 1, None)
+
+    def clear(self):
+        self.cache.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            alias = getattr(settings, 'CRM_RESPONSE_CACHE_BACKEND', None)
+            timeout = getattr(settings, 'CRM_RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+            if alias:
+                _backend = DjangoCacheBackend(alias, timeout)
+            else:
+                _backend = LocalBackend(getattr(settings, 'CRM_RESPONSE_CACHE_SIZE', DEFAULT_SIZE), timeout)
+        return _backend
+
+
+def dependencies(schema, document, operation):
+    """Return the labels of the models an operation reads from."""
+    tags = set()
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if not isinstance(definition, OperationDefinitionNode)
+    }
+
+    def visit(parent_type, selection_set, seen):
+        for selection in selection_set.selections:
+            if isinstance(selection, InlineFragmentNode):
+                condition = selection.type_condition
+                fragment_type = schema.get_type(condition.name.value) if condition else parent_type
+                visit(fragment_type, selection.selection_set, seen)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                if name in fragments and name not in seen:
+                    fragment = fragments[name]
+                    visit(schema.get_type(fragment.type_condition.name.value),
+                          fragment.selection_set, seen | {name})
+            elif isinstance(selection, FieldNode):
+                fields = getattr(parent_type, 'fields', None) or {}
+                field = fields.get(selection.name.value)
+                if field is None or selection.selection_set is None:
+                    continue
+                field_type = get_named_type(field.type)
+                meta = getattr(getattr(field_type, 'graphene_type', None), '_meta', None)
+                # A connection reads its node's model, even for totalCount alone.
+                node = getattr(meta, 'node', None)
+                if node is not None:
+                    meta = getattr(node, '_meta', None)
+                model = getattr(meta, 'model', None)
+                if model is not None:
+                    tags.add(model._meta.label)
+                tags.update(TYPE_DEPENDENCIES.get(field_type.name, ()))
+                visit(field_type, selection.selection_set, seen)
+
+    visit(schema.get_root_type(operation.operation), operation.selection_set, frozenset())
+    return sorted(tags)
+
+
+def cache_key(document, operation_name, variables, versions):
+    payload = json.dumps(
+        [print_ast(document), operation_name, variables or {}, versions],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Lookup helper for one query operation."""
+
+    def __init__(self, schema, document, operation, operation_name, variables):
+        self.backend = get_backend()
+        tags = dependencies(schema, document, operation)
+        self.key = cache_key(
+            document, operation_name, variables, self.backend.get_versions(tags)
+        )
+
+    def get(self):
+        return self.backend.get(self.key)
+
+    def set(self, data):
+        self.backend.set(self.key, data)
+
+
+def invalidate(label):
+    """Make every cached response that read ``label`` unreachable."""
+    if is_enabled():
+        get_backend().bump(label)
@@ -0,0 +1,257 @@
+import datetime
+import operator
+from decimal import Decimal
+from functools import reduce
+
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from .models import (
+    ArchivedOrder,
+    Customer,
+    DailyCustomerSalesRollup,
+    DailyProductSalesRollup,
+    DailySalesRollup,
+    Order,
+)
+
+
+def order_day(order_date):
+    return timezone.localdate(order_date)
+
+
+def bump(model, lookup, create=True, **deltas):
+    """Add ``deltas`` to the rollup row matching ``lookup``, creating it if needed.
+
+    Subtractions pass ``create=False``: a missing row has nothing to take
+    away from, and recreating it could point at a row being deleted.
+    """
+    changes = {name: F(name) + value for name, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**changes) or not create:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another writer created the row first.
+        model.objects.filter(**lookup).update(**changes)
+
+
+def record_order(day, customer_id, total_amount, sign=1):
+    """Add (or with ``sign=-1`` remove) one order to the day and customer rollups."""
+    total_amount = Decimal(str(total_amount))
+    bump(DailySalesRollup, {'day': day}, create=sign > 0,
+         order_count=sign, revenue=sign * total_amount)
+    bump(DailyCustomerSalesRollup, {'day': day, 'customer_id': customer_id}, create=sign > 0,
+         order_count=sign, revenue=sign * total_amount)
+
+
+def record_products(day, product_ids, sign=1):
+    """Count one order for each product, with a constant number of queries."""
+    product_ids = set(product_ids)
+    rows = DailyProductSalesRollup.objects.filter(day=day)
+    existing = set(rows.filter(product_id__in=product_ids).values_list('product_id', flat=True))
+    if existing:
+        rows.filter(product_id__in=existing).update(order_count=F('order_count') + sign)
+    missing = product_ids - existing
+    if not missing or sign < 0:
+        return
+    try:
+        with transaction.atomic():
+            DailyProductSalesRollup.objects.bulk_create(
+                DailyProductSalesRollup(day=day, product_id=product_id, order_count=sign)
+                for product_id in missing
+            )
+    except IntegrityError:
+        # Another writer created some of the rows first.
+        for product_id in missing:
+            bump(DailyProductSalesRollup, {'day': day, 'product_id': product_id}, order_count=sign)
+
+
+# Orders live in one of these tables (see crm.archive); activity and
+# rollups are computed over both.
+ORDER_MODELS = (Order, ArchivedOrder)
+
+
+def latest_order_date():
+    dates = [
+        Subquery(model.objects.filter(customer_id=OuterRef('pk')).order_by('-order_date').values('order_date')[:1])
+        for model in ORDER_MODELS
+    ]
+    # GREATEST is NULL on some databases when either side is.
+    return Coalesce(Greatest(*dates), *dates)
+
+
+def record_customer_order(customer_id, order_date, total_amount, sign=1):
+    """Add (or with ``sign=-1`` remove) one order to its customer's activity columns."""
+    total_amount = Decimal(str(total_amount))
+    if sign > 0:
+        when = Value(order_date)
+        last_order_at = Greatest(Coalesce('last_order_at', when), when)
+    else:
+        # The removed order may have been the latest: look the date up again.
+        last_order_at = latest_order_date()
+    Customer.objects.filter(pk=customer_id).update(
+        order_count=F('order_count') + sign,
+        lifetime_value=F('lifetime_value') + sign * total_amount,
+        last_order_at=last_order_at,
+    )
+
+
+def customer_activity():
+    """Expressions computing each customer's activity columns from its orders, archived ones included."""
+    counts, values = [], []
+    for model in ORDER_MODELS:
+        orders = model.objects.filter(customer_id=OuterRef('pk')).order_by().values('customer_id')
+        counts.append(Coalesce(
+            Subquery(orders.annotate(n=Count('pk')).values('n'), output_field=IntegerField()), 0
+        ))
+        values.append(Coalesce(
+            Subquery(orders.annotate(total=Sum('total_amount')).values('total')),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ))
+    return {
+        'order_count': reduce(operator.add, counts),
+        'lifetime_value': reduce(operator.add, values),
+        'last_order_at': latest_order_date(),
+    }
+
+
+# Below SQLite's limit on parameters per statement.
+REFRESH_CHUNK = 500
+
+
+def refresh_customers(customer_ids):
+    """Recompute the activity columns of ``customer_ids`` from the order table.
+
+    For writers that skip the order signals, such as ``bulk_create``.
+    """
+    customer_ids = sorted(set(customer_ids))
+    for start in range(0, len(customer_ids), REFRESH_CHUNK):
+        Customer.objects.filter(pk__in=customer_ids[start:start + REFRESH_CHUNK]).update(
+            **customer_activity()
+        )
+
+
+def day_bounds(start, end):
+    """Return the aware datetimes spanning local days ``start`` to ``end`` inclusive."""
+    tz = timezone.get_current_timezone()
+    lower = datetime.datetime.combine(start, datetime.time.min, tzinfo=tz)
+    upper = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz)
+    return lower, upper
+
+
+def order_date_bounds():
+    """First and last ``order_date`` across the hot and archived orders."""
+    bounds = [model.objects.aggregate(first=Min('order_date'), last=Max('order_date')) for model in ORDER_MODELS]
+    firsts = [b['first'] for b in bounds if b['first'] is not None]
+    lasts = [b['last'] for b in bounds if b['last'] is not None]
+    return min(firsts, default=None), max(lasts, default=None)
+
+
+def grouped(querysets, keys, **aggregates):
+    """Group each queryset by ``keys`` and add up the groups they share.
+
+    A day can have orders in both the hot and the archive table.
+    """
+    totals = {}
+    for queryset in querysets:
+        for row in queryset.values(*keys).annotate(**aggregates).order_by():
+            key = tuple(row[name] for name in keys)
+            if key in totals:
+                for name in aggregates:
+                    totals[key][name] += row[name]
+            else:
+                totals[key] = row
+    return totals.values()
+
+
+# Rollup rows adjusted per UPDATE, keeping its parameters below SQLite's limit.
+SUBTRACT_CHUNK = 100
+
+
+def subtract(model, rows, keys, fields):
+    """Take each row's ``fields`` away from the ``model`` rollup row sharing its ``keys``.
+
+    Rows are applied in chunks, one ``UPDATE ... CASE`` each.
+    """
+    rows = list(rows)
+    for start in range(0, len(rows), SUBTRACT_CHUNK):
+        chunk = rows[start:start + SUBTRACT_CHUNK]
+        matches = [Q(**{name: row[name] for name in keys}) for row in chunk]
+        model.objects.filter(reduce(operator.or_, matches)).update(**{
+            name: F(name) - Case(*(When(match, then=Value(row[name])) for match, row in zip(matches, chunk)))
+            for name in fields
+        })
+
+
+def remove_customer_orders(customer_ids):
+    """Take every order of ``customer_ids`` out of the day and product rollups.
+
+    For deleting customers with their orders in bulk, skipping the
+    per-order signals. Their own customer rollup rows are left to be
+    deleted with them.
+    """
+    orders = [model.objects.filter(customer_id__in=customer_ids).annotate(day=TruncDate('order_date'))
+              for model in ORDER_MODELS]
+    through = [
+        model.products.through.objects.filter(order__customer_id__in=customer_ids).annotate(
+            day=TruncDate('order__order_date')
+        )
+        for model in ORDER_MODELS
+    ]
+    subtract(DailySalesRollup, grouped(
+        orders, ['day'], order_count=Count('pk'), revenue=Sum('total_amount')
+    ), ['day'], ['order_count', 'revenue'])
+    subtract(DailyProductSalesRollup, grouped(
+        through, ['day', 'product_id'], order_count=Count('pk')
+    ), ['day', 'product_id'], ['order_count'])
+
+
+def rebuild(start, end, batch_size=1000):
+    """Recompute every rollup for days ``start`` to ``end`` from the order tables.
+
+    Each rollup is rebuilt with one grouped query per order table and bulk
+    inserts, replacing whatever rows the range held before.
+    """
+    lower, upper = day_bounds(start, end)
+    orders = [
+        model.objects.filter(order_date__gte=lower, order_date__lt=upper).annotate(
+            day=TruncDate('order_date')
+        )
+        for model in ORDER_MODELS
+    ]
+    through = [
+        model.products.through.objects.filter(
+            order__order_date__gte=lower, order__order_date__lt=upper
+        ).annotate(day=TruncDate('order__order_date'))
+        for model in ORDER_MODELS
+    ]
+
+    with transaction.atomic():
+        for model in (DailySalesRollup, DailyProductSalesRollup, DailyCustomerSalesRollup):
+            model.objects.filter(day__gte=start, day__lte=end).delete()
+
+        DailySalesRollup.objects.bulk_create(
+            (DailySalesRollup(**row) for row in grouped(
+                orders, ['day'], order_count=Count('pk'), revenue=Sum('total_amount')
+            )),
+            batch_size=batch_size,
+        )
+        DailyCustomerSalesRollup.objects.bulk_create(
+            (DailyCustomerSalesRollup(**row) for row in grouped(
+                orders, ['day', 'customer_id'], order_count=Count('pk'), revenue=Sum('total_amount')
+            )),
+            batch_size=batch_size,
+        )
+        DailyProductSalesRollup.objects.bulk_create(
+            (DailyProductSalesRollup(**row) for row in grouped(
+                through, ['day', 'product_id'], order_count=Count('pk')
+            )),
+            batch_size=batch_size,
+        )
@@ -147,37 +147,119 @@
 #     update_low_stock_products = UpdateLowStockProducts.Field()
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
-from .models import Customer, Product, Order
+from .models import ArchivedOrder, Customer, Product, Order, OrderItem, DailySalesRollup
 from .filters import CustomerFilter, ProductFilter, OrderFilter
-import re
-from django.db import transaction
+from .fields import CRMFilterConnectionField, KeysetFilterConnectionField, get_filtering_args, has_filter_args
+from .loaders import get_loaders, load_related, rows_needed
+from .counting import CountedConnection
+from .pagination import CustomerSortField
+from .aggregates import OrderStats, RollupOrderStats
+from .archive import OrderHistory, OrderHistoryConnectionField, RelatedOrdersConnectionField
+from django.core.exceptions import ValidationError
+from .signals import invalidate_responses, rows_bulk_created
+from . import inventory, rollups
+from collections import Counter
+from django.db.models import Case, Count, DecimalField, F, PositiveIntegerField, Q, Sum, When
+from .validators import is_valid_phone
+from django.conf import settings
+from django.db import IntegrityError, transaction
 
 class CustomerType(DjangoObjectType):
+    orders = RelatedOrdersConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Customer
-        fields = ("id", "name", "email", "phone", "created_at")
+        fields = (
+            "id", "name", "email", "phone", "created_at", "orders",
+            "order_count", "last_order_at", "lifetime_value",
+        )
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountedConnection
+
+    def resolve_orders(self, info, **kwargs):
+        if has_filter_args(OrderFilter, kwargs):
+            return OrderHistory(self.orders.all(), self.archived_orders.all())
+        loader = get_loaders(info).customer_orders.rows(rows_needed(kwargs))
+        return load_related(self, 'orders', loader, self.pk)
 
 class ProductType(DjangoObjectType):
+    orders = RelatedOrdersConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Product
-        fields = ("id", "name", "price", "stock")
+        fields = ("id", "name", "price", "stock", "orders")
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountedConnection
+
+    def resolve_orders(self, info, **kwargs):
+        if has_filter_args(OrderFilter, kwargs):
+            return OrderHistory(self.orders.all(), self.archived_orders.all())
+        loader = get_loaders(info).product_orders.rows(rows_needed(kwargs))
+        return load_related(self, 'orders', loader, self.pk)
 
 class OrderType(DjangoObjectType):
+    products = CRMFilterConnectionField(ProductType, required=True)
+
     class Meta:
         model = Order
         fields = ("id", "customer", "products", "order_date", "total_amount")
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountedConnection
+
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+
+    @classmethod
+    def get_node(cls, info, id):
+        order = super().get_node(info, id)
+        if order is None:
+            archived = ArchivedOrder.objects.filter(pk=id).first()
+            order = archived and archived.as_order()
+        return order
+
+    def resolve_products(self, info, **kwargs):
+        archived = getattr(self, 'archived', False)
+        if has_filter_args(ProductFilter, kwargs):
+            return Product.objects.filter(archived_orders=self.pk) if archived else self.products.all()
+        loaders = get_loaders(info)
+        loader = loaders.archived_order_products if archived else loaders.order_products
+        return load_related(self, 'products', loader, self.pk)
+
+class DailyRevenueType(graphene.ObjectType):
+    day = graphene.Date()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+
+class OrderStatsType(graphene.ObjectType):
+    count = graphene.Int()
+    total_revenue = graphene.Decimal()
+    avg_order_value = graphene.Decimal()
+    revenue_by_day = graphene.List(DailyRevenueType)
+
+    def resolve_revenue_by_day(self, info):
+        return [DailyRevenueType(**row) for row in self.revenue_by_day()]
 
 class Query(graphene.ObjectType):
-    all_customers = DjangoFilterConnectionField(CustomerType)
-    all_products = DjangoFilterConnectionField(ProductType)
-    all_orders = DjangoFilterConnectionField(OrderType)
+    all_customers = KeysetFilterConnectionField(CustomerType, sort_by=CustomerSortField())
+    all_products = KeysetFilterConnectionField(ProductType)
+    all_orders = OrderHistoryConnectionField(OrderType)
+    order_stats = graphene.Field(
+        OrderStatsType, **get_filtering_args(OrderFilter, OrderType)
+    )
+
+    def resolve_order_stats(self, info, **kwargs):
+        filterset = OrderFilter(data=kwargs, queryset=Order.objects.all(), request=info.context)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.form.errors.as_json())
+        if not any(value not in (None, '') for value in filterset.form.cleaned_data.values()):
+            return RollupOrderStats(DailySalesRollup.objects.all())
+        archived = OrderFilter(data=kwargs, queryset=ArchivedOrder.objects.all(), request=info.context)
+        return OrderStats(filterset.qs, archived.qs)
 
 # ✅ Task 0: Add hello field at the query level
 def resolve_hello(self, info):
@@ -198,13 +280,88 @@ class CreateCustomer(graphene.Mutation):
     def mutate(self, info, name, email, phone=None):
         if Customer.objects.filter(email=email).exists():
             raise Exception("Email already exists.")
-        if phone and not re.match(r"^(\+1)?\d{10}$|^\d{3}-\d{3}-\d{4}$", phone):
+        if phone and not is_valid_phone(phone):
             raise Exception("Invalid phone number format.")
         
         customer = Customer(name=name, email=email, phone=phone)
         customer.save()  # ✅ Explicit save() call
         return CreateCustomer(customer=customer, message="Customer created successfully.")
 
+class CustomerInput(graphene.InputObjectType):
+    name = graphene.String(required=True)
+    email = graphene.String(required=True)
+    phone = graphene.String()
+
+class BulkCreateCustomers(graphene.Mutation):
+    """Create many customers with set-based checks and chunked bulk inserts.
+
+    Existing emails are looked up with one ``email__in`` query per chunk,
+    duplicates within the batch are found in memory, and valid rows are
+    written with ``bulk_create``. Invalid rows are skipped and reported in
+    ``errors``.
+    """
+
+    class Arguments:
+        customers_data = graphene.List(graphene.NonNull(CustomerInput), required=True)
+        batch_size = graphene.Int()
+
+    customers = graphene.List(CustomerType)
+    errors = graphene.List(graphene.String)
+
+    def mutate(self, info, customers_data, batch_size=None):
+        if batch_size is None:
+            batch_size = getattr(settings, 'CRM_BULK_CREATE_BATCH_SIZE', 1000)
+        if batch_size < 1:
+            raise Exception("Batch size must be positive.")
+
+        error_list = []
+        candidates = []
+        seen = set()
+        for data in customers_data:
+            if data.email in seen:
+                error_list.append(f"Email {data.email} is duplicated in this batch.")
+                continue
+            seen.add(data.email)
+            if data.phone and not is_valid_phone(data.phone):
+                error_list.append(f"Invalid phone number format for {data.email}.")
+                continue
+            candidates.append(Customer(name=data.name, email=data.email, phone=data.phone))
+
+        created_customers = []
+        for start in range(0, len(candidates), batch_size):
+            chunk = candidates[start:start + batch_size]
+            created, errors = BulkCreateCustomers.insert_chunk(chunk)
+            created_customers.extend(created)
+            error_list.extend(errors)
+
+        if created_customers:
+            rows_bulk_created(Customer, len(created_customers))
+        return BulkCreateCustomers(customers=created_customers, errors=error_list)
+
+    @staticmethod
+    def insert_chunk(chunk):
+        """Insert the rows of ``chunk`` whose email is not taken yet.
+
+        If the chunk still collides after checking twice, none of it is
+        inserted and its rows are reported as errors.
+        """
+        for attempt in range(2):
+            existing = set(
+                Customer.objects.filter(email__in=[c.email for c in chunk])
+                .values_list('email', flat=True)
+            )
+            errors = [f"Email {c.email} already exists." for c in chunk if c.email in existing]
+            rows = [c for c in chunk if c.email not in existing]
+            try:
+                with transaction.atomic():
+                    return Customer.objects.bulk_create(rows), errors
+            except IntegrityError:
+                # A concurrent writer took one of the emails; check again.
+                if attempt:
+                    return [], errors + [
+                        f"Could not insert {c.email}: emails changed concurrently." for c in rows
+                    ]
+
 class CreateProduct(graphene.Mutation):
     class Arguments:
         name = graphene.String(required=True)
@@ -223,6 +380,122 @@ class CreateProduct(graphene.Mutation):
         product.save()  # ✅ Explicit save() call
         return CreateProduct(product=product)
 
+class OrderItemInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    # Non-null: may be left out, but an explicit null is rejected.
+    quantity = graphene.Int(required=True, default_value=1)
+
+class CreateOrder(graphene.Mutation):
+    """Place an order, reserving its stock in the same transaction.
+
+    Stock is taken with one conditional ``UPDATE ... SET stock = stock - n
+    WHERE stock >= n`` over all the products, so concurrent orders for the
+    same product can never oversell it: whichever commits second sees the
+    reduced stock and is rejected.
+    """
+
+    class Arguments:
+        customer_id = graphene.ID(required=True)
+        product_ids = graphene.List(graphene.NonNull(graphene.ID))
+        items = graphene.List(graphene.NonNull(OrderItemInput))
+
+    order = graphene.Field(OrderType)
+
+    def mutate(self, info, customer_id, product_ids=None, items=None):
+        quantities = Counter()
+        try:
+            for product_id in product_ids or ():
+                quantities[int(product_id)] += 1
+            for item in items or ():
+                if item.quantity < 1:
+                    raise Exception("Quantity must be positive.")
+                quantities[int(item.product_id)] += item.quantity
+        except ValueError:
+            raise Exception("Invalid product ID(s).")
+        if not quantities:
+            raise Exception("At least one product must be selected.")
+        # A fixed order keeps concurrent orders locking rows the same way.
+        quantities = dict(sorted(quantities.items()))
+
+        with transaction.atomic():
+            if not Customer.objects.filter(pk=customer_id).exists():
+                raise Exception("Invalid customer ID.")
+
+            products = Product.objects.filter(pk__in=quantities)
+            totals = products.aggregate(
+                found=Count('pk'),
+                total=Sum(Case(
+                    *(When(pk=pk, then=F('price') * quantity) for pk, quantity in quantities.items()),
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                )),
+            )
+            if totals['found'] != len(quantities):
+                raise Exception("Invalid product ID(s).")
+
+            in_stock = Q()
+            for pk, quantity in quantities.items():
+                in_stock |= Q(pk=pk, stock__gte=quantity)
+            reserved = Product.objects.filter(in_stock).update(stock=Case(
+                *(When(pk=pk, then=F('stock') - quantity) for pk, quantity in quantities.items()),
+                default=F('stock'),
+                output_field=PositiveIntegerField(),
+            ))
+            if reserved != len(quantities):
+                short = [
+                    pk for pk, stock in products.values_list('pk', 'stock')
+                    if stock < quantities[pk]
+                ]
+                raise Exception(f"Insufficient stock for product(s): {', '.join(map(str, short))}.")
+
+            order = Order(customer_id=customer_id, total_amount=totals['total'])
+            order.save()
+            # bulk_create sends no m2m_changed, so do its bookkeeping here.
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product_id=pk, quantity=quantity)
+                for pk, quantity in quantities.items()
+            )
+            rollups.record_products(rollups.order_day(order.order_date), list(quantities))
+            invalidate_responses(Order, Product)
+        return CreateOrder(order=order)
+
+class RestockTargetInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    level = graphene.Int(required=True)
+
+class UpdateLowStockProducts(graphene.Mutation):
+    """Restock every low-stock product with a single ``UPDATE``."""
+
+    class Arguments:
+        threshold = graphene.Int()
+        increment = graphene.Int()
+        targets = graphene.List(graphene.NonNull(RestockTargetInput))
+
+    updated_products = graphene.List(ProductType)
+    message = graphene.String()
+
+    def mutate(self, info, threshold=None, increment=None, targets=None):
+        threshold = inventory.low_stock_threshold() if threshold is None else threshold
+        increment = inventory.restock_increment() if increment is None else increment
+        if increment < 0:
+            raise Exception("Increment cannot be negative.")
+        levels = {}
+        for target in targets or ():
+            if target.level < 0:
+                raise Exception("Target level cannot be negative.")
+            try:
+                levels[int(target.product_id)] = target.level
+            except ValueError:
+                raise Exception("Invalid product ID(s).")
+
+        updated_products_list = inventory.restock(threshold, increment, levels)
+        if updated_products_list:
+            invalidate_responses(Product)
+        message = f"Successfully updated {len(updated_products_list)} low-stock products."
+        return UpdateLowStockProducts(updated_products=updated_products_list, message=message)
+
 class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
-    create_product = CreateProduct.Field()
\ No newline at end of file
+    bulk_create_customers = BulkCreateCustomers.Field()
+    create_product = CreateProduct.Field()
+    create_order = CreateOrder.Field()
+    update_low_stock_products = UpdateLowStockProducts.Field()
\ No newline at end of file
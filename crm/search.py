@@ -0,0 +1,165 @@
+import re
+
+from django.db import connections, router
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from .models import Customer, Product
+
+# model -> (search table, indexed columns). The tables are created by
+# migration 0004_search: FTS5 tables kept in sync by triggers on SQLite,
+# trigram GIN indexes (maintained by the index itself) on Postgres.
+INDEXES = {
+    Customer: ('crm_customer_search', ('name', 'email')),
+    Product: ('crm_product_search', ('name',)),
+}
+
+RANK = 'search_rank'
+TERM = re.compile(r'\w+')
+
+_fts_tables = {}
+
+
+class WordSimilarity(Func):
+    """pg_trgm ``word_similarity``: how well the search matches part of the value."""
+    function = 'word_similarity'
+    output_field = FloatField()
+
+
+def terms(text):
+    return TERM.findall(text or '')
+
+
+def sqlite_triggers(model):
+    """The triggers copying writes to ``model``'s table into its FTS table."""
+    table, columns = INDEXES[model]
+    source = model._meta.db_table
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = f"INSERT INTO {table}({table}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    insert = f'INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new});'
+    return {
+        f'{table}_insert': f'AFTER INSERT ON {source} BEGIN {insert} END',
+        f'{table}_delete': f'AFTER DELETE ON {source} BEGIN {delete} END',
+        f'{table}_update': f'AFTER UPDATE OF {names} ON {source} BEGIN {delete} {insert} END',
+    }
+
+
+def repair_sqlite_triggers(using='default', **kwargs):
+    """``post_migrate`` receiver restoring triggers lost when a migration rebuilt a table.
+
+    SQLite cannot alter most columns in place, so Django copies the table
+    and drops the original along with its triggers. The FTS table is then
+    rebuilt, since writes may have been missed.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    _fts_tables.clear()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+        for model, (table, _) in INDEXES.items():
+            if not router.allow_migrate_model(using, model) or not has_fts(connection, table):
+                continue
+            missing = {name: sql for name, sql in sqlite_triggers(model).items() if name not in existing}
+            for name, sql in missing.items():
+                cursor.execute(f'CREATE TRIGGER {name} {sql}')
+            if missing:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def match_expression(text):
+    """FTS5 query matching rows containing every term, the last as a prefix.
+
+    Terms are quoted, so operators typed into a search box are literals.
+    """
+    words = [f'"{word}"' for word in terms(text)]
+    words[-1] += '*'
+    return ' '.join(words)
+
+
+def has_fts(connection, table):
+    """Whether ``table`` exists; SQLite builds without FTS5 fall back to LIKE."""
+    key = (connection.alias, table)
+    if key not in _fts_tables:
+        _fts_tables[key] = table in connection.introspection.table_names()
+    return _fts_tables[key]
+
+
+def backend(model, using='default'):
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return 'trigram'
+    if connection.vendor == 'sqlite' and has_fts(connection, INDEXES[model][0]):
+        return 'fts5'
+    return None
+
+
+def contains_all(columns, text):
+    """Rows where every term appears in one of ``columns``; trigram-indexed on Postgres."""
+    condition = Q()
+    for word in terms(text):
+        any_column = Q()
+        for column in columns:
+            any_column |= Q(**{f'{column}__icontains': word})
+        condition &= any_column
+    return condition
+
+
+def matching_ids(model, text, using='default'):
+    """A subquery selecting the primary keys of ``model`` rows matching ``text``."""
+    table, columns = INDEXES[model]
+    if backend(model, using) == 'fts5':
+        return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match_expression(text)])
+    return model._default_manager.using(using).filter(contains_all(columns, text)).values('pk')
+
+
+def search(queryset, text):
+    """Filter ``queryset`` to rows matching ``text``, best matches first.
+
+    Every term must match a word of an indexed column, and the last term
+    may be a prefix of it, so results can be shown as the user types. The
+    rank is annotated as ``search_rank`` (see ``is_ranked``).
+    """
+    if not terms(text):
+        return queryset
+    model = queryset.model
+    table, columns = INDEXES[model]
+    kind = backend(model, queryset.db)
+    if kind == 'fts5':
+        # Joining the FTS table runs the match once and exposes bm25 as "rank".
+        pk = f'{model._meta.db_table}.{model._meta.pk.column}'
+        return queryset.extra(
+            tables=[table],
+            where=[f'{table}.rowid = {pk}', f'{table} MATCH %s'],
+            params=[match_expression(text)],
+            select={RANK: f'{table}.rank'},
+        ).order_by(RANK, 'pk')
+    queryset = queryset.filter(contains_all(columns, text))
+    if kind == 'trigram':
+        similarity = [WordSimilarity(Value(text), F(column)) for column in columns]
+        rank = Greatest(*similarity) if len(similarity) > 1 else similarity[0]
+        return queryset.annotate(**{RANK: -rank}).order_by(RANK, 'pk')
+    return queryset
+
+
+def search_orders(queryset, text):
+    """Filter orders to those whose customer or one of whose products matches ``text``."""
+    if not terms(text):
+        return queryset
+    using = queryset.db
+    # Order or ArchivedOrder: each links its products through its own table.
+    products = queryset.model.products.through.objects.using(using).filter(
+        product_id__in=matching_ids(Product, text, using)
+    ).values('order_id')
+    return queryset.filter(
+        Q(customer_id__in=matching_ids(Customer, text, using)) | Q(pk__in=products)
+    )
+
+
+def is_ranked(queryset):
+    """Whether ``queryset`` is ordered by search rank rather than its keyset."""
+    return RANK in queryset.query.extra or RANK in queryset.query.annotations
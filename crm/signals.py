@@ -0,0 +1,161 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import response_cache, rollups
+from .counting import adjust_table_count
+from .models import ArchivedOrder, Customer, Order, Product
+
+COUNTED_MODELS = (Customer, Product, Order)
+OrderProducts = Order.products.through
+
+
+# Receivers are connected per model: a delete signal on any other model
+# would keep Django from deleting its rows in one query.
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+def count_created_row(sender, instance, created, raw=False, **kwargs):
+    if created:
+        adjust_table_count(sender, 1)
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def count_deleted_row(sender, instance, **kwargs):
+    adjust_table_count(sender, -1)
+
+
+def invalidate_responses(*models):
+    """Drop cached responses that read ``models``, now and again at commit.
+
+    The second pass covers readers that cached the old rows while the
+    writing transaction was still open.
+    """
+    for model in models:
+        response_cache.invalidate(model._meta.label)
+        transaction.on_commit(lambda label=model._meta.label: response_cache.invalidate(label))
+
+
+def rows_bulk_created(model, count):
+    """Do the bookkeeping that ``bulk_create`` skips by not sending signals."""
+    adjust_table_count(model, count)
+    invalidate_responses(model)
+
+
+# The response cache only tags these models (see response_cache.dependencies).
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_row_responses(sender, **kwargs):
+    invalidate_responses(sender)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_link_responses(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_responses(Order, Product)
+
+
+def product_ids(order):
+    # Orders and archived orders each link to products through their own table.
+    return list(type(order).products.through.objects.filter(order_id=order.pk).values_list('product_id', flat=True))
+
+
+@receiver(pre_save, sender=Order)
+def remember_rollup_state(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._rollup_previous = (
+        Order.objects.filter(pk=instance.pk)
+        .values_list('order_date', 'customer_id', 'total_amount')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Order)
+def roll_up_saved_order(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    day = rollups.order_day(instance.order_date)
+    if created:
+        rollups.record_order(day, instance.customer_id, instance.total_amount)
+        rollups.record_customer_order(instance.customer_id, instance.order_date, instance.total_amount)
+        invalidate_responses(Customer)
+        return
+
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is None:
+        return
+    order_date, customer_id, total_amount = previous
+    instance._rollup_previous = None
+    if (order_date, customer_id, total_amount) == (
+        instance.order_date, instance.customer_id, instance.total_amount
+    ):
+        return
+    rollups.record_customer_order(customer_id, order_date, total_amount, sign=-1)
+    rollups.record_customer_order(instance.customer_id, instance.order_date, instance.total_amount)
+    invalidate_responses(Customer)
+
+    previous_day = rollups.order_day(order_date)
+    if (previous_day, customer_id, total_amount) == (day, instance.customer_id, instance.total_amount):
+        return
+    rollups.record_order(previous_day, customer_id, total_amount, sign=-1)
+    rollups.record_order(day, instance.customer_id, instance.total_amount)
+    if previous_day != day:
+        products = product_ids(instance)
+        rollups.record_products(previous_day, products, sign=-1)
+        rollups.record_products(day, products)
+
+
+@receiver(m2m_changed, sender=OrderProducts)
+def roll_up_order_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._rollup_cleared = list(
+                OrderProducts.objects.filter(product_id=instance.pk).values_list('order_id', flat=True)
+            )
+        else:
+            instance._rollup_cleared = product_ids(instance)
+        return
+    if action == 'post_clear':
+        pk_set, sign = instance._rollup_cleared, -1
+    elif action in ('post_add', 'post_remove'):
+        sign = 1 if action == 'post_add' else -1
+    else:
+        return
+
+    if reverse:
+        for order in Order.objects.filter(pk__in=pk_set).only('order_date'):
+            rollups.record_products(rollups.order_day(order.order_date), [instance.pk], sign)
+    else:
+        rollups.record_products(rollups.order_day(instance.order_date), pk_set, sign)
+
+
+@receiver(pre_delete, sender=Order)
+@receiver(pre_delete, sender=ArchivedOrder)
+def remember_deleted_products(sender, instance, **kwargs):
+    instance._rollup_products = product_ids(instance)
+
+
+@receiver(post_delete, sender=Order)
+def roll_up_deleted_order(sender, instance, **kwargs):
+    day = rollups.order_day(instance.order_date)
+    rollups.record_order(day, instance.customer_id, instance.total_amount, sign=-1)
+    rollups.record_products(day, getattr(instance, '_rollup_products', []), sign=-1)
+    rollups.record_customer_order(instance.customer_id, instance.order_date, instance.total_amount, sign=-1)
+    invalidate_responses(Customer)
+
+
+@receiver(post_delete, sender=ArchivedOrder)
+def roll_up_deleted_archived_order(sender, instance, **kwargs):
+    # Archiving itself skips signals; this is reached when deleting a
+    # customer or product cascades to archived orders.
+    adjust_table_count(ArchivedOrder, -1)
+    roll_up_deleted_order(sender, instance, **kwargs)
+    # Archived orders are served as orders.
+    invalidate_responses(Order)
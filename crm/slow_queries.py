@@ -0,0 +1,165 @@
+import contextvars
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+DEFAULT_THRESHOLD_MS = 200
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+
+logger = logging.getLogger('crm.slow_queries')
+logger.propagate = False
+
+# The GraphQL operation (and the field being resolved) of the running request.
+origin = contextvars.ContextVar('crm_slow_query_origin', default=None)
+explaining = contextvars.ContextVar('crm_slow_query_explaining', default=False)
+
+
+def is_enabled():
+    return getattr(settings, 'CRM_SLOW_QUERY_ENABLED', False)
+
+
+def threshold_ms():
+    return getattr(settings, 'CRM_SLOW_QUERY_THRESHOLD_MS', DEFAULT_THRESHOLD_MS)
+
+
+def log_path():
+    # No default: the log holds SQL from every request, so where it goes is a deliberate choice.
+    path = getattr(settings, 'CRM_SLOW_QUERY_LOG', None)
+    if not path:
+        raise ImproperlyConfigured('CRM_SLOW_QUERY_LOG must name the slow-query log file.')
+    return path
+
+
+def log_paths():
+    """The current log file followed by its rotated backups, newest first."""
+    path = log_path()
+    backups = getattr(settings, 'CRM_SLOW_QUERY_BACKUPS', DEFAULT_BACKUPS)
+    return [path] + [f'{path}.{i}' for i in range(1, backups + 1)]
+
+
+def get_handler():
+    """Point the ``crm.slow_queries`` logger at the configured rotating file."""
+    path = log_path()
+    for handler in logger.handlers:
+        if getattr(handler, 'baseFilename', None) == os.path.abspath(path):
+            return handler
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=getattr(settings, 'CRM_SLOW_QUERY_MAX_BYTES', DEFAULT_MAX_BYTES),
+        backupCount=getattr(settings, 'CRM_SLOW_QUERY_BACKUPS', DEFAULT_BACKUPS),
+        encoding='utf-8',
+        delay=True,
+    )
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return handler
+
+
+def is_read(sql):
+    words = sql.split(None, 1)
+    return bool(words) and words[0].upper() in ('SELECT', 'WITH')
+
+
+def explain(connection, sql, params):
+    """Return the database's plan for ``sql``, without running it again."""
+    token = explaining.set(True)
+    try:
+        # A savepoint keeps a failing EXPLAIN from breaking the caller's transaction.
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except Exception as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        explaining.reset(token)
+
+
+def record(connection, sql, params, elapsed):
+    current = origin.get() or {}
+    entry = {
+        'time': timezone.now().isoformat(),
+        'duration_ms': round(elapsed * 1000, 3),
+        'database': connection.alias,
+        'sql': sql,
+        'params': params if getattr(settings, 'CRM_SLOW_QUERY_CAPTURE_PARAMS', False) else None,
+        'operation': current.get('operation'),
+        'field': current.get('field'),
+        'plan': None,
+    }
+    if is_read(sql):
+        entry['plan'] = explain(connection, sql, params)
+    get_handler()
+    logger.info(json.dumps(entry, default=str))
+
+
+class SlowQueryRecorder:
+    """``execute_wrapper`` writing statements slower than the threshold to the log."""
+
+    def __call__(self, execute, sql, params, many, context):
+        if explaining.get():
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = time.perf_counter() - started
+        if elapsed * 1000 >= threshold_ms() and not many:
+            record(context['connection'], sql, params, elapsed)
+        return result
+
+
+recorder = SlowQueryRecorder()
+
+
+def install(sender=None, connection=None, **kwargs):
+    """``connection_created`` receiver adding the recorder to new connections."""
+    if is_enabled() and recorder not in connection.execute_wrappers:
+        log_path()  # fail on the first connection, not inside a slow query
+        connection.execute_wrappers.append(recorder)
+
+
+class OriginMiddleware:
+    """Graphene middleware noting which field's resolver is running."""
+
+    def resolve(self, next, root, info, **args):
+        current = origin.get()
+        if current is not None:
+            current['field'] = f'{info.parent_type.name}.{info.field_name}'
+        return next(root, info, **args)
+
+
+@contextmanager
+def graphql_origin(operation_ast, operation_name):
+    """Attribute slow statements run inside the block to a GraphQL operation."""
+    if not is_enabled():
+        yield
+        return
+    name = operation_name or (operation_ast.name.value if operation_ast and operation_ast.name else None)
+    token = origin.set({'operation': name or 'anonymous', 'field': None})
+    try:
+        yield
+    finally:
+        origin.reset(token)
+
+
+def read_entries():
+    """Yield every recorded entry, oldest file first."""
+    for path in reversed(log_paths()):
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
@@ -1,9 +1,52 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from datetime import timedelta
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from io import StringIO
-from crm.models import Customer, Order, Product
+from django.db import IntegrityError, connection
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.deletion import Collector
+from django.test.utils import CaptureQueriesContext
+from decimal import Decimal
+from graphql_relay import from_global_id
+from crm import (
+    benchmarks, documents, export, instrumentation, inventory, metrics, response_cache, rollups, search,
+    slow_queries,
+)
+from crm.counting import table_count
+from crm.documents import document_cache
+from crm.pagination import Keyset
+from crm.validators import normalize_phone
+from crm.filters import CustomerFilter, OrderFilter, ProductFilter, digits_prefix_range
+from crm.models import (
+    ArchivedOrder,
+    ArchivedOrderItem,
+    CleanupCheckpoint,
+    Customer,
+    CustomerQuerySet,
+    DailyCustomerSalesRollup,
+    DailyProductSalesRollup,
+    DailySalesRollup,
+    ImportCheckpoint,
+    Order,
+    OrderItem,
+    Product,
+    TableCount,
+)
 
 
 class CustomerCleanupTestCase(TestCase):
@@ -227,3 +270,1812 @@ class CustomerCleanupTestCase(TestCase):
         self.assertTrue(Customer.objects.filter(email="c5@example.com").exists())
         
         self.assertIn('2 inactive customer(s) deleted', out.getvalue())
+
+
+class OrderBatchingTestCase(TestCase):
+    """Test cases for DataLoader batching of order relations"""
+
+    QUERY = """
+        query {
+          allOrders {
+            edges {
+              node {
+                customer { email }
+                products { edges { node { name } } }
+              }
+            }
+          }
+        }
+    """
+
+    def create_orders(self, count):
+        products = [
+            Product.objects.create(name=f"Product {i}", price=10.00, stock=100)
+            for i in range(3)
+        ]
+        start = Customer.objects.count()
+        for i in range(start, start + count):
+            customer = Customer.objects.create(
+                name=f"Customer {i}",
+                email=f"batch{i}@example.com"
+            )
+            order = Order.objects.create(customer=customer, total_amount=30.00)
+            order.products.add(*products)
+
+    def execute(self, query):
+        response = self.client.post(
+            '/graphql', {'query': query}, content_type='application/json'
+        )
+        return response.json()
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        """
+        A page of orders costs one page query (joined to its customers) and
+        one products query, no matter how many orders it holds.
+        """
+        self.create_orders(5)
+        with self.assertNumQueries(2):
+            small = self.execute(self.QUERY)
+
+        self.create_orders(50)
+        with self.assertNumQueries(2):
+            large = self.execute(self.QUERY)
+
+        self.assertNotIn('errors', large)
+        self.assertEqual(len(small['data']['allOrders']['edges']), 5)
+        self.assertEqual(len(large['data']['allOrders']['edges']), 55)
+        node = large['data']['allOrders']['edges'][0]['node']
+        self.assertEqual(node['customer']['email'], 'batch0@example.com')
+        self.assertEqual(len(node['products']['edges']), 3)
+
+    def test_reverse_relations_are_batched(self):
+        """Customer.orders and Product.orders load in one query per relation."""
+        self.create_orders(10)
+        query = """
+            query {
+              allCustomers { edges { node { orders { edges { node { id } } } } } }
+              allProducts { edges { node { orders { edges { node { id } } } } } }
+            }
+        """
+        with self.assertNumQueries(4):
+            result = self.execute(query)
+        self.assertNotIn('errors', result)
+        product = result['data']['allProducts']['edges'][0]['node']
+        self.assertEqual(len(product['orders']['edges']), 10)
+
+    def test_trimmed_parents_are_not_reused_for_nested_relations(self):
+        """Customers loaded with only some columns are not handed to order.customer."""
+        self.create_orders(20)
+        query = """
+            query {
+              allCustomers { edges { node { orders { edges { node { customer { email } } } } } } }
+            }
+        """
+        with self.assertNumQueries(3):
+            result = self.execute(query)
+        emails = {
+            order['node']['customer']['email']
+            for customer in result['data']['allCustomers']['edges']
+            for order in customer['node']['orders']['edges']
+        }
+        self.assertEqual(len(emails), 20)
+
+    def test_first_page_of_orders_reads_only_that_many_rows(self):
+        """orders(first: N) fetches N orders per parent but counts all of them."""
+        self.create_orders(10)
+        query = """
+            query {
+              allProducts {
+                edges { node { orders(first: 2) {
+                  totalCount pageInfo { hasNextPage } edges { node { id } }
+                } } }
+              }
+            }
+        """
+        with CaptureQueriesContext(connection) as queries:
+            result = self.execute(query)
+        self.assertNotIn('errors', result)
+        for edge in result['data']['allProducts']['edges']:
+            orders = edge['node']['orders']
+            self.assertEqual(orders['totalCount'], 10)
+            self.assertTrue(orders['pageInfo']['hasNextPage'])
+            self.assertEqual(len(orders['edges']), 2)
+        self.assertIn('ROW_NUMBER()', queries[-1]['sql'])
+
+        first = result['data']['allProducts']['edges'][0]['node']['orders']['edges']
+        everything = self.execute("""
+            query { allProducts(first: 1) { edges { node { orders { edges { node { id } } } } } } }
+        """)
+        edges = everything['data']['allProducts']['edges'][0]['node']['orders']['edges']
+        self.assertEqual(first, edges[:2])
+
+
+class QuerysetOptimizerTestCase(TestCase):
+    """Test cases for the selection-set queryset optimizer"""
+
+    def setUp(self):
+        customer = Customer.objects.create(name="Optimized", email="opt@example.com")
+        product = Product.objects.create(name="Widget", price=5.00, stock=3)
+        order = Order.objects.create(customer=customer, total_amount=5.00)
+        order.products.add(product)
+
+    def execute(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/graphql', {'query': query}, content_type='application/json'
+            )
+        self.assertNotIn('errors', response.json())
+        return response.json(), [q['sql'] for q in queries.captured_queries]
+
+    def test_only_selected_columns_are_fetched(self):
+        """Asking for ids alone does not hydrate the other columns."""
+        _, queries = self.execute("query { allCustomers { edges { node { id } } } }")
+        page = queries[-1]
+        self.assertNotIn('"email"', page)
+        self.assertNotIn('"phone"', page)
+
+    def test_fragments_and_aliases_select_related_customer(self):
+        """Nested customer fields behind a fragment and alias become a join."""
+        result, queries = self.execute("""
+            query {
+              allOrders { edges { node { ...OrderFields } } }
+            }
+            fragment OrderFields on OrderType {
+              buyer: customer { email }
+              totalAmount
+            }
+        """)
+        node = result['data']['allOrders']['edges'][0]['node']
+        self.assertEqual(node['buyer']['email'], 'opt@example.com')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('JOIN "crm_customer"', queries[-1])
+        self.assertNotIn('"crm_customer"."name"', queries[-1])
+
+
+class KeysetPaginationTestCase(TestCase):
+    """Test cases for keyset-paginated connections"""
+
+    def setUp(self):
+        customer = Customer.objects.create(name="Pager", email="pager@example.com")
+        for i in range(7):
+            Order.objects.create(customer=customer, total_amount=i)
+
+    def execute(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/graphql', {'query': query}, content_type='application/json'
+            )
+        return response.json(), [q['sql'] for q in queries.captured_queries]
+
+    def page(self, arguments):
+        result, queries = self.execute("""
+            query {
+              allOrders(%s) {
+                pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+                edges { node { totalAmount } }
+              }
+            }
+        """ % arguments)
+        self.assertNotIn('errors', result)
+        connection_data = result['data']['allOrders']
+        amounts = [int(float(e['node']['totalAmount'])) for e in connection_data['edges']]
+        return amounts, connection_data['pageInfo'], queries
+
+    def test_forward_pages_use_range_predicates(self):
+        """Walking forward visits every row once, without OFFSET or COUNT."""
+        seen = []
+        after = ''
+        while True:
+            amounts, page_info, queries = self.page(f'first: 3 {after}')
+            seen.extend(amounts)
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('OFFSET', queries[0])
+            if not page_info['hasNextPage']:
+                break
+            after = 'after: "%s"' % page_info['endCursor']
+        self.assertEqual(seen, list(range(7)))
+
+    def test_backward_and_descending_pages(self):
+        """last/before and sort: DESC page in the expected order."""
+        amounts, page_info, _ = self.page('last: 2')
+        self.assertEqual(amounts, [5, 6])
+        self.assertTrue(page_info['hasPreviousPage'])
+
+        amounts, _, _ = self.page('last: 2, before: "%s"' % page_info['startCursor'])
+        self.assertEqual(amounts, [3, 4])
+
+        amounts, _, _ = self.page('first: 3, sort: DESC')
+        self.assertEqual(amounts, [6, 5, 4])
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        _, page_info, _ = self.page('first: 2')
+        result, _ = self.execute(
+            'query { allOrders(sort: DESC, after: "%s") { edges { cursor } } }'
+            % page_info['endCursor']
+        )
+        self.assertEqual(
+            result['errors'][0]['message'], 'Cursor does not match the requested sort.'
+        )
+
+
+class TotalCountTestCase(TestCase):
+    """Test cases for the totalCount strategies"""
+
+    def setUp(self):
+        for i in range(5):
+            Product.objects.create(name=f"Gadget {i}", price=i + 1, stock=i)
+
+    def count(self, arguments=''):
+        response = self.client.post(
+            '/graphql',
+            {'query': 'query { allProducts%s { totalCount totalCountIsExact } }' % arguments},
+            content_type='application/json',
+        )
+        return response.json()['data']['allProducts']
+
+    def test_unfiltered_total_reads_maintained_counter(self):
+        """The counter is seeded once and then kept current by signals."""
+        self.assertEqual(self.count()['totalCount'], 5)
+        Product.objects.create(name="Gadget 5", price=1, stock=100)
+        Product.objects.filter(name="Gadget 0").first().delete()
+        with CaptureQueriesContext(connection) as queries:
+            result = self.count()
+        self.assertFalse(any('COUNT' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(result, {'totalCount': 5, 'totalCountIsExact': True})
+
+    def test_uncounted_models_keep_fast_deletes(self):
+        """Only the counted models have row signals, so other tables delete in one query."""
+        collector = Collector(using='default')
+        for model in (DailySalesRollup, DailyProductSalesRollup, DailyCustomerSalesRollup, TableCount):
+            self.assertTrue(collector.can_fast_delete(model.objects.all()), model)
+        DailySalesRollup.objects.bulk_create(
+            DailySalesRollup(day=timezone.localdate() - timedelta(days=i)) for i in range(300)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            DailySalesRollup.objects.all().delete()
+        self.assertEqual([q['sql'].split()[0] for q in queries.captured_queries if 'crm_' in q['sql']], ['DELETE'])
+
+    def test_filtered_total_is_exact_below_threshold(self):
+        self.assertEqual(
+            self.count('(lowStock: true, name: "gadget")'),
+            {'totalCount': 5, 'totalCountIsExact': True},
+        )
+
+    @override_settings(CRM_COUNT_THRESHOLD=3)
+    def test_filtered_total_is_capped_above_threshold(self):
+        self.assertEqual(
+            self.count('(name: "gadget")'),
+            {'totalCount': 3, 'totalCountIsExact': False},
+        )
+
+
+class OrderStatsTestCase(TestCase):
+    """Test cases for the orderStats aggregate query"""
+
+    def setUp(self):
+        customer = Customer.objects.create(name="Stats", email="stats@example.com")
+        self.product = Product.objects.create(name="Lamp", price=10.00, stock=10)
+        other = Product.objects.create(name="Lampshade", price=5.00, stock=10)
+        for amount in (10, 20, 30):
+            order = Order.objects.create(customer=customer, total_amount=amount)
+            order.products.add(self.product, other)
+
+    def stats(self, arguments=''):
+        query = """
+            query {
+              orderStats%s {
+                count totalRevenue avgOrderValue
+                revenueByDay { orderCount revenue }
+              }
+            }
+        """ % arguments
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                '/graphql', {'query': query}, content_type='application/json'
+            )
+        return response.json()['data']['orderStats']
+
+    def test_totals_are_computed_in_the_database(self):
+        stats = self.stats()
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['totalRevenue'], '60.00')
+        self.assertEqual(stats['avgOrderValue'], '20.00')
+        self.assertEqual(stats['revenueByDay'], [{'orderCount': 3, 'revenue': '60.00'}])
+
+    def test_product_join_does_not_double_count(self):
+        """Orders matching several products through the M2M join count once."""
+        stats = self.stats('(productName: "lamp")')
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['totalRevenue'], '60.00')
+        self.assertEqual(stats['revenueByDay'], [{'orderCount': 3, 'revenue': '60.00'}])
+
+
+class SalesRollupTestCase(TestCase):
+    """Test cases for the incrementally maintained sales rollups"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Rollup", email="rollup@example.com")
+        self.product = Product.objects.create(name="Kettle", price=40.00, stock=10)
+
+    def rollup_state(self):
+        return (
+            list(DailySalesRollup.objects.filter(order_count__gt=0)
+                 .order_by('day').values_list('day', 'order_count', 'revenue')),
+            list(DailyProductSalesRollup.objects.filter(order_count__gt=0)
+                 .order_by('day').values_list('day', 'product_id', 'order_count')),
+            list(DailyCustomerSalesRollup.objects.filter(order_count__gt=0)
+                 .order_by('day').values_list('day', 'customer_id', 'order_count', 'revenue')),
+        )
+
+    def test_rollups_follow_order_writes(self):
+        """Creating, moving, linking and deleting orders keeps rollups exact."""
+        today = timezone.localdate()
+        first = Order.objects.create(customer=self.customer, total_amount=40.00)
+        first.products.add(self.product)
+        second = Order.objects.create(customer=self.customer, total_amount=60.00)
+        second.products.add(self.product)
+
+        daily = DailySalesRollup.objects.get(day=today)
+        self.assertEqual((daily.order_count, daily.revenue), (2, Decimal('100.00')))
+        self.assertEqual(
+            DailyProductSalesRollup.objects.get(day=today, product=self.product).order_count, 2
+        )
+
+        second.order_date = timezone.now() - timedelta(days=3)
+        second.save()
+        first.products.remove(self.product)
+        first.delete()
+
+        state = self.rollup_state()
+        self.assertEqual(state[0], [(today - timedelta(days=3), 1, Decimal('60.00'))])
+        self.assertEqual(state[1], [(today - timedelta(days=3), self.product.pk, 1)])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for days_ago in (0, 1, 1, 10):
+            order = Order.objects.create(customer=self.customer, total_amount=25.00)
+            order.order_date = timezone.now() - timedelta(days=days_ago)
+            order.save()
+            order.products.add(self.product)
+        incremental = self.rollup_state()
+
+        DailySalesRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+
+        self.assertEqual(self.rollup_state(), incremental)
+        self.assertIn('Rollups rebuilt', out.getvalue())
+
+    def test_unfiltered_order_stats_read_rollups(self):
+        Order.objects.create(customer=self.customer, total_amount=30.00)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/graphql',
+                {'query': 'query { orderStats { count totalRevenue revenueByDay { revenue } } }'},
+                content_type='application/json',
+            )
+        stats = response.json()['data']['orderStats']
+        self.assertEqual((stats['count'], stats['totalRevenue']), (1, '30.00'))
+        self.assertTrue(all('crm_order"' not in q['sql'] for q in queries.captured_queries))
+
+
+class QueryCostTestCase(TestCase):
+    """Test cases for static query cost analysis"""
+
+    NESTED = """
+        query($first: Int) {
+          allOrders(first: $first) {
+            edges { node { products { edges { node { orders { edges { node { id } } } } } } } }
+          }
+        }
+    """
+
+    def execute(self, query, variables=None):
+        return self.client.post(
+            '/graphql',
+            {'query': query, 'variables': variables or {}},
+            content_type='application/json',
+        )
+
+    def test_cost_is_reported_in_extensions(self):
+        response = self.execute('query { allOrders(first: 5) { edges { node { customer { email } } } } }')
+        cost = response.json()['extensions']['cost']
+        self.assertEqual(cost['requestedQueryCost'], 10)
+        self.assertEqual(cost['depth'], 3)
+
+    def test_expensive_query_is_rejected_before_execution(self):
+        """Connection page sizes multiply, and nothing is resolved when over budget."""
+        with self.assertNumQueries(0):
+            response = self.execute(self.NESTED, {'first': 100})
+        result = response.json()
+        self.assertNotIn('data', result)
+        self.assertIn('exceeds the maximum', result['errors'][0]['message'])
+        self.assertEqual(result['extensions']['cost']['requestedQueryCost'], 1010100)
+
+    def test_only_the_executed_operation_is_charged(self):
+        document = self.NESTED.replace('query(', 'query Nested(') + """
+            query Cheap { allOrders(first: 5) { edges { node { customer { email } } } } }
+        """
+        result = self.client.post(
+            '/graphql',
+            {'query': document, 'variables': {'first': 100}, 'operationName': 'Cheap'},
+            content_type='application/json',
+        ).json()
+        self.assertNotIn('errors', result)
+        self.assertEqual(result['extensions']['cost']['requestedQueryCost'], 10)
+
+    @override_settings(CRM_QUERY_MAX_COST=100000000, CRM_QUERY_MAX_DEPTH=2)
+    def test_deep_query_is_rejected(self):
+        result = self.execute(self.NESTED, {'first': 1}).json()
+        self.assertEqual(
+            result['errors'][0]['message'], 'Query depth 4 exceeds the maximum of 2.'
+        )
+
+
+class DocumentCacheTestCase(TestCase):
+    """Test cases for the document cache and automatic persisted queries"""
+
+    QUERY = 'query { allProducts { totalCount } }'
+
+    def setUp(self):
+        document_cache.clear()
+        caches['default'].clear()
+
+    def post(self, body):
+        return self.client.post('/graphql', body, content_type='application/json').json()
+
+    def persisted(self, sha256):
+        return {'persistedQuery': {'version': 1, 'sha256Hash': sha256}}
+
+    def test_repeated_documents_are_parsed_once(self):
+        with mock.patch('crm.documents.parse', wraps=documents.parse) as parse:
+            for _ in range(3):
+                self.assertNotIn('errors', self.post({'query': self.QUERY}))
+        self.assertEqual(parse.call_count, 1)
+
+    def test_persisted_query_round_trip(self):
+        sha256 = hashlib.sha256(self.QUERY.encode()).hexdigest()
+
+        missing = self.post({'extensions': self.persisted(sha256)})
+        self.assertEqual(missing['errors'][0]['message'], 'PersistedQueryNotFound')
+        self.assertEqual(missing['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+        registered = self.post({'query': self.QUERY, 'extensions': self.persisted(sha256)})
+        self.assertEqual(registered['data'], {'allProducts': {'totalCount': 0}})
+
+        by_hash = self.post({'extensions': self.persisted(sha256)})
+        self.assertEqual(by_hash['data'], registered['data'])
+
+    def test_mismatched_hash_is_rejected(self):
+        result = self.post({'query': self.QUERY, 'extensions': self.persisted('0' * 64)})
+        self.assertEqual(result['errors'][0]['extensions']['code'], 'BAD_PERSISTED_QUERY')
+
+
+@override_settings(CRM_RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTestCase(TestCase):
+    """Test cases for the read-only response cache"""
+
+    QUERY = 'query { allProducts(lowStock: true) { edges { node { name stock } } } }'
+
+    def setUp(self):
+        response_cache.get_backend().clear()
+        Product.objects.create(name="Scarce", price=3.00, stock=2)
+
+    def execute(self, query):
+        return self.client.post('/graphql', {'query': query}, content_type='application/json').json()
+
+    def test_repeated_query_is_served_from_cache(self):
+        first = self.execute(self.QUERY)
+        self.assertEqual(first['extensions']['responseCache'], {'hit': False})
+        with self.assertNumQueries(0):
+            second = self.execute(self.QUERY)
+        self.assertEqual(second['extensions']['responseCache'], {'hit': True})
+        self.assertEqual(second['data'], first['data'])
+
+    def test_whitespace_does_not_change_the_key(self):
+        self.execute(self.QUERY)
+        reformatted = self.execute(self.QUERY.replace(' ', '\n  ', 3))
+        self.assertTrue(reformatted['extensions']['responseCache']['hit'])
+
+    def test_writes_invalidate_only_dependent_entries(self):
+        self.execute(self.QUERY)
+        Customer.objects.create(name="Unrelated", email="unrelated@example.com")
+        self.assertTrue(self.execute(self.QUERY)['extensions']['responseCache']['hit'])
+
+        Product.objects.create(name="Scarcer", price=3.00, stock=1)
+        result = self.execute(self.QUERY)
+        self.assertFalse(result['extensions']['responseCache']['hit'])
+        self.assertEqual(len(result['data']['allProducts']['edges']), 2)
+
+    def test_connection_only_selections_are_invalidated(self):
+        query = 'query { allCustomers(first: 0) { totalCount } }'
+        self.assertEqual(self.execute(query)['data']['allCustomers']['totalCount'], 0)
+        Customer.objects.create(name="New", email="new@example.com")
+        result = self.execute(query)
+        self.assertFalse(result['extensions']['responseCache']['hit'])
+        self.assertEqual(result['data']['allCustomers']['totalCount'], 1)
+
+    def test_local_entries_expire(self):
+        backend = response_cache.LocalBackend(10, timeout=60)
+        with mock.patch('crm.response_cache.time.monotonic', return_value=100.0):
+            backend.set('key', {'data': 1})
+            self.assertEqual(backend.get('key'), {'data': 1})
+        with mock.patch('crm.response_cache.time.monotonic', return_value=160.0):
+            self.assertIsNone(backend.get('key'))
+
+    def test_mutations_are_not_cached(self):
+        mutation = 'mutation { createProduct(name: "New", price: "1.50") { product { name } } }'
+        result = self.execute(mutation)
+        self.assertEqual(result['data']['createProduct']['product']['name'], 'New')
+        self.assertNotIn('responseCache', result['extensions'])
+
+
+class BulkCreateCustomersTestCase(TestCase):
+    """Test cases for the set-based BulkCreateCustomers mutation"""
+
+    MUTATION = """
+        mutation($customers: [CustomerInput!]!, $batchSize: Int) {
+          bulkCreateCustomers(customersData: $customers, batchSize: $batchSize) {
+            customers { email }
+            errors
+          }
+        }
+    """
+
+    def execute(self, customers, batch_size=None):
+        response = self.client.post(
+            '/graphql',
+            {'query': self.MUTATION, 'variables': {'customers': customers, 'batchSize': batch_size}},
+            content_type='application/json',
+        )
+        return response.json()['data']['bulkCreateCustomers']
+
+    def test_per_row_errors_are_reported(self):
+        Customer.objects.create(name="Taken", email="taken@example.com")
+        result = self.execute([
+            {'name': "Ok", 'email': "ok@example.com", 'phone': "123-456-7890"},
+            {'name': "Taken", 'email': "taken@example.com"},
+            {'name': "Twice", 'email': "ok@example.com"},
+            {'name': "Bad", 'email': "bad@example.com", 'phone': "12-34"},
+        ])
+        self.assertEqual(result['customers'], [{'email': "ok@example.com"}])
+        self.assertEqual(result['errors'], [
+            "Email ok@example.com is duplicated in this batch.",
+            "Invalid phone number format for bad@example.com.",
+            "Email taken@example.com already exists.",
+        ])
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_queries_scale_with_chunks_not_rows(self):
+        customers = [
+            {'name': f"Bulk {i}", 'email': f"bulk{i}@example.com"} for i in range(500)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            result = self.execute(customers, batch_size=250)
+        self.assertEqual(len(result['customers']), 500)
+        self.assertLess(len(queries.captured_queries), 15)
+        self.assertEqual(Customer.objects.count(), 500)
+
+    def test_batch_size_below_one_is_rejected(self):
+        response = self.client.post(
+            '/graphql',
+            {'query': self.MUTATION, 'variables': {
+                'customers': [{'name': "Ok", 'email': "ok@example.com"}], 'batchSize': 0,
+            }},
+            content_type='application/json',
+        ).json()
+        self.assertEqual(response['errors'][0]['message'], "Batch size must be positive.")
+        self.assertEqual(Customer.objects.count(), 0)
+
+    def test_chunk_colliding_twice_is_reported(self):
+        customers = [{'name': f"Bulk {i}", 'email': f"bulk{i}@example.com"} for i in range(4)]
+        real_bulk_create = CustomerQuerySet.bulk_create
+
+        def collide_on_first_chunk(queryset, objs, *args, **kwargs):
+            objs = list(objs)
+            if objs[0].email == "bulk0@example.com":
+                raise IntegrityError("UNIQUE constraint failed: crm_customer.email")
+            return real_bulk_create(queryset, objs, *args, **kwargs)
+
+        with mock.patch.object(CustomerQuerySet, 'bulk_create', collide_on_first_chunk):
+            result = self.execute(customers, batch_size=2)
+        self.assertEqual(result['customers'], [{'email': "bulk2@example.com"}, {'email': "bulk3@example.com"}])
+        self.assertEqual(result['errors'], [
+            "Could not insert bulk0@example.com: emails changed concurrently.",
+            "Could not insert bulk1@example.com: emails changed concurrently.",
+        ])
+
+
+class CreateOrderTestCase(TestCase):
+    """Test cases for stock reservation in the CreateOrder mutation"""
+
+    MUTATION = """
+        mutation($customerId: ID!, $productIds: [ID!], $items: [OrderItemInput!]) {
+          createOrder(customerId: $customerId, productIds: $productIds, items: $items) {
+            order { id totalAmount }
+          }
+        }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Buyer", email="buyer@example.com")
+        self.pen = Product.objects.create(name="Pen", price=Decimal("1.50"), stock=5)
+        self.pad = Product.objects.create(name="Pad", price=Decimal("4.00"), stock=2)
+
+    def execute(self, product_ids=None, items=None):
+        response = self.client.post(
+            '/graphql',
+            {'query': self.MUTATION, 'variables': {
+                'customerId': self.customer.pk, 'productIds': product_ids, 'items': items,
+            }},
+            content_type='application/json',
+        )
+        return response.json()
+
+    def test_quantities_reserve_stock_and_price_the_order(self):
+        result = self.execute(
+            product_ids=[self.pen.pk, self.pen.pk],
+            items=[{'productId': self.pad.pk, 'quantity': 2}],
+        )
+        _, order_id = from_global_id(result['data']['createOrder']['order']['id'])
+        order = Order.objects.get(pk=order_id)
+        self.assertEqual(order.total_amount, Decimal("11.00"))
+        self.assertEqual(
+            dict(OrderItem.objects.filter(order=order).values_list('product_id', 'quantity')),
+            {self.pen.pk: 2, self.pad.pk: 2},
+        )
+        self.pen.refresh_from_db()
+        self.pad.refresh_from_db()
+        self.assertEqual((self.pen.stock, self.pad.stock), (3, 0))
+        self.assertEqual(DailyProductSalesRollup.objects.filter(product=self.pad).get().order_count, 1)
+
+    def test_quantity_defaults_to_one_and_may_not_be_null(self):
+        result = self.execute(items=[{'productId': self.pen.pk}])
+        self.assertEqual(Decimal(result['data']['createOrder']['order']['totalAmount']), Decimal('1.50'))
+        result = self.execute(items=[{'productId': self.pad.pk, 'quantity': None}])
+        self.assertIn('quantity', result['errors'][0]['message'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_oversell_rolls_back_the_whole_order(self):
+        result = self.execute(items=[
+            {'productId': self.pen.pk, 'quantity': 1},
+            {'productId': self.pad.pk, 'quantity': 3},
+        ])
+        self.assertEqual(
+            result['errors'][0]['message'], f"Insufficient stock for product(s): {self.pad.pk}."
+        )
+        self.pen.refresh_from_db()
+        self.assertEqual(self.pen.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_invalid_product_is_rejected(self):
+        result = self.execute(product_ids=[self.pen.pk, 999])
+        self.assertEqual(result['errors'][0]['message'], "Invalid product ID(s).")
+
+    def test_query_count_does_not_grow_with_products(self):
+        products = [
+            Product.objects.create(name=f"Item {i}", price=Decimal("1.00"), stock=10)
+            for i in range(20)
+        ]
+        # Create today's rollup rows so both orders below only update them.
+        self.execute(product_ids=[self.pen.pk])
+        with CaptureQueriesContext(connection) as few:
+            self.execute(product_ids=[products[0].pk])
+        with CaptureQueriesContext(connection) as many:
+            self.execute(product_ids=[p.pk for p in products[1:]])
+        self.assertEqual(len(many.captured_queries), len(few.captured_queries))
+
+
+class UpdateLowStockProductsTestCase(TestCase):
+    """Test cases for the set-based UpdateLowStockProducts mutation"""
+
+    MUTATION = """
+        mutation($threshold: Int, $increment: Int, $targets: [RestockTargetInput!]) {
+          updateLowStockProducts(threshold: $threshold, increment: $increment, targets: $targets) {
+            updatedProducts { name stock }
+            message
+          }
+        }
+    """
+
+    def setUp(self):
+        self.low = Product.objects.create(name="Low", price=Decimal("1.00"), stock=2)
+        self.empty = Product.objects.create(name="Empty", price=Decimal("1.00"), stock=0)
+        self.full = Product.objects.create(name="Full", price=Decimal("1.00"), stock=50)
+
+    def execute(self, **variables):
+        response = self.client.post(
+            '/graphql', {'query': self.MUTATION, 'variables': variables},
+            content_type='application/json',
+        )
+        return response.json()['data']['updateLowStockProducts']
+
+    def test_restocks_low_products_with_defaults(self):
+        result = self.execute()
+        self.assertEqual(
+            sorted((p['name'], p['stock']) for p in result['updatedProducts']),
+            [("Empty", 10), ("Low", 12)],
+        )
+        self.assertEqual(result['message'], "Successfully updated 2 low-stock products.")
+        self.full.refresh_from_db()
+        self.assertEqual(self.full.stock, 50)
+
+    def test_threshold_increment_and_targets(self):
+        result = self.execute(
+            threshold=5, increment=3, targets=[{'productId': self.empty.pk, 'level': 40}]
+        )
+        self.assertEqual(
+            sorted((p['name'], p['stock']) for p in result['updatedProducts']),
+            [("Empty", 40), ("Low", 5)],
+        )
+
+    def test_restock_is_one_statement(self):
+        Product.objects.bulk_create(
+            Product(name=f"Low {i}", price=Decimal("1.00"), stock=1) for i in range(50)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            products = inventory.restock(10, 10)
+        self.assertEqual(len(products), 52)
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+    def test_restock_without_returning(self):
+        with mock.patch('crm.inventory.supports_update_returning', return_value=False):
+            products = inventory.restock(10, 10, {self.low.pk: 30})
+        self.assertEqual(sorted((p.name, p.stock) for p in products), [("Empty", 10), ("Low", 30)])
+
+
+class ExportViewTestCase(TestCase):
+    """Test cases for the streaming /export endpoint"""
+
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.pen = Product.objects.create(name="Pen", price=Decimal("1.50"), stock=5)
+        self.pad = Product.objects.create(name="Pad", price=Decimal("4.00"), stock=5)
+        self.order = Order.objects.create(customer=self.alice, total_amount=Decimal("5.50"))
+        self.order.products.add(self.pen, self.pad)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_ndjson_with_filters(self):
+        response = self.client.get('/export/customers', {'name': 'ali'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.lines(response)]
+        self.assertEqual([row['email'] for row in rows], ["alice@example.com"])
+
+    def test_orders_csv_includes_items_once(self):
+        response = self.client.get('/export/orders', {'format': 'csv', 'product_name': 'p'})
+        lines = self.lines(response)
+        self.assertEqual(lines[0], "id,customer_id,order_date,total_amount,items")
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].endswith(f"5.50,{self.pen.pk}:1;{self.pad.pk}:1"))
+
+    def test_order_items_are_fetched_per_chunk(self):
+        for i in range(24):
+            Order.objects.create(customer=self.bob, total_amount=Decimal("1.00"))
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(export.export('orders', Order.objects.all(), 'ndjson', size=10))
+        self.assertEqual(len(rows), 25)
+        # One streaming query for the orders plus one items query per chunk.
+        self.assertEqual(len(queries.captured_queries), 1 + 3)
+
+    def test_requires_staff_user_or_token(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/export/customers').status_code, 403)
+        self.client.force_login(User.objects.create_user('clerk'))
+        self.assertEqual(self.client.get('/export/customers').status_code, 403)
+        self.client.logout()
+        with self.settings(CRM_EXPORT_TOKEN='s3cret'):
+            self.assertEqual(
+                self.client.get('/export/customers', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403
+            )
+            self.lines(self.client.get('/export/customers', HTTP_AUTHORIZATION='Bearer s3cret'))
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/export/invoices').status_code, 404)
+        self.assertEqual(self.client.get('/export/orders', {'format': 'xml'}).status_code, 400)
+        response = self.client.get('/export/products', {'price_min': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportCrmDataTestCase(TestCase):
+    """Test cases for the import_crm_data management command"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_crm_data', stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_imports_all_kinds_and_reports_bad_rows(self):
+        customers = self.write('customers.csv', (
+            "name,email,phone\n"
+            "Alice,alice@example.com,123-456-7890\n"
+            "Bob,bob@example.com,12-34\n"
+            "Carol,carol@example.com,\n"
+        ))
+        products = self.write('products.ndjson', (
+            '{"name": "Pen", "price": "1.50", "stock": 10}\n'
+            '{"name": "Pad", "price": "4.00"}\n'
+            'not json\n'
+        ))
+        orders = self.write('orders.csv', (
+            "customer_email,order_date,items\n"
+            "alice@example.com,2020-01-02T10:00:00,Pen:2;Pad:1\n"
+            "carol@example.com,2021-06-01,Pad:1\n"
+            "bob@example.com,2021-06-01,Pad:1\n"
+        ))
+        out, err = self.run_import(customers=customers, products=products, orders=orders, batch_size=2)
+        self.assertIn("Imported 2 customers, 2 products and 2 orders; 3 invalid row(s) skipped.", out)
+        self.assertIn("rows/s", out)
+        self.assertIn("customers.csv:3: Invalid phone number format for bob@example.com.", err)
+        self.assertIn("Unknown customer bob@example.com.", err)
+
+        order = Order.objects.get(customer__email="alice@example.com")
+        self.assertEqual(order.total_amount, Decimal("7.00"))
+        self.assertEqual(timezone.localtime(order.order_date).year, 2020)
+        self.assertEqual(
+            dict(OrderItem.objects.filter(order=order).values_list('product__name', 'quantity')),
+            {"Pen": 2, "Pad": 1},
+        )
+        self.assertEqual(DailySalesRollup.objects.get(day=timezone.localdate(order.order_date)).order_count, 1)
+
+    def test_repeated_products_are_merged_into_one_item(self):
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        Product.objects.create(name="Laptop", price=Decimal("100.00"), stock=5)
+        orders = self.write('orders.csv', (
+            "customer_email,items\n"
+            "alice@example.com,Laptop:1;Laptop:2\n"
+        ))
+        out, err = self.run_import(orders=orders)
+        self.assertIn("1 orders", out)
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal("300.00"))
+        self.assertEqual(list(OrderItem.objects.values_list('quantity', flat=True)), [3])
+
+    def test_resumes_after_the_last_committed_chunk(self):
+        customers = self.write('customers.ndjson', "".join(
+            json.dumps({'name': f"C{i}", 'email': f"c{i}@example.com"}) + "\n" for i in range(5)
+        ))
+        original = Customer.objects.bulk_create
+        calls = []
+
+        def fail_second_chunk(rows, *args, **kwargs):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError("interrupted")
+            return original(rows, *args, **kwargs)
+
+        with mock.patch.object(Customer.objects, 'bulk_create', side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                self.run_import(customers=customers, batch_size=2)
+        self.assertEqual(Customer.objects.count(), 2)
+
+        out, _ = self.run_import(customers=customers, batch_size=2)
+        self.assertIn("customers: resuming after row 2.", out)
+        self.assertIn("Imported 3 customers", out)
+        self.assertEqual(Customer.objects.count(), 5)
+        self.assertEqual(ImportCheckpoint.objects.get().rows, 5)
+
+
+class GenerateFixtureDataTestCase(TestCase):
+    """Test cases for the generate_fixture_data management command"""
+
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_fixture_data', stdout=out, clear=True, **options)
+        return out.getvalue()
+
+    def snapshot(self):
+        return (
+            list(Customer.objects.order_by('email').values_list('email', 'name', 'phone', 'created_at')),
+            list(Product.objects.order_by('name').values_list('name', 'price', 'stock')),
+            list(Order.objects.order_by('order_date').values_list(
+                'customer__email', 'order_date', 'total_amount'
+            )),
+        )
+
+    def test_generates_requested_rows_deterministically(self):
+        out = self.generate(customers=30, products=20, orders=200, seed=7, batch_size=64)
+        self.assertIn("Generated 30 customers, 20 products and 200 orders.", out)
+        self.assertIn("rows/s", out)
+        first = self.snapshot()
+        self.assertEqual(len(first[2]), 200)
+
+        self.generate(customers=30, products=20, orders=200, seed=7, batch_size=64)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_distributions_and_bookkeeping(self):
+        self.generate(customers=50, products=30, orders=500, seed=1, years=2)
+        dates = Order.objects.aggregate(first=Min('order_date'), last=Max('order_date'))
+        self.assertGreater(dates['last'] - dates['first'], timedelta(days=365))
+        popularity = list(
+            OrderItem.objects.values('product').annotate(n=Count('id')).order_by('-n').values_list('n', flat=True)
+        )
+        self.assertGreater(popularity[0], 5 * popularity[-1])
+        self.assertGreater(OrderItem.objects.count(), Order.objects.count())
+        self.assertEqual(
+            DailySalesRollup.objects.aggregate(n=Sum('order_count'))['n'], Order.objects.count()
+        )
+        self.assertEqual(
+            self.client.post(
+                '/graphql', {'query': '{ allOrders(first: 0) { totalCount } }'},
+                content_type='application/json',
+            ).json()['data']['allOrders']['totalCount'],
+            500,
+        )
+
+    def test_customer_activity_is_computed_once_for_all_batches(self):
+        with mock.patch('crm.rollups.refresh_customers', wraps=rollups.refresh_customers) as refresh:
+            self.generate(customers=20, products=10, orders=150, seed=2, batch_size=40)
+        self.assertEqual(refresh.call_count, 1)
+        for customer in Customer.objects.annotate(n=Count('orders'), value=Sum('orders__total_amount')):
+            self.assertEqual(customer.order_count, customer.n)
+            self.assertEqual(customer.lifetime_value, customer.value or 0)
+
+    def test_adding_customers_after_deletes_keeps_emails_unique(self):
+        self.generate(customers=5, products=1, orders=0)
+        Customer.objects.order_by('id').first().delete()
+        call_command('generate_fixture_data', customers=5, products=0, orders=0, stdout=StringIO())
+        self.assertEqual(Customer.objects.count(), 9)
+
+
+class BenchmarkTestCase(TestCase):
+    """Test cases for the benchmark catalog and baseline comparison"""
+
+    def test_every_catalog_operation_runs(self):
+        call_command('generate_fixture_data', customers=20, products=20, orders=100, stdout=StringIO())
+        results = benchmarks.Runner(repeat=1).run()
+        self.assertEqual(set(results), {operation.name for operation in benchmarks.CATALOG})
+        self.assertLessEqual(results['orders_nested']['queries'], 3)
+        self.assertEqual(Customer.objects.filter(email__startswith='bench').count(), 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'100': {'page': {'p95_ms': 10.0, 'peak_kb': 100.0, 'queries': 2}}}
+        within = {'100': {'page': {'p95_ms': 14.0, 'peak_kb': 150.0, 'queries': 2}}}
+        self.assertEqual(benchmarks.compare(within, baseline, 0.5), [])
+        worse = {'100': {'page': {'p95_ms': 16.0, 'peak_kb': 100.0, 'queries': 3}}}
+        self.assertEqual(benchmarks.compare(worse, baseline, 0.5), [
+            "100/page: 3 queries, baseline 2",
+            "100/page: p95_ms 16.0, baseline 10.0",
+        ])
+
+    def test_missing_baseline_is_an_error(self):
+        missing = os.path.join(tempfile.gettempdir(), f'missing-{uuid.uuid4().hex}.json')
+        with self.assertRaisesMessage(CommandError, f'No baseline at {missing}'):
+            call_command('run_benchmarks', baseline=missing, stdout=StringIO())
+
+
+class InstrumentationTestCase(TestCase):
+    """Test cases for per-operation resolver and SQL tracing"""
+
+    QUERY = 'query Customers { allCustomers(first: 5) { edges { node { name orders { totalCount } } } } }'
+
+    def setUp(self):
+        for i in range(3):
+            Customer.objects.create(name=f"Traced {i}", email=f"traced{i}@example.com")
+
+    def post(self):
+        return self.client.post('/graphql', {'query': self.QUERY}, content_type='application/json').json()
+
+    @override_settings(CRM_INSTRUMENTATION_ENABLED=True, CRM_INSTRUMENTATION_EXTENSIONS=True)
+    def test_trace_is_logged_and_returned(self):
+        with self.assertLogs('crm.instrumentation', 'INFO') as logs:
+            result = self.post()
+        trace = result['extensions']['instrumentation']
+        self.assertEqual(trace['operation'], 'Customers')
+        self.assertEqual(trace['type'], 'query')
+        self.assertGreater(trace['sql']['count'], 0)
+        self.assertEqual(trace['fields']['Query.allCustomers']['calls'], 1)
+        self.assertEqual(trace['fields']['CustomerType.name']['calls'], 3)
+        self.assertEqual(json.loads(logs.records[0].getMessage()), trace)
+
+    def test_disabled_adds_nothing(self):
+        self.assertNotIn('instrumentation', self.post()['extensions'])
+        with mock.patch('crm.instrumentation.ResolverTimingMiddleware.resolve') as resolve:
+            self.post()
+        resolve.assert_not_called()
+
+    def test_repeated_statements_are_reported(self):
+        trace = instrumentation.OperationTrace('query', 'Repeat')
+        for i in range(3):
+            trace(lambda *args: None, 'SELECT * FROM crm_order WHERE customer_id = %s', [i], False, {})
+        trace(lambda *args: None, 'SELECT * FROM crm_product WHERE id IN (%s, %s)', [1, 2], False, {})
+        self.assertEqual(trace.duplicates(), [
+            {'fingerprint': 'SELECT * FROM crm_order WHERE customer_id = %s', 'count': 3},
+        ])
+        self.assertEqual(
+            instrumentation.fingerprint('SELECT 1 WHERE id IN (%s, %s,  %s)'), 'SELECT 1 WHERE id IN (...)'
+        )
+
+
+class MetricsTestCase(TestCase):
+    """Test cases for the file-backed metrics registry and /metrics endpoint"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings = override_settings(
+            CRM_METRICS_ENABLED=True, CRM_METRICS_DIR=self.directory.name, CRM_METRICS_FLUSH_INTERVAL=0,
+            CRM_METRICS_OPERATIONS=['Hello'],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_graphql_and_cache_metrics(self):
+        query = {'query': 'query Hello { hello }'}
+        for _ in range(2):
+            self.client.post('/graphql', query, content_type='application/json')
+        self.client.post('/graphql', {'query': '{ nope }'}, content_type='application/json')
+        text = self.scrape()
+        self.assertIn('crm_graphql_requests_total{operation="Hello",type="query"} 2', text)
+        self.assertIn('crm_graphql_errors_total{operation="anonymous",type="query"} 1', text)
+        self.assertIn(
+            'crm_graphql_request_duration_seconds_count{operation="Hello",type="query"} 2', text
+        )
+        self.assertIn('crm_cache_requests_total{cache="document",result="hit"} 1', text)
+        self.assertIn('crm_cache_hit_ratio{cache="document"} 0.333', text)
+
+    def test_values_of_other_processes_are_added(self):
+        metrics.inc('crm_celery_task_failures_total', task='crm.tasks.generate_crm_report')
+        with open(os.path.join(self.directory.name, 'metrics-other.json'), 'w') as f:
+            json.dump({
+                'counters': [['crm_celery_task_failures_total', [['task', 'crm.tasks.generate_crm_report']], 2]],
+                'histograms': [],
+            }, f)
+        self.assertIn(
+            'crm_celery_task_failures_total{task="crm.tasks.generate_crm_report"} 3', self.scrape()
+        )
+        self.assertTrue(os.path.exists(metrics.registry.path()))
+
+    def test_celery_task_metrics(self):
+        from crm.celery import debug_task
+
+        debug_task.apply()
+        text = self.scrape()
+        self.assertIn('crm_celery_tasks_total{state="SUCCESS",task="crm.celery.debug_task"} 1', text)
+        self.assertIn('crm_celery_task_duration_seconds_count{task="crm.celery.debug_task"} 1', text)
+
+    @override_settings(CRM_METRICS_FLUSH_INTERVAL=60)
+    def test_celery_task_metrics_are_written_when_the_task_ends(self):
+        from crm.celery import debug_task
+
+        metrics.registry.flush()
+        metrics.registry.last_flush = time.monotonic()
+        debug_task.apply()
+        with open(metrics.registry.path()) as f:
+            counters = json.load(f)['counters']
+        self.assertIn(
+            ['crm_celery_tasks_total', [['state', 'SUCCESS'], ['task', 'crm.celery.debug_task']], 1], counters
+        )
+
+    @override_settings(CRM_METRICS_FLUSH_INTERVAL=0.05)
+    def test_values_recorded_within_the_interval_are_written_by_a_timer(self):
+        metrics.inc('crm_celery_task_failures_total', task='first')
+        metrics.inc('crm_celery_task_failures_total', task='second')
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            with open(metrics.registry.path()) as f:
+                if len(json.load(f)['counters']) == 2:
+                    break
+            time.sleep(0.01)
+        else:
+            self.fail('the second value was never written')
+
+    def test_files_of_exited_processes_are_folded(self):
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+        snapshot = {
+            'counters': [['crm_celery_task_failures_total', [['task', 'crm.tasks.generate_crm_report']], 2]],
+            'histograms': [],
+        }
+        for pid in (exited.pid, exited.pid):
+            name = f'metrics-{socket.gethostname()}-{pid}-{uuid.uuid4().hex[:8]}.json'
+            with open(os.path.join(self.directory.name, name), 'w') as f:
+                json.dump(snapshot, f)
+        for _ in range(2):
+            self.assertIn(
+                'crm_celery_task_failures_total{task="crm.tasks.generate_crm_report"} 4', self.scrape()
+            )
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory.name) if name.startswith('metrics-')),
+            [metrics.EXITED_FILE],
+        )
+
+    def test_unknown_operation_names_share_a_label(self):
+        for name in ('Spam1', 'Spam2'):
+            self.client.post(
+                '/graphql', {'query': f'query {name} {{ hello }}'}, content_type='application/json'
+            )
+        self.assertIn('crm_graphql_requests_total{operation="other",type="query"} 2', self.scrape())
+
+
+class SlowQueryTestCase(TestCase):
+    """Test cases for the slow-query log and summarize_slow_queries"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings = override_settings(
+            CRM_SLOW_QUERY_ENABLED=True,
+            CRM_SLOW_QUERY_THRESHOLD_MS=0,
+            CRM_SLOW_QUERY_LOG=os.path.join(self.directory.name, 'slow.jsonl'),
+            CRM_SLOW_QUERY_CAPTURE_PARAMS=True,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.close_handlers)
+        Customer.objects.create(name='Ada Lovelace', email='ada@example.com')
+
+    def close_handlers(self):
+        for handler in list(slow_queries.logger.handlers):
+            slow_queries.logger.removeHandler(handler)
+            handler.close()
+
+    def test_filter_statements_are_logged_with_origin_and_plan(self):
+        query = '{ allCustomers(name: "ada") { edges { node { name } } } }'
+        with connection.execute_wrapper(slow_queries.recorder):
+            response = self.client.post(
+                '/graphql', {'query': query, 'operationName': None}, content_type='application/json'
+            )
+        self.assertNotIn('errors', response.json())
+        entries = [
+            entry for entry in slow_queries.read_entries() if '"crm_customer"' in entry['sql']
+        ]
+        self.assertTrue(entries)
+        entry = entries[-1]
+        self.assertEqual(entry['operation'], 'anonymous')
+        self.assertEqual(entry['field'], 'Query.allCustomers')
+        self.assertIn('%ada%', entry['params'])
+        self.assertTrue(entry['plan'])
+        self.assertNotIn('EXPLAIN failed', entry['plan'])
+
+    @override_settings(CRM_SLOW_QUERY_CAPTURE_PARAMS=False)
+    def test_params_are_left_out_unless_captured(self):
+        with connection.execute_wrapper(slow_queries.recorder):
+            list(Customer.objects.filter(name__icontains='ada'))
+        entries = list(slow_queries.read_entries())
+        self.assertTrue(entries)
+        self.assertEqual({entry['params'] for entry in entries}, {None})
+
+    @override_settings(CRM_SLOW_QUERY_LOG=None)
+    def test_log_path_is_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            slow_queries.install(connection=mock.Mock(execute_wrappers=[]))
+        with self.assertRaisesMessage(CommandError, 'CRM_SLOW_QUERY_LOG'):
+            call_command('summarize_slow_queries', stdout=StringIO())
+
+    def test_statements_under_threshold_are_skipped(self):
+        with override_settings(CRM_SLOW_QUERY_THRESHOLD_MS=10_000):
+            with connection.execute_wrapper(slow_queries.recorder):
+                list(Customer.objects.all())
+        self.assertEqual(list(slow_queries.read_entries()), [])
+
+    def test_summarize_groups_by_statement_shape(self):
+        with connection.execute_wrapper(slow_queries.recorder):
+            for name in ('ada', 'grace', 'alan'):
+                list(Customer.objects.filter(name__icontains=name))
+        out = StringIO()
+        call_command('summarize_slow_queries', top=1, stdout=out)
+        output = out.getvalue()
+        self.assertIn('3 slow statement(s) in 1 distinct shape(s).', output)
+        self.assertIn('#1 count=3', output)
+        self.assertIn('plan:', output)
+
+    def test_summarize_without_entries(self):
+        out = StringIO()
+        call_command('summarize_slow_queries', stdout=out)
+        self.assertIn('No slow queries recorded', out.getvalue())
+
+
+class FilterIndexTestCase(TestCase):
+    """Test that the range, equality and sort paths of the filters use an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_fixture_data', customers=500, products=200, orders=3000, seed=3, clear=True,
+            stdout=StringIO(),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.now = timezone.now()
+
+    def assertUsesIndex(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotIn('Seq Scan', plan, plan)
+        else:
+            plan = queryset.explain()
+            for line in plan.splitlines():
+                if 'SCAN' in line and 'USING' not in line:
+                    self.fail(f'Full scan in plan:\n{plan}')
+            self.assertNotIn('TEMP B-TREE', plan, plan)
+
+    def filtered(self, filterset_class, model, **data):
+        filterset = filterset_class(data=data, queryset=model.objects.all())
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        return filterset.qs
+
+    def test_customer_filters(self):
+        last_week = (self.now - timedelta(days=7)).date().isoformat()
+        self.assertUsesIndex(self.filtered(CustomerFilter, Customer, created_at_after=last_week))
+        self.assertUsesIndex(Customer.objects.order_by('-created_at', '-id')[:50])
+        self.assertUsesIndex(self.filtered(CustomerFilter, Customer, lifetime_value_min='5000'))
+        self.assertUsesIndex(self.filtered(CustomerFilter, Customer, last_order_at_before='2000-01-01'))
+        keyset = Keyset(Customer, 'desc', 'last_order_at')
+        self.assertUsesIndex(Customer.objects.order_by(*keyset.ordering())[:50])
+
+    def test_product_filters(self):
+        self.assertUsesIndex(self.filtered(ProductFilter, Product, price_min='990', price_max='1000'))
+        self.assertUsesIndex(self.filtered(ProductFilter, Product, stock_min='95', stock_max='100'))
+        self.assertUsesIndex(self.filtered(ProductFilter, Product, low_stock=True).order_by('id')[:50])
+
+    def test_order_filters(self):
+        yesterday = (self.now - timedelta(days=1)).date().isoformat()
+        self.assertUsesIndex(self.filtered(OrderFilter, Order, order_date_after=yesterday))
+        self.assertUsesIndex(self.filtered(OrderFilter, Order, total_amount_min='5000'))
+        self.assertUsesIndex(self.filtered(OrderFilter, Order, product_id=1))
+        self.assertUsesIndex(Order.objects.order_by('order_date', 'id')[:50])
+        customer = Customer.objects.first()
+        self.assertUsesIndex(customer.orders.filter(order_date__gte=self.now - timedelta(days=365)))
+
+    def test_inactive_customer_lookup(self):
+        one_year_ago = self.now - timedelta(days=365)
+        recent = Order.objects.filter(order_date__gte=one_year_ago).values('customer_id')
+        self.assertUsesIndex(recent)
+        self.assertUsesIndex(
+            Order.objects.filter(customer_id__in=[1, 2, 3], order_date__gte=one_year_ago)
+        )
+
+
+class SearchTestCase(TestCase):
+    """Test cases for the search argument and its full-text index"""
+
+    def setUp(self):
+        self.ada = Customer.objects.create(name="Ada Lovelace", email="ada@example.com")
+        self.adam = Customer.objects.create(name="Adam Smith", email="smith@example.com")
+        self.grace = Customer.objects.create(name="Grace Hopper", email="grace@navy.example.com")
+        self.cable = Product.objects.create(name="USB Cable", price=Decimal('9.99'), stock=5)
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=5)
+
+    def search_customers(self, text):
+        query = '{ allCustomers(search: %s) { totalCount edges { node { name } } } }' % json.dumps(text)
+        result = self.client.post('/graphql', {'query': query}, content_type='application/json').json()
+        self.assertNotIn('errors', result)
+        return [edge['node']['name'] for edge in result['data']['allCustomers']['edges']]
+
+    def test_sqlite_uses_the_fts_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 is SQLite only')
+        self.assertEqual(search.backend(Customer), 'fts5')
+        plan = search.search(Customer.objects.all(), 'ada').explain()
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
+
+    def test_prefix_and_ranking(self):
+        # Ada matches in both name and email, Adam only in name.
+        self.assertEqual(self.search_customers('ada'), ['Ada Lovelace', 'Adam Smith'])
+        self.assertEqual(self.search_customers('lovelace ad'), ['Ada Lovelace'])
+        self.assertEqual(self.search_customers('navy'), ['Grace Hopper'])
+        self.assertEqual(set(self.search_customers('(ada* "')), {'Ada Lovelace', 'Adam Smith'})
+        self.assertEqual(self.search_customers('nobody'), [])
+
+    def test_index_follows_saves_bulk_creates_and_deletes(self):
+        self.grace.name = "Grace Brewster"
+        self.grace.save()
+        self.assertEqual(self.search_customers('brewster'), ['Grace Brewster'])
+        self.assertEqual(self.search_customers('hopper'), [])
+
+        Customer.objects.bulk_create([Customer(name="Alan Turing", email="alan@example.com")])
+        self.assertEqual(self.search_customers('turing'), ['Alan Turing'])
+        Customer.objects.filter(email="alan@example.com").update(name="Alan M. Turing")
+        self.assertEqual(self.search_customers('alan m'), ['Alan M. Turing'])
+
+        self.ada.delete()
+        self.assertEqual(self.search_customers('lovelace'), [])
+
+    def test_product_and_order_search(self):
+        self.assertEqual(
+            list(search.search(Product.objects.all(), 'cab').values_list('name', flat=True)),
+            ['USB Cable'],
+        )
+        first = Order.objects.create(customer=self.ada, total_amount=Decimal('9.99'))
+        first.products.add(self.cable)
+        second = Order.objects.create(customer=self.grace, total_amount=Decimal('999.99'))
+        second.products.add(self.laptop)
+
+        query = '{ allOrders(search: "%s") { totalCount edges { node { id } } } }'
+        for text, expected in (('lovelace', [first]), ('lapt', [second]), ('usb', [first]), ('x', [])):
+            result = self.client.post(
+                '/graphql', {'query': query % text}, content_type='application/json'
+            ).json()
+            ids = [int(from_global_id(edge['node']['id'])[1]) for edge in result['data']['allOrders']['edges']]
+            self.assertEqual(ids, [order.pk for order in expected], text)
+
+
+class PhoneFilterTestCase(TestCase):
+    """Test cases for the normalized phone column and the phone filters"""
+
+    def setUp(self):
+        self.dashed = Customer.objects.create(name="Dashed", email="dashed@example.com", phone="555-123-4567")
+        self.plus = Customer.objects.create(name="Plus", email="plus@example.com", phone="+15551239999")
+        self.other = Customer.objects.create(name="Other", email="other@example.com", phone="4155550000")
+        Customer.objects.create(name="None", email="none@example.com")
+
+    def filter_names(self, **arguments):
+        args = ', '.join(f'{name}: {json.dumps(value)}' for name, value in arguments.items())
+        query = f'{{ allCustomers({args}) {{ edges {{ node {{ name }} }} }} }}'
+        result = self.client.post('/graphql', {'query': query}, content_type='application/json').json()
+        self.assertNotIn('errors', result)
+        return sorted(edge['node']['name'] for edge in result['data']['allCustomers']['edges'])
+
+    def test_normalize_phone(self):
+        self.assertEqual(normalize_phone('555-123-4567'), '15551234567')
+        self.assertEqual(normalize_phone('+15551234567'), '15551234567')
+        self.assertEqual(normalize_phone(' +44 20 7946 0000'), '442079460000')
+        self.assertIsNone(normalize_phone(''))
+        self.assertIsNone(normalize_phone('n/a'))
+        self.assertEqual(self.dashed.phone_digits, '15551234567')
+
+    def test_prefix_range(self):
+        self.assertEqual(digits_prefix_range('1555'), ('1555', '1556'))
+        self.assertEqual(digits_prefix_range('1599'), ('1599', '16'))
+        self.assertEqual(digits_prefix_range('999'), ('999', None))
+
+    def test_pattern_matches_every_stored_format(self):
+        self.assertEqual(self.filter_names(phonePattern='555-123'), ['Dashed', 'Plus'])
+        self.assertEqual(self.filter_names(phonePattern='+1555'), ['Dashed', 'Plus'])
+        self.assertEqual(self.filter_names(phonePattern='+1'), ['Dashed', 'Other', 'Plus'])
+        self.assertEqual(self.filter_names(phonePattern='+19'), [])
+        self.assertEqual(self.filter_names(phonePattern='-'), [])
+
+    def test_exact_phone(self):
+        self.assertEqual(self.filter_names(phone='+1 (555) 123-4567'), ['Dashed'])
+        self.assertEqual(self.filter_names(phone='5551239999'), ['Plus'])
+        self.assertEqual(self.filter_names(phone='555123'), [])
+
+    def test_saves_and_bulk_creates_keep_digits(self):
+        self.other.phone = '+1 212 555 0101'
+        self.other.save(update_fields=['phone'])
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.phone_digits, '12125550101')
+        Customer.objects.bulk_create([Customer(name="Bulk", email="bulk@example.com", phone="212-555-0199")])
+        self.assertEqual(self.filter_names(phonePattern='212555'), ['Bulk', 'Other'])
+
+    def test_updates_keep_digits(self):
+        Customer.objects.filter(pk=self.other.pk).update(phone='+44 20 7946 0000')
+        self.assertEqual(Customer.objects.get(pk=self.other.pk).phone_digits, '442079460000')
+        Customer.objects.filter(pk=self.other.pk).update(phone=None)
+        self.assertIsNone(Customer.objects.get(pk=self.other.pk).phone_digits)
+        with self.assertRaises(TypeError):
+            Customer.objects.update(phone=F('email'))
+
+        self.dashed.phone = '212-555-0199'
+        Customer.objects.bulk_update([self.dashed], ['phone'])
+        self.assertEqual(self.filter_names(phonePattern='212555'), ['Dashed'])
+
+    def test_lookup_uses_index(self):
+        filterset = CustomerFilter(data={'phone_pattern': '+1555'}, queryset=Customer.objects.all())
+        plan = filterset.qs.explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn('crm_customer_phone_idx', plan)
+
+    def test_backfill(self):
+        Customer.objects.update(phone_digits=None)
+        out = StringIO()
+        call_command('backfill_phone_digits', batch_size=2, stdout=out)
+        self.assertIn('Backfilled 3 customer phone number(s).', out.getvalue())
+        self.assertEqual(Customer.objects.get(pk=self.plus.pk).phone_digits, '15551239999')
+
+        with override_settings(CRM_PHONE_COUNTRY_CODE='44'):
+            out = StringIO()
+            call_command('backfill_phone_digits', stdout=out)
+            self.assertIn('Backfilled 0 customer', out.getvalue())
+            call_command('backfill_phone_digits', all=True, stdout=out)
+            self.assertIn('Backfilled 2 customer', out.getvalue())
+
+
+class CustomerActivityTestCase(TestCase):
+    """Test cases for the maintained order_count, last_order_at and lifetime_value"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.ada = Customer.objects.create(name="Ada", email="ada@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.idle = Customer.objects.create(name="Idle", email="idle@example.com")
+
+    def order(self, customer, amount, days_ago=0):
+        order = Order.objects.create(customer=customer, total_amount=Decimal(amount))
+        if days_ago:
+            order.order_date = self.now - timedelta(days=days_ago)
+            order.save()
+        return order
+
+    def activity(self, customer):
+        customer.refresh_from_db()
+        return customer.order_count, customer.last_order_at, customer.lifetime_value
+
+    def query(self, arguments, fields='name'):
+        query = f'{{ allCustomers({arguments}) {{ edges {{ cursor node {{ {fields} }} }} }} }}'
+        result = self.client.post('/graphql', {'query': query}, content_type='application/json').json()
+        self.assertNotIn('errors', result)
+        return result['data']['allCustomers']['edges']
+
+    def test_order_writes_update_activity(self):
+        recent = self.order(self.ada, '10.00')
+        old = self.order(self.ada, '5.50', days_ago=400)
+        self.assertEqual(self.activity(self.ada), (2, recent.order_date, Decimal('15.50')))
+
+        recent.total_amount = Decimal('12.00')
+        recent.save()
+        self.assertEqual(self.activity(self.ada), (2, recent.order_date, Decimal('17.50')))
+
+        recent.customer = self.bob
+        recent.save()
+        self.assertEqual(self.activity(self.ada), (1, old.order_date, Decimal('5.50')))
+        self.assertEqual(self.activity(self.bob), (1, recent.order_date, Decimal('12.00')))
+
+        old.delete()
+        self.assertEqual(self.activity(self.ada), (0, None, Decimal('0')))
+
+    def test_bulk_created_orders_refresh_activity(self):
+        from crm.bulk import bulk_create_orders
+
+        day = self.now - timedelta(days=3)
+        bulk_create_orders([
+            (Order(customer=self.ada, order_date=day, total_amount=Decimal('3.00')), []),
+            (Order(customer=self.ada, order_date=day - timedelta(days=1), total_amount=Decimal('4.00')), []),
+        ])
+        self.assertEqual(self.activity(self.ada), (2, day, Decimal('7.00')))
+
+    def test_reconcile(self):
+        self.order(self.ada, '10.00')
+        Customer.objects.filter(pk=self.ada.pk).update(order_count=7, lifetime_value=0)
+        Customer.objects.filter(pk=self.idle.pk).update(last_order_at=self.now)
+
+        out = StringIO()
+        call_command('reconcile_customer_activity', dry_run=True, stdout=out)
+        self.assertIn('Checked 3 customer(s); 2 out of date would be fixed.', out.getvalue())
+        self.assertEqual(self.activity(self.ada)[0], 7)
+
+        call_command('reconcile_customer_activity', batch_size=1, stdout=out)
+        self.assertIn('2 out of date fixed.', out.getvalue())
+        self.assertEqual(self.activity(self.ada)[::2], (1, Decimal('10.00')))
+        self.assertEqual(self.activity(self.idle), (0, None, Decimal('0')))
+
+        out = StringIO()
+        call_command('reconcile_customer_activity', stdout=out)
+        self.assertIn('0 out of date fixed.', out.getvalue())
+
+    def test_filters(self):
+        self.order(self.ada, '100.00')
+        self.order(self.bob, '20.00', days_ago=400)
+        names = lambda edges: sorted(edge['node']['name'] for edge in edges)
+        self.assertEqual(names(self.query('lifetimeValueMin: "50"')), ['Ada'])
+        self.assertEqual(names(self.query('orderCountMax: "0"')), ['Idle'])
+        since = (self.now - timedelta(days=30)).date().isoformat()
+        self.assertEqual(names(self.query(f'lastOrderAtAfter: "{since}"')), ['Ada'])
+        self.assertEqual(names(self.query(f'lastOrderAtBefore: "{since}"')), ['Bob'])
+
+    def test_sort_by_activity_pages_through_nulls(self):
+        self.order(self.ada, '100.00')
+        self.order(self.bob, '20.00', days_ago=400)
+        for sort, expected in (('ASC', ['Idle', 'Bob', 'Ada']), ('DESC', ['Ada', 'Bob', 'Idle'])):
+            seen = []
+            after = ''
+            while True:
+                edges = self.query(f'sortBy: LAST_ORDER_AT, sort: {sort}, first: 1{after}')
+                if not edges:
+                    break
+                seen.append(edges[0]['node']['name'])
+                after = f', after: "{edges[0]["cursor"]}"'
+            self.assertEqual(seen, expected, sort)
+
+            edges = self.query(f'sortBy: LIFETIME_VALUE, sort: {sort}, first: 3')
+            self.assertEqual([edge['node']['name'] for edge in edges], expected, sort)
+
+    def test_range_filters_reach_the_filterset(self):
+        Product.objects.create(name="Cheap", price=Decimal('1.00'), stock=1)
+        Product.objects.create(name="Dear", price=Decimal('900.00'), stock=50)
+        query = '{ allProducts(priceMin: "100", stockMax: "60") { edges { node { name } } } }'
+        result = self.client.post('/graphql', {'query': query}, content_type='application/json').json()
+        self.assertEqual(result['data']['allProducts']['edges'], [{'node': {'name': 'Dear'}}])
+
+
+class CleanupBatchesTestCase(TestCase):
+    """Test cases for the batched, resumable cleanup_inactive_customers command"""
+
+    def setUp(self):
+        old = timezone.now() - timedelta(days=500)
+        for i in range(5):
+            customer = Customer.objects.create(name=f"Gone {i}", email=f"gone{i}@example.com")
+            Customer.objects.filter(pk=customer.pk).update(created_at=old)
+            order = Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+            order.order_date = old
+            order.save()
+        self.active = Customer.objects.create(name="Active", email="active@example.com")
+        Customer.objects.filter(pk=self.active.pk).update(created_at=old)
+        Order.objects.create(customer=self.active, total_amount=Decimal('5.00'))
+
+    def cleanup(self, **options):
+        out = StringIO()
+        call_command('cleanup_inactive_customers', stdout=out, **options)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        out = self.cleanup(dry_run=True, batch_size=2)
+        self.assertIn('5 inactive customer(s) would be deleted.', out)
+        self.assertEqual(Customer.objects.count(), 6)
+        self.assertFalse(CleanupCheckpoint.objects.exists())
+
+    def test_batches_and_progress(self):
+        with CaptureQueriesContext(connection):
+            out = self.cleanup(batch_size=2)
+        self.assertEqual(out.count('customers/s'), 3)
+        self.assertIn('5 inactive customer(s) deleted.', out)
+        self.assertEqual(list(Customer.objects.values_list('name', flat=True)), ['Active'])
+        self.assertFalse(Order.objects.filter(customer__name__startswith='Gone').exists())
+        self.assertFalse(CleanupCheckpoint.objects.exists())
+
+    def test_stale_activity_never_deletes_active_customers(self):
+        Customer.objects.filter(pk=self.active.pk).update(last_order_at=timezone.now() - timedelta(days=400))
+        self.assertIn('5 inactive customer(s) deleted.', self.cleanup())
+        self.assertTrue(Customer.objects.filter(pk=self.active.pk).exists())
+
+    def test_max_runtime_stops_and_resumes(self):
+        with mock.patch('time.monotonic', side_effect=[0.0, 10.0]):
+            out = self.cleanup(batch_size=2, max_runtime=5)
+        self.assertIn('run again to resume', out)
+        self.assertIn('2 inactive customer(s) deleted.', out)
+        checkpoint = CleanupCheckpoint.objects.get()
+        self.assertEqual(checkpoint.deleted, 2)
+
+        out = self.cleanup(batch_size=2)
+        self.assertIn(f'Resuming after customer {checkpoint.last_customer_id}.', out)
+        self.assertIn('3 inactive customer(s) deleted.', out)
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertFalse(CleanupCheckpoint.objects.exists())
+
+    def add_inactive_customers(self, count, orders_each):
+        old = timezone.now() - timedelta(days=500)
+        products = [Product.objects.create(name=f"Part {i}", price=1, stock=1) for i in range(2)]
+        for i in range(count):
+            customer = Customer.objects.create(name=f"Bulk {i}", email=f"bulk{uuid.uuid4().hex}@example.com")
+            Customer.objects.filter(pk=customer.pk).update(created_at=old)
+            for days in range(orders_each):
+                order = Order.objects.create(customer=customer, total_amount=Decimal('2.00'))
+                order.order_date = old - timedelta(days=days)
+                order.save()
+                order.products.add(*products)
+
+    def test_batch_deletes_orders_without_per_row_queries(self):
+        # Seed the counters so the test sees them adjusted.
+        table_count(Customer)
+        table_count(Order)
+        self.add_inactive_customers(5, 2)
+        with CaptureQueriesContext(connection) as small:
+            self.cleanup()
+        self.add_inactive_customers(10, 50)
+        with CaptureQueriesContext(connection) as large:
+            self.cleanup()
+
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(table_count(Customer), 1)
+        self.assertEqual(table_count(Order), 1)
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(DailySalesRollup.objects.filter(order_count__gt=0).count(), 1)
+        self.assertFalse(DailyProductSalesRollup.objects.filter(order_count__gt=0).exists())
+        self.assertFalse(DailyCustomerSalesRollup.objects.exclude(customer=self.active).exists())
+
+
+class OrderArchiveTestCase(TestCase):
+    """Test cases for moving old orders to the archive and reading them back"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Archie", email="archie@example.com")
+        self.cable = Product.objects.create(name="Cable", price=Decimal('5.00'), stock=50)
+        old = timezone.now() - timedelta(days=500)
+        self.old_orders = []
+        for i in range(3):
+            order = Order.objects.create(customer=self.customer, total_amount=i + 1)
+            order.order_date = old + timedelta(days=i)
+            order.save()
+            order.products.add(self.cable)
+            self.old_orders.append(order)
+        for i in range(2):
+            Order.objects.create(customer=self.customer, total_amount=10 + i)
+
+    def archive(self, **options):
+        out = StringIO()
+        call_command('archive_orders', stdout=out, **options)
+        return out.getvalue()
+
+    def execute(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/graphql', {'query': query}, content_type='application/json')
+        result = response.json()
+        self.assertNotIn('errors', result)
+        return result['data'], [q['sql'] for q in queries.captured_queries]
+
+    def amounts(self, data):
+        return [int(float(e['node']['totalAmount'])) for e in data['allOrders']['edges']]
+
+    def test_archive_moves_old_orders_and_items(self):
+        self.assertIn('3 order(s) placed before', self.archive(dry_run=True))
+        self.assertEqual(ArchivedOrder.objects.count(), 0)
+
+        self.assertIn('3 order(s) placed before', self.archive(batch_size=2))
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(
+            sorted(ArchivedOrder.objects.values_list('pk', flat=True)), [o.pk for o in self.old_orders]
+        )
+        self.assertEqual(ArchivedOrderItem.objects.count(), 3)
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[o.pk for o in self.old_orders]).exists())
+
+    def test_archiving_keeps_rollups_and_customer_activity(self):
+        rollup = list(DailySalesRollup.objects.order_by('day').values_list('day', 'order_count', 'revenue'))
+        self.archive()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.order_count, 5)
+        self.assertEqual(self.customer.lifetime_value, Decimal('27.00'))
+
+        out = StringIO()
+        call_command('reconcile_customer_activity', stdout=out)
+        self.assertIn('0 out of date fixed', out.getvalue())
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(
+            list(DailySalesRollup.objects.order_by('day').values_list('day', 'order_count', 'revenue')), rollup
+        )
+
+    def test_recent_range_reads_only_the_hot_table(self):
+        self.archive()
+        after = (timezone.localdate() - timedelta(days=90)).isoformat()
+        data, queries = self.execute(
+            'query { allOrders(orderDateAfter: "%s") { edges { node { totalAmount } } } }' % after
+        )
+        self.assertEqual(self.amounts(data), [10, 11])
+        self.assertEqual(len(queries), 1)
+
+    def test_full_history_merges_both_tables(self):
+        self.archive()
+        query = """
+            query { allOrders(first: 2 %s) {
+              totalCount
+              pageInfo { hasNextPage endCursor }
+              edges { node { totalAmount customer { name } products { edges { node { name } } } } }
+            } }
+        """
+        seen = []
+        after = ''
+        while True:
+            data, _ = self.execute(query % after)
+            seen.extend(self.amounts(data))
+            self.assertEqual(data['allOrders']['totalCount'], 5)
+            page_info = data['allOrders']['pageInfo']
+            if not page_info['hasNextPage']:
+                break
+            after = ', after: "%s"' % page_info['endCursor']
+        self.assertEqual(seen, [1, 2, 3, 10, 11])
+
+        data, _ = self.execute('query { allOrders(first: 3, sort: DESC) { edges { node { totalAmount } } } }')
+        self.assertEqual(self.amounts(data), [11, 10, 3])
+
+        data, _ = self.execute(
+            'query { allOrders(first: 1) { edges { node { customer { name } products { edges { node { name } } } } } } }'
+        )
+        node = data['allOrders']['edges'][0]['node']
+        self.assertEqual(node['customer']['name'], 'Archie')
+        self.assertEqual(node['products']['edges'], [{'node': {'name': 'Cable'}}])
+
+    def test_filters_apply_to_archived_orders(self):
+        self.archive()
+        data, _ = self.execute('query { allOrders(search: "cable") { edges { node { totalAmount } } } }')
+        self.assertEqual(self.amounts(data), [1, 2, 3])
+        data, _ = self.execute('query { allOrders(totalAmountMin: 2, totalAmountMax: 10) { edges { node { totalAmount } } } }')
+        self.assertEqual(self.amounts(data), [2, 3, 10])
+
+    def test_nested_orders_include_archived_orders(self):
+        self.archive()
+        data, queries = self.execute("""
+            query {
+              allCustomers(first: 5) { edges { node { orderCount orders(first: 10) {
+                totalCount edges { node { totalAmount } } } } } }
+              allProducts(first: 5) { edges { node { orders(first: 10) { totalCount edges { node {
+                totalAmount products(first: 5) { edges { node { name } } } } } } } } }
+            }
+        """)
+        customer = data['allCustomers']['edges'][0]['node']
+        self.assertEqual(customer['orderCount'], 5)
+        self.assertEqual(customer['orders']['totalCount'], 5)
+        product_orders = data['allProducts']['edges'][0]['node']['orders']
+        self.assertEqual(product_orders['totalCount'], 3)
+        self.assertEqual(product_orders['edges'][0]['node']['products']['edges'], [{'node': {'name': 'Cable'}}])
+        # customers, their orders (one query over both tables), products, their orders, order products.
+        self.assertEqual(len(queries), 5)
+
+        data, _ = self.execute("""
+            query { allCustomers { edges { node { orders(totalAmountMax: 5) { totalCount } } } } }
+        """)
+        self.assertEqual(data['allCustomers']['edges'][0]['node']['orders']['totalCount'], 3)
+
+    def test_filtered_order_stats_include_archived_orders(self):
+        self.archive()
+        data, queries = self.execute("""
+            query { orderStats(orderDateAfter: "2000-01-01") { count totalRevenue revenueByDay { orderCount } } }
+        """)
+        stats = data['orderStats']
+        self.assertEqual((stats['count'], stats['totalRevenue']), (5, '27.00'))
+        self.assertEqual(sum(day['orderCount'] for day in stats['revenueByDay']), 5)
+        self.assertEqual(len(queries), 2)
+
+    def test_export_includes_archived_orders(self):
+        self.archive()
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get('/export/orders')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['total_amount'] for row in rows], ['1.00', '2.00', '3.00', '10.00', '11.00'])
+        self.assertEqual(rows[0]['items'], [{'product_id': self.cable.pk, 'quantity': 1}])
+
+    def rollup_rows(self):
+        return (
+            list(DailySalesRollup.objects.filter(order_count__gt=0).order_by('day').values_list(
+                'day', 'order_count', 'revenue')),
+            list(DailyCustomerSalesRollup.objects.filter(order_count__gt=0).order_by('day', 'customer_id')
+                 .values_list('day', 'customer_id', 'order_count', 'revenue')),
+            list(DailyProductSalesRollup.objects.filter(order_count__gt=0).order_by('day', 'product_id')
+                 .values_list('day', 'product_id', 'order_count')),
+        )
+
+    def test_cleanup_of_archived_orders_keeps_rollups_exact(self):
+        # Same days as another customer's archived orders, so the rows are shared.
+        other = Customer.objects.create(name="Other", email="other@example.com")
+        for order in self.old_orders:
+            kept = Order.objects.create(customer=other, total_amount=7)
+            kept.order_date = order.order_date
+            kept.save()
+            kept.products.add(self.cable)
+        Order.objects.filter(customer=self.customer, order_date__gte=timezone.now() - timedelta(days=30)).delete()
+        Order.objects.create(customer=other, total_amount=1)
+        self.archive()
+        self.assertEqual(ArchivedOrder.objects.count(), 6)
+
+        call_command('cleanup_inactive_customers', stdout=StringIO())
+        self.assertFalse(Customer.objects.filter(pk=self.customer.pk).exists())
+        self.assertEqual(ArchivedOrder.objects.count(), 3)
+        incremental = self.rollup_rows()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(incremental, self.rollup_rows())
+        self.assertEqual(incremental[0][0][1:], (1, Decimal('7.00')))
+
+    def test_cleanup_sees_archived_orders(self):
+        with override_settings(CRM_ORDER_ARCHIVE_AGE_DAYS=30):
+            Order.objects.filter(pk=self.old_orders[0].pk).update(order_date=timezone.now() - timedelta(days=60))
+            self.archive()
+        self.assertEqual(Order.objects.count(), 2)
+        Order.objects.all().delete()
+        # Even with a stale activity column, the archived order keeps the customer.
+        Customer.objects.update(last_order_at=timezone.now() - timedelta(days=500))
+        call_command('cleanup_inactive_customers', stdout=StringIO())
+        self.assertTrue(Customer.objects.filter(pk=self.customer.pk).exists())
@@ -0,0 +1,29 @@
+import re
+
+from django.conf import settings
+
+# Accepted phone formats: 1234567890, +11234567890 and 123-456-7890.
+PHONE_REGEX = re.compile(r"^(\+1)?\d{10}$|^\d{3}-\d{3}-\d{4}$")
+
+
+def is_valid_phone(phone):
+    return bool(PHONE_REGEX.match(phone))
+
+
+def country_code():
+    return getattr(settings, 'CRM_PHONE_COUNTRY_CODE', '1')
+
+
+def normalize_phone(phone):
+    """Digits of ``phone`` in E.164 order: country code, then national number.
+
+    Numbers without a leading ``+`` are national and get
+    ``CRM_PHONE_COUNTRY_CODE``, so ``123-456-7890`` and ``+11234567890``
+    normalize alike. Returns None when there are no digits.
+    """
+    if not phone:
+        return None
+    digits = re.sub(r'\D', '', phone)
+    if not digits:
+        return None
+    return digits if phone.lstrip().startswith('+') else country_code() + digits
@@ -1,3 +1,256 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.http.response import HttpResponseBadRequest
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    execute,
+    get_operation_ast,
+    validate,
+    validate_schema,
+)
+
+from . import export, instrumentation, metrics, slow_queries
+from .complexity import query_cost_rule
+from .documents import parse_and_validate, resolve_persisted_query
+from .loaders import Loaders
+from .response_cache import ResponseCache, is_enabled as response_cache_enabled
+
+
+class CRMGraphQLView(GraphQLView):
+    """GraphQL endpoint for the CRM schema.
+
+    Every request gets its own set of DataLoaders. Parsed and validated
+    documents are cached by hash, clients may send automatic persisted
+    query hashes instead of query text, and each operation is checked
+    against the query cost budget before execution. Query results may be
+    served from the response cache (see ``crm.response_cache``), and executed
+    operations can be traced (see ``crm.instrumentation``) and their slow
+    statements logged (see ``crm.slow_queries``). Layers that want to
+    report back to the client add entries to ``request.graphql_extensions``,
+    which are returned as the response ``extensions``.
+    """
+
+    def get_context(self, request):
+        request.loaders = Loaders()
+        return request
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if instrumentation.is_enabled():
+            middleware = [*(middleware or ()), instrumentation.ResolverTimingMiddleware()]
+        if slow_queries.is_enabled():
+            middleware = [*(middleware or ()), slow_queries.OriginMiddleware()]
+        return middleware
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        try:
+            query = resolve_persisted_query(request, data, query)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            document, validation_errors = parse_and_validate(
+                schema, query, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS
+            )
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+        metrics.name_operation(request, operation_ast, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        # The cost depends on the variables, so it is checked on every request.
+        cost_errors = validate(
+            schema, document, [query_cost_rule(variables, request.graphql_extensions, operation_ast)]
+        )
+        if cost_errors:
+            return ExecutionResult(data=None, errors=cost_errors)
+
+        cache = None
+        if (
+            response_cache_enabled()
+            and operation_ast is not None
+            and operation_ast.operation == OperationType.QUERY
+        ):
+            cache = ResponseCache(schema, document, operation_ast, operation_name, variables)
+            data = cache.get()
+            request.graphql_extensions["responseCache"] = {"hit": data is not None}
+            metrics.record_cache("response", data is not None)
+            if data is not None:
+                return ExecutionResult(data=data)
+
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options["execution_context_class"] = self.execution_context_class
+
+            with instrumentation.trace_operation(
+                request, operation_ast, operation_name
+            ), slow_queries.graphql_origin(operation_ast, operation_name):
+                if (
+                    operation_ast is not None
+                    and operation_ast.operation == OperationType.MUTATION
+                    and (
+                        graphene_settings.ATOMIC_MUTATIONS is True
+                        or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                    )
+                ):
+                    with transaction.atomic():
+                        result = execute(schema, document, **execute_options)
+                        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                            transaction.set_rollback(True)
+                    return result
+
+                result = execute(schema, document, **execute_options)
+            if cache is not None and not result.errors:
+                cache.set(result.data)
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def get_response(self, request, data, show_graphiql=False):
+        request.graphql_extensions = {}
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        with metrics.track_graphql(request) as outcome:
+            execution_result = self.execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+            outcome["error"] = bool(execution_result and execution_result.errors)
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if not execution_result:
+            return None, status_code
+
+        response = {}
+        if execution_result.errors:
+            set_rollback()
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        if request.graphql_extensions:
+            response["extensions"] = request.graphql_extensions
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+
+def metrics_view(request):
+    """Serve the metrics of every CRM process in the Prometheus text format."""
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def may_export(request):
+    """Whether ``request`` comes from a staff user or carries ``CRM_EXPORT_TOKEN``.
+
+    The token is sent as ``Authorization: Bearer <token>``.
+    """
+    user = request.user
+    if user.is_authenticated and user.is_active and user.is_staff:
+        return True
+    token = getattr(settings, 'CRM_EXPORT_TOKEN', None)
+    if not token:
+        return False
+    sent = request.headers.get('Authorization', '')
+    return hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode())
+
+
+class CRMExportView(View):
+    """Stream a whole (optionally filtered) table as NDJSON or CSV.
+
+    ``GET /export/<resource>?format=csv&name=...`` takes the same filters as
+    the matching GraphQL connection, using the django-filter parameter names
+    (``created_at_after``, ``price_min``, ...). Rows are read in chunks of
+    ``CRM_EXPORT_CHUNK_SIZE`` so memory does not grow with the table.
+    Only staff users and holders of ``CRM_EXPORT_TOKEN`` may export.
+    """
+
+    http_method_names = ['get']
+
+    def get(self, request, resource):
+        if not may_export(request):
+            return JsonResponse({'errors': ["Exports need a staff user or the export token."]}, status=403)
+        if resource not in export.RESOURCES:
+            raise Http404(f"Unknown export resource {resource!r}.")
+        export_format = request.GET.get('format', 'ndjson')
+        if export_format not in export.FORMATS:
+            return JsonResponse({'errors': [f"Unsupported format {export_format!r}."]}, status=400)
+
+        model, filterset_class, _ = export.RESOURCES[resource]
+        data = request.GET.copy()
+        data.pop('format', None)
+        filterset = filterset_class(data=data, queryset=model.objects.all(), request=request)
+        if not filterset.is_valid():
+            return JsonResponse({'errors': filterset.errors}, status=400)
+
+        archived = None
+        if resource in export.ARCHIVES:
+            archive = export.ARCHIVES[resource]
+            archived = filterset_class(data=data, queryset=archive.objects.all(), request=request).qs
+
+        response = StreamingHttpResponse(
+            export.export(resource, filterset.qs, export_format, archived=archived),
+            content_type=export.FORMATS[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{export_format}"'
+        return response
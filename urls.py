@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
+from crm.views import CRMExportView, CRMGraphQLView, metrics_view
 from django.views.decorators.csrf import csrf_exempt
 from alx_backend_graphql.schema import schema
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True, schema=schema))),
+    path("export/<str:resource>", CRMExportView.as_view()),
+    path("metrics", metrics_view),
 ]